@@ -1,28 +1,27 @@
 from __future__ import print_function
-import yaml
-from rfidgeek import PyRFIDGeek, ISO14443A, ISO15693
+from pydlprfid2 import PyDlpRfid2, MultiProtocolScanner, ISO14443A, ISO15693
 
 # You might need to change this:
-COM_PORT_NAME = '/dev/tty.SLAB_USBtoUART'
+COM_PORT_NAME = '/dev/ttyACM0'
 
-reader = PyRFIDGeek(serial_port=COM_PORT_NAME, debug=True)
+reader = PyDlpRfid2(serial_port=COM_PORT_NAME)
 
 protocols = [ISO14443A, ISO15693]
 
-try:
-    while True:
-        tags = {protocol: set() for protocol in protocols}
+# Reader is initialized once, then only ISO control register is switched
+reader.set_protocol(ISO15693)
+scanner = MultiProtocolScanner(reader, protocols, dwell={ISO15693: 2, ISO14443A: 1})
 
-        for protocol in protocols:
-            reader.set_protocol(protocol)
-            for uid in reader.inventory():
-                tags[protocol].add(uid)
 
-        tags2 = ['{} ({})'.format(tag, protocol) for protocol in protocols for tag in tags[protocol]]
-        total_tags = len(tags[ISO14443A]) + len(tags[ISO15693])
+def show(tags):
+    tags2 = ['{} ({})'.format(entry.uid_hex, protocol)
+             for protocol in protocols for entry in tags[protocol]]
+    total_tags = len(tags[ISO14443A]) + len(tags[ISO15693])
+    print('Found %d tag(s): %s' % (total_tags, ', '.join(tags2)))
 
-        print('Found %d tag(s): %s' % (total_tags, ', '.join(tags2)))
 
+try:
+    scanner.run(show)
 finally:
     print('Bye!')
     reader.close()
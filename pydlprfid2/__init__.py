@@ -3,6 +3,22 @@ import getopt
 import serial
 import logging
 from .pydlprfid2 import PyDlpRfid2, ISO14443A, ISO14443B, ISO15693
+from .errors import StandardError, TagError, WriteInterrupted
+from .retry import RetryPolicy
+from .timeouts import TimeoutProfile
+from .tracing import Tracer
+from .tag import InventoryEntry, TagInfo, BlockData, BlockSecurity
+from .rf import RfConfig, RfTuner
+from .registry import TagRegistry, TagCapabilities
+from .password import SectorPasswordSession
+from .writebuffer import WriteBuffer
+from .provisioning import ProvisioningPipeline, ProvisionResult
+from .scanner import MultiProtocolScanner
+from .antenna import AntennaScheduler
+from .catalog import TagCatalog
+from .eventlog import EventLog
+from .sharedstate import TagStateTable, TagState
+from .discovery import discover, ReaderPool
 from .crc import CRC
 
 import pkg_resources  # part of setuptools
@@ -15,8 +31,10 @@ def usages():
     print("-h, --help               print this help")
     print("-v, --verbose            print more messages")
     print("-d, --devtty=filename    uart dev name path")
-    print("-p, --protocol=PROTOCOL  default ISO15693")
+    print("-s, --scan               list serial ports with a DLP-RFID2")
+    print("-p, --protocol=PROTOCOL  ISO15693 (default), ISO14443A or ISO14443B")
     print("-l, --listtag            list tag present")
+    print("-a, --afi=AFI            list only tags of family AFI (hex)")
     print("-u, --uid=UID            give UID to access")
     print("-i, --internal           enable internal antenna")
     print("-r, --read=OFFSET        read one block (hex)")
@@ -32,9 +50,9 @@ def usages():
 
 def main(argv):
     try:
-        opts, args = getopt.getopt(argv, "hd:p:lu:r:m:M:vgw:ti",
-                  ["help", "devtty=", "protocol=",
-                   "listtag", "uid=", "read=",
+        opts, args = getopt.getopt(argv, "hd:sp:la:u:r:m:M:vgw:ti",
+                  ["help", "devtty=", "scan", "protocol=",
+                   "listtag", "afi=", "uid=", "read=",
                    "verbose", "readmultiple=",
                    "writemultiple=", "test", "internal",
                    "getsysinfo", "writesingle="])
@@ -43,7 +61,9 @@ def main(argv):
         sys.exit(2)
 
     devtty = None
+    scan = False
     listtag = False
+    afi = None
     protocol=ISO15693
     uid = None
     blockoffset = None
@@ -61,6 +81,8 @@ def main(argv):
             sys.exit(0)
         elif opt in ["-d", "--devtty"]:
             devtty = arg
+        elif opt in ["-s", "--scan"]:
+            scan = True
         elif opt in ["-p", "--protocol"]:
             if arg == "ISO15693":
                 protocol = ISO15693
@@ -68,8 +90,14 @@ def main(argv):
                 protocol = ISO14443A
             elif arg == "ISO14443B":
                 protocol = ISO14443B
+            else:
+                print(f"Unknown protocol {arg}")
+                usages()
+                sys.exit(2)
         elif opt in ["-l", "--listtag"]:
             listtag = True
+        elif opt in ["-a", "--afi"]:
+            afi = int(arg, 16)
         elif opt in ["-u", "--uid"]:
             uid = arg
         elif opt in ["-r", "--read"]:
@@ -96,11 +124,27 @@ def main(argv):
         elif opt in ("-t", "--test"):
             debugtest = True
 
+    if scan:
+        found = discover()
+        if len(found) == 0:
+            print("No DLP-RFID2 found")
+            sys.exit(1)
+        for port, version in found:
+            print(f"{port}: {version}")
+        sys.exit(0)
+
     if devtty is None:
         print("Wrong parameter: Give a devtty path")
         usages()
         sys.exit(2)
 
+    # AFI and eeprom accesses are ISO15693 commands
+    iso15693_only = afi is not None or getsysinfo or writeoffset is not None \
+        or blockoffset is not None
+    if protocol != ISO15693 and iso15693_only:
+        print("Wrong parameter: -a, -g, -r, -m, -M and -w need ISO15693 protocol")
+        sys.exit(2)
+
     print("Initilize the DLP")
     try:
         reader = PyDlpRfid2(serial_port=devtty, loglevel=loglevel)
@@ -122,11 +166,15 @@ def main(argv):
 
     if listtag:
         print("Looking for tags")
-        ret = reader.inventory(single_slot=True)
-        if ret is not None:
-            uids = list([ret])
-        else:
-            uids = []
+        try:
+            if protocol == ISO15693:
+                entries = reader.inventory_entries(single_slot=True, afi=afi)
+            else:
+                entries = reader.inventory_entries()
+        except StandardError as e:
+            print(f"Tag listing failed: {e}")
+            sys.exit(1)
+        uids = [entry.as_tuple() for entry in entries]
         if len(uids) == 0:
             print("No tags found")
         else:
@@ -148,6 +196,11 @@ def main(argv):
             print(f"Block 0x{blockoffset:04X} to 0x{(blockoffset+(blocknum-1)):04X} : {values}")
     elif blockoffset is not None and dataliststr is not None:
         datalist = [int(vstr, 16) for vstr in dataliststr]
-        value = reader.eeprom_write_multiple_block(uid, blockoffset, datalist)
+        if uid is not None:
+            # Select tag once instead of sending UID with each block
+            with reader.selected(uid):
+                value = reader.eeprom_write_multiple_block(uid, blockoffset, datalist)
+        else:
+            value = reader.eeprom_write_multiple_block(uid, blockoffset, datalist)
         print(f"Block 0x{blockoffset:04X} to 0x{(blockoffset+(blocknum-1)):04X} written")
 
@@ -0,0 +1,107 @@
+# -*- coding: utf-8; tab-width: 4; indent-tabs-mode: nil; c-basic-offset: 4 -*-
+# vim:fenc=utf-8:et:sw=4:ts=4:sts=4:tw=0
+#
+# Antenna scheduling between DLP-RFID2 internal and external antennas
+#
+# Inventory is done on each antenna, results are merged with RSSI per
+# antenna, and later accesses to a tag are routed to the antenna that saw
+# it best. Current antenna is always used first so that switches are kept
+# to a minimum.
+
+import logging
+
+from .tag import InventoryEntry
+
+INTERNAL = "internal"
+EXTERNAL = "external"
+
+
+class AntennaScheduler(object):
+
+    def __init__(self, reader, antennas=(EXTERNAL, INTERNAL)):
+        self.reader = reader
+        self.antennas = list(antennas)
+        self.logger = logging.getLogger(__name__)
+        # {uid: {antenna: rssi}} of last inventory seeing each tag
+        self.sightings = {}
+        self.switches = 0
+
+    @property
+    def current(self):
+        return self.reader.shadow.get("antenna")
+
+    def select(self, antenna):
+        if antenna == self.current:
+            return
+        if antenna == INTERNAL:
+            self.reader.enable_internal_antenna()
+        elif antenna == EXTERNAL:
+            self.reader.enable_external_antenna()
+        else:
+            raise ValueError(f"Unknown antenna {antenna}")
+        self.switches += 1
+
+    def _order(self, antennas):
+        """ Current antenna first """
+        antennas = list(antennas)
+        if self.current in antennas:
+            antennas.remove(self.current)
+            antennas.insert(0, self.current)
+        return antennas
+
+    def inventory(self, **kwargs):
+        """ Inventory on each antenna, return {uid: {antenna: rssi}} """
+        merged = {}
+        for antenna in self._order(self.antennas):
+            self.select(antenna)
+            for entry in self.reader.inventory_entries(**kwargs):
+                merged.setdefault(entry.uid_hex, {})[antenna] = entry.rssi
+        self.sightings.update(merged)
+        return merged
+
+    def best_antenna(self, uid):
+        seen = self.sightings.get(uid.upper())
+        if not seen:
+            return None
+        # Antennas are ranked by decoded signal level, without RSSI
+        # (ISO14443A) any antenna that saw the tag is fine, prefer current one
+        levels = {antenna: InventoryEntry.rssi_level(rssi) for antenna, rssi in seen.items()}
+        return max(self._order(seen),
+                   key=lambda antenna: -1 if levels[antenna] is None else levels[antenna])
+
+    def route(self, uid):
+        """ Switch to the best antenna for uid if needed, return it """
+        antenna = self.best_antenna(uid)
+        if antenna is None:
+            self.logger.debug("%s never seen, keep antenna %s", uid, self.current)
+            return self.current
+        self.select(antenna)
+        return antenna
+
+    def call(self, uid, function, *args, **kwargs):
+        """ Route then call function(uid, *args, **kwargs), ie:
+            scheduler.call(uid, reader.eeprom_read_range, 0, 8) """
+        self.route(uid)
+        return function(uid, *args, **kwargs)
+
+    def group(self, uids):
+        """ [(antenna, [uids])] in switch order, current antenna first """
+        groups = {}
+        for uid in uids:
+            groups.setdefault(self.best_antenna(uid), []).append(uid)
+        order = self._order(antenna for antenna in self.antennas if antenna in groups)
+        if None in groups:
+            # unknown tags are tried on current antenna
+            order.insert(0, None)
+        return [(antenna, groups[antenna]) for antenna in order]
+
+    def map(self, uids, function, *args, **kwargs):
+        """ Call function for each uid with one switch per antenna at most,
+            return {uid: result} """
+        results = {}
+        for antenna, group in self.group(uids):
+            if antenna is not None:
+                self.select(antenna)
+            for uid in group:
+                results[uid] = function(uid, *args, **kwargs)
+        return results
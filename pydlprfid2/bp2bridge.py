@@ -14,33 +14,97 @@ import time
 import getopt
 import serial
 
+from .pydlprfid2 import evm_frame, DLP_CMD
+from .errors import StandardError
+
 class Bp2Bridge(object):
     """ Set bus pirate as a standard UART controller
     """
     BAUDRATE=115200
+    TIMEOUT=2
+    PING_TIMEOUT=0.5
+    PING_ANSWER=b"TRF7970A EVM"
+
+    # UART mode menu dialog: (answer, next question expected)
+    UART_MENU = [
+        (b"m3\n", b"Set serial port speed"),
+        (b"9\n", b"Data bits and parity"), # 115200 bps
+        (b"1\n", b"Stop bits"),            # 8, NONE
+        (b"1\n", b"Receive polarity"),     # 1 stop bit
+        (b"1\n", b"Select output type"),   # idle 1
+        (b"2\n", b"UART>"),                # output ttl
+    ]
+
     def __init__(self, devpath):
         self.devpath = devpath
 
+    def expect(self, ser, text, timeout=None):
+        """ Read until text is received followed by a prompt ('>' or '?'),
+            return all bytes read """
+        deadline = time.monotonic() + (self.TIMEOUT if timeout is None else timeout)
+        received = b""
+        while time.monotonic() < deadline:
+            received += ser.read(ser.in_waiting or 1)
+            if text in received:
+                tail = received[received.index(text):].rstrip()
+                if tail.endswith(b">") or tail.endswith(b"?"):
+                    return received
+        raise StandardError("Bus pirate {}: expected {} got {}"
+                            .format(self.devpath, text, received))
+
+    def send(self, ser, data, text):
+        ser.write(data)
+        return self.expect(ser, text)
+
+    def prompt(self, ser):
+        """ Send a bare newline, return what bus pirate answered up to its
+            prompt, None if line stays silent (bridge already set up) """
+        ser.reset_input_buffer()
+        ser.write(b"\n")
+        deadline = time.monotonic() + self.PING_TIMEOUT
+        received = b""
+        while time.monotonic() < deadline:
+            received += ser.read(ser.in_waiting or 1)
+            if received.rstrip().endswith(b">"):
+                return received
+        return None
+
+    def ping(self, ser):
+        """ True if DLP-RFID2 answers to INITIALIZE through bridge, only
+            sent once bridged: bus pirate terminal would take it as a
+            command """
+        ser.reset_input_buffer()
+        ser.write(evm_frame(DLP_CMD["INITIALIZE"]["code"]).encode())
+        deadline = time.monotonic() + self.PING_TIMEOUT
+        received = b""
+        while time.monotonic() < deadline:
+            received += ser.read(ser.in_waiting or 1)
+            if self.PING_ANSWER in received:
+                return True
+        return False
+
     def to_bridge(self):
-        with serial.Serial(self.devpath, self.BAUDRATE, timeout=2) as ser:
-            ser.write(b"\n")
-            ret = ser.read()
-            ser.write(b"m3\n")
-            ret = ser.read()
-            ser.write(b"9\n") # 115200 bps
-            ret = ser.read()
-            for i in range(3):
-                ser.write(b"1\n")
-                ret = ser.read()
-            ser.write(b"2\n") # output ttl
-            ret = ser.read()
-            ser.write(b"W\n") # power on
-            ret = ser.read()
-            ser.write(b"(1)\n") # set macro for bridge
-            ret = ser.read()
+        """ Configure bus pirate as UART bridge and check that DLP-RFID2
+            answers. Return False if it was already bridged. """
+        with serial.Serial(self.devpath, self.BAUDRATE, timeout=0.1) as ser:
+            prompt = self.prompt(ser)
+            if prompt is None:
+                if self.ping(ser):
+                    return False
+                raise StandardError("No bus pirate prompt nor DLP-RFID2 answer on {}"
+                                    .format(self.devpath))
+            if b"UART>" not in prompt:
+                for answer, question in self.UART_MENU:
+                    self.send(ser, answer, question)
+            self.send(ser, b"W\n", b"UART>") # power on
+            self.send(ser, b"(1)\n", b"Are you sure") # set macro for bridge
             ser.write(b"y") # agreed
-            ret = ser.read()
-            # ok for bridge
+            # ok for bridge, DLP-RFID2 may need some time after power on
+            time.sleep(self.PING_TIMEOUT)
+            if not self.ping(ser):
+                raise StandardError("No answer from DLP-RFID2 through {}"
+                                    .format(self.devpath))
+        return True
 
 def usage():
     """ print help """
@@ -74,7 +138,9 @@ def launchmain(argv):
         raise Exception("give uart path")
 
     bb = Bp2Bridge(devpath)
-    bb.to_bridge()
+    if not bb.to_bridge():
+        print("{} is already bridged".format(devpath))
+        return
     print("{} is now configured as standard tty uart ({})"
             .format(devpath, bb.BAUDRATE))
 
@@ -0,0 +1,191 @@
+# -*- coding: utf-8; tab-width: 4; indent-tabs-mode: nil; c-basic-offset: 4 -*-
+# vim:fenc=utf-8:et:sw=4:ts=4:sts=4:tw=0
+#
+# SQLite tag catalog
+#
+# Reader sink (see PyDlpRfid2.add_sink()) keeping every UID seen with first
+# and last seen dates, RSSI per reader, system info and tag data. Results
+# are buffered and written by batches in one transaction, so that high
+# inventory rates don't cost a commit each.
+#
+#   catalog = TagCatalog("tags.db")
+#   reader.add_sink(catalog)
+#   ...
+#   catalog.last_seen("E0025E167B532A87")
+
+import json
+import time
+import sqlite3
+import threading
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS tags (
+    uid TEXT PRIMARY KEY,
+    protocol TEXT,
+    first_seen REAL,
+    last_seen REAL,
+    dsfid INTEGER,
+    afi INTEGER,
+    block_count INTEGER,
+    block_size INTEGER,
+    ic_reference INTEGER
+);
+CREATE INDEX IF NOT EXISTS tags_last_seen ON tags(last_seen);
+CREATE TABLE IF NOT EXISTS sightings (
+    uid TEXT,
+    reader TEXT,
+    rssi INTEGER,
+    last_seen REAL,
+    count INTEGER,
+    PRIMARY KEY (uid, reader)
+);
+CREATE INDEX IF NOT EXISTS sightings_last_seen ON sightings(last_seen);
+CREATE TABLE IF NOT EXISTS tag_data (
+    uid TEXT,
+    block_offset INTEGER,
+    data BLOB,
+    payload TEXT,
+    read_at REAL,
+    PRIMARY KEY (uid, block_offset)
+);
+"""
+
+
+class TagCatalog(object):
+    """ decoder: optional function(uid, BlockData) giving a json-able
+        decoded payload stored along raw data """
+
+    def __init__(self, path, batch_size=500, flush_interval=1.0, decoder=None):
+        self.path = path
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.decoder = decoder
+        self.lock = threading.Lock()
+        self.db = sqlite3.connect(path, check_same_thread=False)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute("PRAGMA synchronous=NORMAL")
+        self.db.executescript(SCHEMA)
+        self.seen = {}       # (uid, reader) -> [protocol, rssi, first, last, count]
+        self.infos = {}      # uid -> TagInfo
+        self.data = {}       # (uid, offset) -> (bytes, payload, read_at)
+        self.pending = 0
+        self.last_flush = time.monotonic()
+
+    # Reader sink interface
+
+    def on_inventory(self, reader_id, protocol, entries):
+        now = time.time()
+        with self.lock:
+            for entry in entries:
+                key = (entry.uid_hex, reader_id)
+                seen = self.seen.get(key)
+                if seen is None:
+                    self.seen[key] = [protocol, entry.rssi, now, now, 1]
+                else:
+                    seen[1] = entry.rssi
+                    seen[3] = now
+                    seen[4] += 1
+                self.pending += 1
+        self._maybe_flush()
+
+    def on_system_info(self, reader_id, info):
+        with self.lock:
+            self.infos[info.uid_hex] = info
+            self.pending += 1
+        self._maybe_flush()
+
+    def on_tag_data(self, reader_id, uid, blocks):
+        payload = None
+        if self.decoder is not None:
+            payload = json.dumps(self.decoder(uid, blocks))
+        with self.lock:
+            self.data[(uid.upper(), blocks.offset)] = (bytes(blocks), payload, time.time())
+            self.pending += 1
+        self._maybe_flush()
+
+    # Batched writes
+
+    def _maybe_flush(self):
+        if (self.pending >= self.batch_size or
+                time.monotonic() - self.last_flush >= self.flush_interval):
+            self.flush()
+
+    def flush(self):
+        with self.lock:
+            seen, self.seen = self.seen, {}
+            infos, self.infos = self.infos, {}
+            data, self.data = self.data, {}
+            self.pending = 0
+            self.last_flush = time.monotonic()
+            if not (seen or infos or data):
+                return
+            with self.db:
+                self.db.executemany(
+                    "INSERT INTO tags (uid, protocol, first_seen, last_seen) "
+                    "VALUES (?, ?, ?, ?) ON CONFLICT(uid) DO UPDATE SET "
+                    "protocol=excluded.protocol, "
+                    "first_seen=coalesce(min(first_seen, excluded.first_seen), "
+                    "excluded.first_seen), "
+                    "last_seen=coalesce(max(last_seen, excluded.last_seen), "
+                    "excluded.last_seen)",
+                    [(uid, protocol, first, last)
+                     for (uid, reader), (protocol, rssi, first, last, count) in seen.items()])
+                self.db.executemany(
+                    "INSERT INTO sightings (uid, reader, rssi, last_seen, count) "
+                    "VALUES (?, ?, ?, ?, ?) ON CONFLICT(uid, reader) DO UPDATE SET "
+                    "rssi=excluded.rssi, last_seen=excluded.last_seen, "
+                    "count=count + excluded.count",
+                    [(uid, reader, rssi, last, count)
+                     for (uid, reader), (protocol, rssi, first, last, count) in seen.items()])
+                self.db.executemany(
+                    "INSERT INTO tags (uid, dsfid, afi, block_count, block_size, ic_reference) "
+                    "VALUES (?, ?, ?, ?, ?, ?) ON CONFLICT(uid) DO UPDATE SET "
+                    "dsfid=excluded.dsfid, afi=excluded.afi, "
+                    "block_count=excluded.block_count, block_size=excluded.block_size, "
+                    "ic_reference=excluded.ic_reference",
+                    [(uid, info.dsfid, info.afi, info.block_count, info.block_size,
+                      info.ic_reference) for uid, info in infos.items()])
+                self.db.executemany(
+                    "INSERT OR REPLACE INTO tag_data (uid, block_offset, data, payload, read_at) "
+                    "VALUES (?, ?, ?, ?, ?)",
+                    [(uid, offset, value, payload, read_at)
+                     for (uid, offset), (value, payload, read_at) in data.items()])
+
+    def close(self):
+        self.flush()
+        self.db.close()
+
+    # Queries
+
+    def last_seen(self, uid):
+        """ {'uid', 'first_seen', 'last_seen', 'readers': {reader: (rssi,
+            last_seen, count)}} or None if never seen """
+        self.flush()
+        uid = uid.upper()
+        with self.lock:
+            row = self.db.execute("SELECT first_seen, last_seen FROM tags WHERE uid=?",
+                                  (uid,)).fetchone()
+            if row is None:
+                return None
+            readers = self.db.execute(
+                    "SELECT reader, rssi, last_seen, count FROM sightings WHERE uid=? "
+                    "ORDER BY last_seen DESC", (uid,)).fetchall()
+        return {"uid": uid, "first_seen": row[0], "last_seen": row[1],
+                "readers": {reader: (rssi, last, count) for reader, rssi, last, count in readers}}
+
+    def seen_since(self, timestamp):
+        """ UIDs seen since timestamp, most recent first """
+        self.flush()
+        with self.lock:
+            rows = self.db.execute("SELECT uid FROM tags WHERE last_seen >= ? "
+                                   "ORDER BY last_seen DESC", (timestamp,)).fetchall()
+        return [row[0] for row in rows]
+
+    def tag_data(self, uid):
+        """ [(block offset, bytes, decoded payload)] stored for uid """
+        self.flush()
+        with self.lock:
+            rows = self.db.execute("SELECT block_offset, data, payload FROM tag_data "
+                                   "WHERE uid=? ORDER BY block_offset", (uid.upper(),)).fetchall()
+        return [(offset, data, None if payload is None else json.loads(payload))
+                for offset, data, payload in rows]
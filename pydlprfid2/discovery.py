@@ -0,0 +1,154 @@
+# -*- coding: utf-8; tab-width: 4; indent-tabs-mode: nil; c-basic-offset: 4 -*-
+# vim:fenc=utf-8:et:sw=4:ts=4:sts=4:tw=0
+#
+# Serial port discovery and multi-reader pool
+#
+# All candidate ttys are probed at the same time, each with INITIALIZE then
+# VERSION, so that a hub full of ports costs one serial timeout instead of
+# one per port.
+#
+#   for port, version in discover():
+#       print(port, version)
+#   pool = ReaderPool.discover()
+#   pool.inventory()
+
+import glob
+import time
+import logging
+import concurrent.futures
+
+import serial
+import serial.tools.list_ports
+
+from .pydlprfid2 import PyDlpRfid2, ISO15693, DLP_CMD, evm_frame
+
+logger = logging.getLogger(__name__)
+
+# Used when pyserial can't list ports
+PORT_PATTERNS = ("/dev/ttyACM*", "/dev/ttyUSB*")
+# Answer of DLP-RFID2 to INITIALIZE
+EVM_ANSWER = b"TRF7970A EVM"
+PROBE_TIMEOUT = 0.1
+
+
+def candidate_ports():
+    """ Serial ports that may be a DLP-RFID2 """
+    ports = [port.device for port in serial.tools.list_ports.comports()]
+    if not ports:
+        for pattern in PORT_PATTERNS:
+            ports.extend(glob.glob(pattern))
+    return sorted(set(ports))
+
+
+def _exchange(ser, frame, expect=None, timeout=PROBE_TIMEOUT):
+    """ Send frame, return bytes received until expect is seen or line
+        stays silent after timeout """
+    ser.reset_input_buffer()
+    ser.write(frame.encode('ascii'))
+    deadline = time.monotonic() + timeout
+    received = b""
+    while time.monotonic() < deadline:
+        received += ser.read(ser.in_waiting or 1)
+        if expect is not None and expect in received:
+            break
+    return received + ser.read(ser.in_waiting)
+
+
+def probe_port(port, keep=False):
+    """ Return (port, firmware version) if a DLP-RFID2 answers on port, else
+        None. With keep, return (reader, firmware version) and let port
+        open. """
+    try:
+        ser = serial.Serial(port=port, baudrate=PyDlpRfid2.BAUDRATE,
+                            stopbits=PyDlpRfid2.STOP_BITS,
+                            parity=PyDlpRfid2.PARITY,
+                            bytesize=PyDlpRfid2.BYTESIZE, timeout=0.01)
+    except (serial.SerialException, OSError) as e:
+        logger.debug("Can't open %s: %s", port, e)
+        return None
+    version = ''
+    try:
+        # Whatever answers garbage must not stop the whole discovery
+        if EVM_ANSWER in _exchange(ser, evm_frame(DLP_CMD["INITIALIZE"]["code"]),
+                                   EVM_ANSWER):
+            answer = _exchange(ser, evm_frame(DLP_CMD["VERSION"]["code"]))
+            version = answer.decode('ascii', 'replace').strip()
+    except Exception as e:
+        logger.debug("Probe of %s failed: %s", port, e)
+    finally:
+        ser.close()
+    if not version:
+        return None
+    logger.debug("DLP-RFID2 found on %s: %s", port, version)
+    if keep:
+        try:
+            return PyDlpRfid2(serial_port=port), version
+        except (serial.SerialException, OSError) as e:
+            logger.warning("Can't open %s again: %s", port, e)
+            return None
+    return port, version
+
+
+def discover(ports=None, keep=False, max_workers=16):
+    """ Probe ports (all candidate ports by default) in parallel, return list
+        of (port, firmware version), or (reader, firmware version) with keep """
+    if ports is None:
+        ports = candidate_ports()
+    if not ports:
+        return []
+    workers = min(max_workers, len(ports))
+    with concurrent.futures.ThreadPoolExecutor(max_workers=workers) as executor:
+        results = executor.map(lambda port: probe_port(port, keep), ports)
+        return [result for result in results if result is not None]
+
+
+class ReaderPool(object):
+    """ Several readers driven together, each by its own thread """
+
+    def __init__(self, readers):
+        self.readers = list(readers)
+        self.versions = {}
+        self.executor = concurrent.futures.ThreadPoolExecutor(
+                max_workers=max(1, len(self.readers)))
+
+    @classmethod
+    def discover(cls, ports=None, protocol=ISO15693):
+        """ Pool of all readers answering, with protocol set """
+        found = discover(ports, keep=True)
+        pool = cls(reader for reader, _ in found)
+        pool.versions = {reader.reader_id: version for reader, version in found}
+        if protocol is not None:
+            pool.map(lambda reader: reader.set_protocol(protocol))
+        return pool
+
+    def __len__(self):
+        return len(self.readers)
+
+    def map(self, function):
+        """ {reader_id: function(reader)} computed in parallel """
+        results = self.executor.map(function, self.readers)
+        return {reader.reader_id: result
+                for reader, result in zip(self.readers, results)}
+
+    def call(self, method, *args, **kwargs):
+        """ Call reader method on all readers in parallel """
+        return self.map(lambda reader: getattr(reader, method)(*args, **kwargs))
+
+    def inventory(self, **kwargs):
+        """ {reader_id: [InventoryEntry]} """
+        return self.call("inventory_entries", **kwargs)
+
+    def add_sink(self, sink):
+        for reader in self.readers:
+            reader.add_sink(sink)
+
+    def close(self):
+        self.executor.shutdown()
+        for reader in self.readers:
+            reader.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
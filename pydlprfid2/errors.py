@@ -0,0 +1,27 @@
+# -*- coding: utf-8; tab-width: 4; indent-tabs-mode: nil; c-basic-offset: 4 -*-
+# vim:fenc=utf-8:et:sw=4:ts=4:sts=4:tw=0
+
+
+class StandardError(Exception):
+    pass
+
+
+class TagError(StandardError):
+    """ Tag answered with error flag (code is its error code), did not
+        answer (code None) or read back differs (code VERIFY) """
+    VERIFY = "verify"
+
+    def __init__(self, msg, code=None):
+        super(TagError, self).__init__(msg)
+        self.code = code
+
+
+class WriteInterrupted(StandardError):
+    """ Multiple blocks write given up, it can be resumed with
+        eeprom_write_multiple_block(uid, block_offset, remaining) """
+    def __init__(self, msg, uid, block_offset, written, remaining):
+        super(WriteInterrupted, self).__init__(msg)
+        self.uid = uid
+        self.block_offset = block_offset
+        self.written = written
+        self.remaining = remaining
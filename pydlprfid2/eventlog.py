@@ -0,0 +1,195 @@
+# -*- coding: utf-8; tab-width: 4; indent-tabs-mode: nil; c-basic-offset: 4 -*-
+# vim:fenc=utf-8:et:sw=4:ts=4:sts=4:tw=0
+#
+# JSON Lines event log
+#
+# Reader sink (see PyDlpRfid2.add_sink()) writing inventory, system info and
+# tag data events as JSON Lines, optionally gzipped. Events are queued as
+# tuples and encoded/written by a background thread in large batches. Files
+# are rotated by size and/or age. The queue is bounded: when the disk can't
+# keep up, readers are blocked on put() instead of filling memory.
+#
+#   log = EventLog("events", compress=True, rotate_bytes=64 << 20)
+#   reader.add_sink(log)
+#   ...
+#   log.close()
+
+import os
+import json
+import gzip
+import time
+import logging
+import threading
+import collections
+
+
+class EventLog(object):
+    """ directory: where files events-<date>.jsonl[.gz] are written
+        max_pending: number of events queued before producers block
+        batch_size/flush_interval: write when this number of events are
+            queued or when oldest event is this old (seconds)
+        rotate_bytes/rotate_interval: start a new file when current one
+            reaches this size (bytes) or age (seconds), None to disable """
+
+    PREFIX = "events"
+
+    def __init__(self, directory, compress=False, batch_size=1000,
+                 flush_interval=1.0, max_pending=10000,
+                 rotate_bytes=None, rotate_interval=None):
+        self.directory = directory
+        self.compress = compress
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_pending = max_pending
+        self.rotate_bytes = rotate_bytes
+        self.rotate_interval = rotate_interval
+        self.logger = logging.getLogger(__name__)
+        self.encoder = json.JSONEncoder(separators=(',', ':'))
+        os.makedirs(directory, exist_ok=True)
+        self.queue = collections.deque()
+        self.cond = threading.Condition()
+        self.closed = False
+        self.flushing = False
+        self.blocked = 0     # number of times a producer had to wait
+        self.written = 0
+        self.fd = None
+        self.filename = None
+        self.file_bytes = 0
+        self.file_opened = 0
+        self.thread = threading.Thread(target=self._run, name="EventLog", daemon=True)
+        self.thread.start()
+
+    # Reader sink interface: only keep references, encoding is done by writer
+
+    def on_inventory(self, reader_id, protocol, entries):
+        self.put(("inventory", time.time(), reader_id, protocol, list(entries)))
+
+    def on_system_info(self, reader_id, info):
+        self.put(("system_info", time.time(), reader_id, info))
+
+    def on_tag_data(self, reader_id, uid, blocks):
+        self.put(("tag_data", time.time(), reader_id, uid, blocks))
+
+    def put(self, event):
+        """ Queue event, block while queue is full """
+        with self.cond:
+            if self.closed:
+                raise ValueError("Event log closed")
+            if len(self.queue) >= self.max_pending:
+                self.blocked += 1
+                self.cond.notify_all()
+                while len(self.queue) >= self.max_pending and not self.closed:
+                    self.cond.wait()
+            self.queue.append(event)
+            if len(self.queue) >= self.batch_size:
+                self.cond.notify_all()
+
+    def flush(self):
+        """ Wait until all queued events are written """
+        with self.cond:
+            self.flushing = True
+            self.cond.notify_all()
+            while (self.queue or self.flushing) and self.thread.is_alive():
+                self.cond.wait(0.1)
+
+    def close(self):
+        with self.cond:
+            self.closed = True
+            self.cond.notify_all()
+        self.thread.join()
+        self._close_file()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    # Writer thread
+
+    def encode(self, event):
+        kind, stamp, reader_id = event[:3]
+        record = {"event": kind, "time": stamp, "reader": reader_id}
+        if kind == "inventory":
+            record["protocol"] = event[3]
+            record["tags"] = [{"uid": entry.uid_hex, "rssi": entry.rssi}
+                              for entry in event[4]]
+        elif kind == "system_info":
+            info = event[3]
+            record.update(uid=info.uid_hex, dsfid=info.dsfid, afi=info.afi,
+                          block_count=info.block_count, block_size=info.block_size,
+                          ic_reference=info.ic_reference)
+        elif kind == "tag_data":
+            record.update(uid=event[3].upper(), offset=event[4].offset,
+                          data=event[4].hex())
+        else:
+            record["data"] = event[3:]
+        return self.encoder.encode(record)
+
+    def _run(self):
+        while True:
+            with self.cond:
+                deadline = time.monotonic() + self.flush_interval
+                while (len(self.queue) < self.batch_size and not self.closed and
+                        not self.flushing):
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    self.cond.wait(remaining)
+                batch = list(self.queue)
+                self.queue.clear()
+                closed = self.closed
+                # Producers may go on while batch is written
+                self.cond.notify_all()
+            if batch:
+                try:
+                    self._write(batch)
+                except Exception as e:
+                    self.logger.error("Can't write %d events: %s", len(batch), e)
+            with self.cond:
+                if not self.queue:
+                    self.flushing = False
+                    self.cond.notify_all()
+            if closed and not batch:
+                return
+
+    def _write(self, batch):
+        data = ("\n".join(self.encode(event) for event in batch) + "\n").encode()
+        if self.fd is None or self._must_rotate():
+            self._open_file()
+        self.fd.write(data)
+        self.fd.flush()
+        self.file_bytes += len(data)
+        self.written += len(batch)
+
+    def _must_rotate(self):
+        if self.rotate_bytes is not None and self.file_bytes >= self.rotate_bytes:
+            return True
+        if (self.rotate_interval is not None and
+                time.time() - self.file_opened >= self.rotate_interval):
+            return True
+        return False
+
+    def _open_file(self):
+        self._close_file()
+        stamp = time.strftime("%Y%m%d-%H%M%S")
+        suffix = ".jsonl.gz" if self.compress else ".jsonl"
+        filename = os.path.join(self.directory, f"{self.PREFIX}-{stamp}{suffix}")
+        index = 1
+        while os.path.exists(filename):
+            filename = os.path.join(self.directory,
+                                    f"{self.PREFIX}-{stamp}-{index}{suffix}")
+            index += 1
+        if self.compress:
+            self.fd = gzip.open(filename, 'wb')
+        else:
+            self.fd = open(filename, 'wb')
+        self.filename = filename
+        self.file_bytes = 0
+        self.file_opened = time.time()
+        self.logger.debug("Writing events to %s", filename)
+
+    def _close_file(self):
+        if self.fd is not None:
+            self.fd.close()
+            self.fd = None
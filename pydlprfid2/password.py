@@ -0,0 +1,150 @@
+# -*- coding: utf-8; tab-width: 4; indent-tabs-mode: nil; c-basic-offset: 4 -*-
+# vim:fenc=utf-8:et:sw=4:ts=4:sts=4:tw=0
+#
+# M24LR64E-R sector password session
+#
+# Memory is split in sectors of 32 blocks, each locked sector is controlled
+# by one of three 32 bits passwords. Only one password gives access rights
+# at a time: presenting a new one drops rights given by the previous one.
+# The session keeps track of presented password and orders accesses by
+# password then address so that each password is presented at most once.
+
+import logging
+
+from .pydlprfid2 import StandardError
+from .tag import BlockData
+
+
+class SectorPasswordSession(object):
+    SECTOR_BLOCKS = 32
+
+    def __init__(self, reader, uid, passwords):
+        """ passwords: {password number: 32 bits password} """
+        self.reader = reader
+        self.uid = uid
+        self.passwords = dict(passwords)
+        self.logger = logging.getLogger(__name__)
+        self.current = None      # password number giving access rights
+        self.presented = set()   # password numbers presented in session
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.reset()
+        return False
+
+    def reset(self):
+        """ Forget access rights (tag left the field) """
+        self.current = None
+        self.presented.clear()
+
+    def sector(self, blockno):
+        return blockno // self.SECTOR_BLOCKS
+
+    def _security(self, blocknos):
+        first = min(blocknos)
+        return self.reader.get_block_security(self.uid, first, max(blocknos) - first + 1)
+
+    def unlocked_sectors(self, start, count):
+        """ Sectors of block range currently accessible """
+        security = self.reader.get_block_security(self.uid, start, count)
+        sectors = set()
+        for blockno in range(start, start + count):
+            if self.is_unlocked(security, blockno):
+                sectors.add(self.sector(blockno))
+        return sorted(sectors)
+
+    def is_unlocked(self, security, blockno):
+        if not security.is_locked(blockno):
+            return True
+        password_no = security.password(blockno)
+        return password_no != 0 and password_no == self.current
+
+    def plan(self, blocknos, access="read"):
+        """ Group blocks as [(password number, [blocks])], blocks already
+            accessible for access ("read" or "write") first, then one group
+            per password beginning with the current one, address ordered.
+            Writing blocks no password unlocks (10 and 11 sectors) is refused
+            before any password is presented. """
+        blocknos = sorted(set(blocknos))
+        if len(blocknos) == 0:
+            return []
+        security = self._security(blocknos)
+        if access == "write":
+            # protected even with the password controlling them
+            forbidden = [blockno for blockno in blocknos
+                         if security.is_write_protected(blockno, security.password(blockno))]
+            if forbidden:
+                raise StandardError(f"Blocks {forbidden} of {self.uid} can't be written")
+            protected = security.is_write_protected
+        else:
+            protected = security.is_read_protected
+        groups = {}
+        for blockno in blocknos:
+            if protected(blockno, self.current):
+                password_no = security.password(blockno)
+            else:
+                password_no = None
+            groups.setdefault(password_no, []).append(blockno)
+        order = sorted(groups, key=lambda no: (no is not None, no != self.current, no or 0))
+        return [(no, groups[no]) for no in order]
+
+    def present(self, password_no):
+        if password_no == self.current:
+            return
+        if password_no not in self.passwords:
+            raise StandardError(f"No password number {password_no} for {self.uid}")
+        if password_no in self.presented:
+            self.logger.debug("Password %d presented again on %s", password_no, self.uid)
+        resp = self.reader.present_sector_password(self.uid, password_no,
+                                                   self.passwords[password_no])
+        if resp is None:
+            raise StandardError(f"No answer presenting password {password_no} to {self.uid}")
+        self.current = password_no
+        self.presented.add(password_no)
+
+    def _runs(self, blocknos):
+        """ Split sorted block numbers in (first, count) contiguous runs """
+        runs = []
+        for blockno in blocknos:
+            if runs and runs[-1][0] + runs[-1][1] == blockno:
+                runs[-1] = (runs[-1][0], runs[-1][1] + 1)
+            else:
+                runs.append((blockno, 1))
+        return runs
+
+    def read_range(self, start, count):
+        """ Read blocks range presenting each needed password once """
+        buf = {}
+        for password_no, blocknos in self.plan(range(start, start + count)):
+            if password_no not in (None, 0):
+                self.present(password_no)
+            for first, num in self._runs(blocknos):
+                blocks = self.reader.eeprom_read_range(self.uid, first, num)
+                if blocks is None:
+                    return None
+                for blockno, value in blocks.blocks():
+                    buf[blockno] = bytes(value)
+        return BlockData(b''.join(buf[blockno] for blockno in range(start, start + count)), start)
+
+    def write_blocks(self, blocks, readback=True):
+        """ Write {block number: 32 bits value} presenting each needed
+            password once """
+        written = 0
+        with self.reader.retry_policy.operation(self.uid):
+            for password_no, blocknos in self.plan(blocks, "write"):
+                if password_no not in (None, 0):
+                    self.present(password_no)
+                for blockno in blocknos:
+                    resp = self.reader.eeprom_write_single_block_retry(
+                            self.uid, blockno, "{:08X}".format(blocks[blockno]),
+                            readback=readback)
+                    if resp is None:
+                        raise StandardError("Writing error on block {}".format(blockno))
+                    written += 1
+        return written
+
+    def write_range(self, start, datalist, readback=True):
+        return self.write_blocks({start + i: data for i, data in enumerate(datalist)},
+                                 readback=readback)
@@ -0,0 +1,341 @@
+# -*- coding: utf-8; tab-width: 4; indent-tabs-mode: nil; c-basic-offset: 4 -*-
+# vim:fenc=utf-8:et:sw=4:ts=4:sts=4:tw=0
+#
+# Pipelined provisioning engine
+#
+# Tags entering the field go through stages:
+#   inventory -> read -> compute -> write -> verify -> report
+# Each stage has its own thread and bounded input queue, so the payload
+# computation (user callback) and reporting of one tag run while the reader
+# inventories, reads or writes other tags. Reader stages share the serial
+# port through one lock taken per operation, then the port stays busy as
+# long as tags are waiting.
+#
+#   def compute(uid, current):
+#       return b"ID" + next_id().to_bytes(6, 'big')
+#   pipeline = ProvisioningPipeline(reader, compute, blockoffset=0,
+#                                   blocknum=8, report=print)
+#   results = pipeline.run(max_tags=100)
+#   print(pipeline.metrics())
+
+import time
+import queue
+import logging
+import threading
+
+from .pydlprfid2 import ISO15693
+from .errors import StandardError
+from .tag import BlockData
+
+DONE = "done"
+SKIPPED = "skipped"
+FAILED = "failed"
+TIMEOUT = "timeout"
+STOPPED = "stopped"
+
+STAGES = ("inventory", "read", "compute", "write", "verify", "report")
+
+
+class ProvisionResult(object):
+    """ State of one tag going through the pipeline """
+    __slots__ = ('uid', 'rssi', 'status', 'current', 'payload', 'written',
+                 'error', 'times', 'started')
+
+    def __init__(self, uid, rssi=None):
+        self.uid = uid
+        self.rssi = rssi
+        self.status = None
+        self.current = None     # BlockData read before write
+        self.payload = None     # bytes to write from first block
+        self.written = []       # block numbers written
+        self.error = None
+        self.times = {}         # stage -> seconds
+        self.started = time.monotonic()
+
+    @property
+    def elapsed(self):
+        return time.monotonic() - self.started
+
+    def __repr__(self):
+        return ("ProvisionResult({}, {}, written={}, error={})"
+                .format(self.uid, self.status, len(self.written), self.error))
+
+
+class StageMetrics(object):
+    __slots__ = ('count', 'failed', 'late', 'busy', 'max_time', 'queue_max')
+
+    def __init__(self):
+        self.count = 0
+        self.failed = 0
+        self.late = 0
+        self.busy = 0.0
+        self.max_time = 0.0
+        self.queue_max = 0
+
+    def to_dict(self):
+        values = {name: getattr(self, name) for name in self.__slots__}
+        values["mean_time"] = self.busy / self.count if self.count else None
+        return values
+
+
+class ProvisioningPipeline(object):
+    """ compute(uid, current BlockData) returns payload bytes written from
+        block blockoffset, None to leave tag untouched.
+        report(ProvisionResult) is called for every tag that left the
+        pipeline, whatever its status.
+        timeouts: {stage: seconds}. Stages are not interrupted: a tag that
+        spent more time in read or compute stage is reported with TIMEOUT
+        status before anything is written. Once write started, late
+        stages are only counted (metrics "late") and the tag goes on to
+        verify.
+        max_attempts: times a tag still in the field is tried again after
+        a failure or timeout.
+        Block size is the one of blocks read (from reader registry if any).
+        Tags still in the pipeline when it stops are reported with STOPPED
+        status and tried again by next run. """
+
+    def __init__(self, reader, compute, blockoffset=0, blocknum=8, report=None,
+                 afi=None, timeouts=None, queue_size=4, interval=0.05,
+                 max_attempts=3):
+        self.reader = reader
+        self.compute = compute
+        self.blockoffset = blockoffset
+        self.blocknum = blocknum
+        self.report = report
+        self.afi = afi
+        self.timeouts = dict(timeouts or {})
+        self.interval = interval
+        self.max_attempts = max_attempts
+        self.logger = logging.getLogger(__name__)
+        self.reader_lock = threading.Lock()
+        self.queues = {stage: queue.Queue(maxsize=queue_size) for stage in STAGES[1:]}
+        self.stats = {stage: StageMetrics() for stage in STAGES}
+        self.results = []
+        self.handled = set()    # UIDs in pipeline or provisioned
+        self.attempts = {}      # UID -> number of failed attempts
+        self.stopping = threading.Event()
+        self.threads = []
+        self.leftover = []      # results not queued because of stop
+        self.finished = threading.Condition()
+
+    # Stages, each returns next stage name or None for report
+
+    def _read(self, result):
+        with self.reader_lock:
+            current = self.reader.eeprom_read_range(result.uid, self.blockoffset, self.blocknum)
+        if current is None:
+            raise StandardError(f"{result.uid} did not answer to read")
+        result.current = current
+        return "compute"
+
+    def _compute(self, result):
+        payload = self.compute(result.uid, result.current)
+        if payload is None:
+            result.status = SKIPPED
+            return "report"
+        payload = bytes(payload)
+        block_size = result.current.block_size
+        if len(payload) > self.blocknum * block_size:
+            raise StandardError("Payload of {} bytes is bigger than {} blocks"
+                                .format(len(payload), self.blocknum))
+        # Partial last block keeps current bytes
+        size = -(-len(payload) // block_size) * block_size
+        result.payload = payload + bytes(result.current)[len(payload):size]
+        return "write"
+
+    def _write(self, result):
+        block_size = result.current.block_size
+        current = BlockData(bytes(result.current)[:len(result.payload)], self.blockoffset,
+                            block_size)
+        target = BlockData(result.payload, self.blockoffset, block_size)
+        with self.reader.retry_policy.operation(result.uid):
+            for (blockno, value), (_, old) in zip(target.blocks(), current.blocks()):
+                if value == old:
+                    continue
+                with self.reader_lock:
+                    self.reader.eeprom_write_single_block_retry(
+                            result.uid, blockno, bytes(value).hex().upper(), readback=False)
+                result.written.append(blockno)
+        return "verify" if result.written else "report"
+
+    def _verify(self, result):
+        target = BlockData(result.payload, self.blockoffset, result.current.block_size)
+        failed = []
+        for first, last in self.reader.block_spans(result.written):
+            with self.reader_lock:
+                check = self.reader.eeprom_read_range(result.uid, first, last - first + 1)
+            if check is None:
+                raise StandardError(f"{result.uid} did not answer to verify")
+            failed += [blockno for blockno, value in check.blocks()
+                       if blockno in result.written and value != target.block(blockno)]
+        if failed:
+            raise StandardError("Verify failed on blocks {}"
+                                .format(', '.join(str(b) for b in failed)))
+        result.status = DONE
+        return "report"
+
+    def _report(self, result):
+        if result.status is None:
+            result.status = DONE
+        if result.status in (FAILED, TIMEOUT):
+            # try again next time it is seen, if attempts left
+            attempts = self.attempts.get(result.uid, 0) + 1
+            self.attempts[result.uid] = attempts
+            if attempts < self.max_attempts:
+                self.handled.discard(result.uid)
+        elif result.status == STOPPED:
+            self.handled.discard(result.uid)
+        self.results.append(result)
+        if self.report is not None:
+            try:
+                self.report(result)
+            except Exception as e:
+                self.logger.error("Report callback failed on %s: %s", result.uid, e)
+        with self.finished:
+            self.finished.notify_all()
+        return None
+
+    # Threads
+
+    def _put(self, stage, result):
+        target = self.queues[stage]
+        while not self.stopping.is_set():
+            try:
+                target.put(result, timeout=0.1)
+            except queue.Full:
+                continue
+            metrics = self.stats[stage]
+            metrics.queue_max = max(metrics.queue_max, target.qsize())
+            return
+        # reported by stop()
+        self.leftover.append((stage, result))
+
+    def _worker(self, stage, function):
+        source = self.queues[stage]
+        metrics = self.stats[stage]
+        while not self.stopping.is_set():
+            try:
+                result = source.get(timeout=0.1)
+            except queue.Empty:
+                continue
+            begin = time.monotonic()
+            try:
+                following = function(result)
+            except Exception as e:
+                self.logger.warning("%s stage failed on %s: %s", stage, result.uid, e)
+                result.status = FAILED
+                result.error = e
+                metrics.failed += 1
+                # a failing report stage must not report again
+                following = None if stage == "report" else "report"
+            spent = time.monotonic() - begin
+            result.times[stage] = spent
+            metrics.count += 1
+            metrics.busy += spent
+            metrics.max_time = max(metrics.max_time, spent)
+            limit = self.timeouts.get(stage)
+            if limit is not None and spent > limit:
+                metrics.late += 1
+                # nothing written yet: give up, else verify what was written
+                if following in ("compute", "write"):
+                    result.status = TIMEOUT
+                    result.error = StandardError(f"{stage} took {spent:.3f} s")
+                    following = "report"
+            if following is not None:
+                self._put(following, result)
+
+    def _inventory(self):
+        metrics = self.stats["inventory"]
+        while not self.stopping.is_set():
+            begin = time.monotonic()
+            try:
+                with self.reader_lock:
+                    if self.reader.protocol != ISO15693:
+                        self.reader.set_protocol(ISO15693)
+                    entries = self.reader.inventory_iso15693_entries(afi=self.afi)
+            except StandardError as e:
+                self.logger.warning("Inventory failed: %s", e)
+                metrics.failed += 1
+                entries = []
+            spent = time.monotonic() - begin
+            metrics.count += 1
+            metrics.busy += spent
+            metrics.max_time = max(metrics.max_time, spent)
+            for entry in entries:
+                if entry.uid_hex in self.handled:
+                    continue
+                self.handled.add(entry.uid_hex)
+                result = ProvisionResult(entry.uid_hex, entry.rssi)
+                result.times["inventory"] = spent
+                self._put("read", result)
+            self.stopping.wait(self.interval)
+
+    def start(self):
+        self.stopping.clear()
+        functions = {"read": self._read, "compute": self._compute,
+                     "write": self._write, "verify": self._verify,
+                     "report": self._report}
+        self.threads = [threading.Thread(target=self._inventory,
+                                         name="provision-inventory", daemon=True)]
+        for stage, function in functions.items():
+            self.threads.append(threading.Thread(target=self._worker,
+                                                 args=(stage, function),
+                                                 name="provision-" + stage,
+                                                 daemon=True))
+        for thread in self.threads:
+            thread.start()
+
+    def stop(self):
+        """ Stop threads, then report tags left in the pipeline """
+        self.stopping.set()
+        for thread in self.threads:
+            thread.join()
+        self.threads = []
+        leftover, self.leftover = self.leftover, []
+        for stage in STAGES[1:]:
+            source = self.queues[stage]
+            while not source.empty():
+                leftover.append((stage, source.get_nowait()))
+        for stage, result in leftover:
+            # only tags done with are reported as they are
+            if stage != "report":
+                result.status = STOPPED
+            self._report(result)
+
+    def forget(self, uid):
+        """ Let uid be provisioned again next time it is seen """
+        self.handled.discard(uid.upper())
+        self.attempts.pop(uid.upper(), None)
+
+    def wait(self, max_tags=None, duration=None):
+        """ Wait until max_tags were reported or duration (s) elapsed """
+        deadline = None if duration is None else time.monotonic() + duration
+        with self.finished:
+            while max_tags is None or len(self.results) < max_tags:
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    break
+                self.finished.wait(0.1 if remaining is None else min(remaining, 0.1))
+
+    def run(self, max_tags=None, duration=None):
+        """ Provision tags until max_tags were reported or duration elapsed,
+            return list of ProvisionResult """
+        if max_tags is None and duration is None:
+            raise StandardError("Give max_tags or duration")
+        self.results = []
+        self.attempts = {}
+        self.start()
+        try:
+            self.wait(max_tags, duration)
+        finally:
+            self.stop()
+        return self.results
+
+    def metrics(self):
+        """ {stage: counters} and overall throughput """
+        values = {stage: metrics.to_dict() for stage, metrics in self.stats.items()}
+        for stage, source in self.queues.items():
+            values[stage]["queued"] = source.qsize()
+        values["tags"] = {status: sum(1 for result in self.results if result.status == status)
+                          for status in (DONE, SKIPPED, FAILED, TIMEOUT, STOPPED)}
+        return values
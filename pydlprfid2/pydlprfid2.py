@@ -3,11 +3,20 @@
 
 import re
 import time
+import contextlib
 import serial
 import pprint
 import logging
 import binascii
 
+from .errors import StandardError, TagError, WriteInterrupted
+from .retry import RetryPolicy
+from .tag import InventoryEntry, TagInfo, BlockData, BlockSecurity
+from .timeouts import TimeoutProfile
+from .tracing import no_span
+from .writebuffer import WriteBuffer
+from .rf import RfConfig, RfTuner, MODULATION_DEPTH
+
 try:
     # Use colored logging if termcolor is available
     from termcolor import colored
@@ -16,13 +25,17 @@ except ImportError:
     def colored(msg, *args, **kwargs):
         return msg
 
-class StandardError(Exception):
-    pass
-
 ISO15693 = 'ISO15693'
 ISO14443A = 'ISO14443A'
 ISO14443B = 'ISO14443B'
 
+# TRF7970A ISO Control register (0x01) value for each protocol
+ISO_CONTROL = {
+    ISO15693: 0x00,   # 0x01 for 1-out-of-256 modulation
+    ISO14443A: 0x09,
+    ISO14443B: 0x0C,
+}
+
 # sloa157.pdf Table 4 «HOST (PC GUI to MCU)» page 18
 DLP_CMD = {
         "DIRECTMODE": {"code": '0F', "desc": "Direct mode"},
@@ -110,6 +123,32 @@ def reverse_uid(uid):
             uid[-14:-12] +
             uid[-16:-14])
 
+def evm_frame(cmd, prms=''):
+    # The EVM protocol has a general form as shown below:
+    #  1. SOF (Start of File): 0x01
+    #  2. LENGTH : Two bytes define the number of bytes in the frame including SOF. Least Significant Byte first!
+    #  3. READER_TYPE : 0x03
+    #  4. ENTITY : 0x04
+    #  5. CMD : The command
+    #  6. PRMS : Parameters
+    #  7. EOF : 0x0000
+
+    # Two-digit hex strings (without 0x prefix)
+    sof = '01'
+    reader_type = '03'
+    entity = '04'
+    eof = '0000'
+
+    result = reader_type + entity + cmd + prms + eof
+
+    length = int(len(result)/2) + 3  # Number of *bytes*, + 3 to include SOF and LENGTH
+    length = '%04X' % length  # Convert int to hex
+    length = binascii.unhexlify(length)[::-1]  # Reverse hex string to get LSB first
+    length = binascii.hexlify(length).decode('ascii')
+
+    result = sof + length + result
+    return result.upper()
+
 def flagsbyte(double_sub_carrier=False, high_data_rate=False, inventory=False,
               protocol_extension=False, afi=False, single_slot=False,
               option=False, select=False, address=False):
@@ -136,9 +175,43 @@ class PyDlpRfid2(object):
     STOP_BITS=serial.STOPBITS_ONE
     PARITY=serial.PARITY_NONE
     BYTESIZE=serial.EIGHTBITS
+    # Read Multiple Block size used when no registry knows better
+    DEFAULT_READ_CHUNK=8
+    # Requests sent at once by multi-tag accesses
+    PIPELINE_DEPTH=8
+    # Blocks per Get Multiple Block Security Status
+    SECURITY_CHUNK=64
+    # Library AFI values (Danish data model)
+    AFI_ON_SHELF=0x07
+    AFI_CHECKED_OUT=0xC2
+    # Serial port polling period while waiting for an answer
+    POLL_INTERVAL=0.001
 
     def __init__(self, serial_port, loglevel=logging.INFO):
         self.protocol = None
+        # Optional TagRegistry consulted by bulk accesses
+        self.registry = None
+        # BlockSecurity read per UID
+        self.security_cache = {}
+        # Sector password number presented per UID
+        self.presented_passwords = {}
+        # UID of tag in selected state, addressed with select flag
+        self.selected_uid = None
+        # UID of last card found by ISO14443A inventory, NFC Type 2 target
+        self.iso14443A_uid = None
+        # Known reader state: registers, antenna, AGC, AM/PM and LEDs
+        self.shadow = {}
+        # Power, data rate, sub-carrier and modulation settings
+        self.rf_config = RfConfig()
+        # Retries of every tag write path
+        self.retry_policy = RetryPolicy()
+        # Objects fed with inventory and read results, see add_sink()
+        self.sinks = []
+        self.reader_id = serial_port
+        # Optional Tracer recording command timeline
+        self.tracer = None
+        # Learned answer timeouts per command
+        self.timeouts = TimeoutProfile()
         self.__log_config(loglevel)
         self.sp = serial.Serial(port=serial_port,
                                 baudrate=self.BAUDRATE,
@@ -155,6 +228,9 @@ class PyDlpRfid2(object):
 
     def __log_config(self, loglevel):
         self.logger = logging.getLogger(__name__)
+        # logger is shared by all readers, configure it once
+        if self.logger.handlers:
+            return
         # create console handler and set level to debug
         ch = logging.StreamHandler()
         ch.setLevel(loglevel)
@@ -168,16 +244,77 @@ class PyDlpRfid2(object):
         self.logger.setLevel(loglevel)
 
 
+    def add_sink(self, sink):
+        """ Feed sink with results. Sink may define any of:
+              on_inventory(reader_id, protocol, entries)
+              on_tag_data(reader_id, uid, blocks)
+              on_system_info(reader_id, info) """
+        self.sinks.append(sink)
+
+    def remove_sink(self, sink):
+        self.sinks.remove(sink)
+
+    def _notify(self, event, *args):
+        for sink in self.sinks:
+            handler = getattr(sink, event, None)
+            if handler is not None:
+                try:
+                    handler(self.reader_id, *args)
+                except Exception as e:
+                    self.logger.error("Sink %s failed on %s: %s", sink, event, e)
+
+    def invalidate_shadow(self):
+        """ Forget known reader state, next settings will be sent """
+        self.shadow.clear()
+
+    def _set_state(self, key, value, cmd, prms=''):
+        """ Send command setting state key to value unless shadow says it
+            is already in place. These commands may give no answer, state
+            is recorded once sent. """
+        if key in self.shadow and self.shadow[key] == value:
+            return False
+        self.issue_evm_command(cmd=cmd, prms=prms, get_full_response=True)
+        self.shadow[key] = value
+        return True
+
+    def write_registers(self, registers):
+        """ Write [(address, value), ...] TRF7970A registers in one
+            command, registers already holding value are skipped """
+        pairs = [(address, value) for address, value in registers
+                 if self.shadow.get(("reg", address)) != value]
+        if len(pairs) == 0:
+            return False
+        prms = ''.join('%02X%02X' % (address, value) for address, value in pairs)
+        if self.issue_evm_command(cmd=DLP_CMD["WRITESINGLE"]["code"], prms=prms,
+                                  get_full_response=True):
+            for address, value in pairs:
+                self.shadow[("reg", address)] = value
+        else:
+            # Register write not answered, reader state is unknown
+            self.invalidate_shadow()
+        return True
+
     def enable_external_antenna(self):
         cmdstr = DLP_CMD["EXTERNANT"]["code"]
-        self.issue_evm_command(cmd=cmdstr)
+        self._set_state("antenna", "external", cmd=cmdstr)
 
     def enable_internal_antenna(self):
         cmdstr = DLP_CMD["INTERNANT"]["code"]
-        self.issue_evm_command(cmd=cmdstr)
+        self._set_state("antenna", "internal", cmd=cmdstr)
+
+    def set_agc(self, enable=True):
+        # AGC selection (0xF0) : AGC enable (0x00), disable (0xFF)
+        self._set_state("agc", enable, cmd=DLP_CMD["AGCSEL"]["code"],
+                        prms='00' if enable else 'FF')
+
+    def set_ampm_input(self, am=True):
+        # AM/PM input selection (0xF1) : AM input (0xFF), PM input (0x00)
+        self._set_state("ampm", am, cmd=DLP_CMD["AMPMSEL"]["code"],
+                        prms='FF' if am else '00')
 
     def init_kit(self):
         initcmd = DLP_CMD["INITIALIZE"]["code"]
+        self.invalidate_shadow()
         self.issue_evm_command(cmd=initcmd)  # Should return "TRF7970A EVM"
 
     def debug_test(self):
@@ -221,11 +358,54 @@ class PyDlpRfid2(object):
         print("TODO")
         print("")
         print("End of debug")
+        # registers and toggles have been written behind shadow back
+        self.invalidate_shadow()
 
     def set_iso15693(self):
-        # Select protocol: 15693 with full power
-        self.issue_evm_command(cmd=DLP_CMD["WRITESINGLE"]["code"],
-                               prms='00210100')
+        # Select protocol: 15693 with configured power
+        self.write_registers([(0x00, self.rf_config.chip_status()),
+                              (0x01, self._iso_control(ISO15693))])
+
+    def _iso_control(self, protocol):
+        if protocol == ISO15693:
+            return self.rf_config.iso15693_control()
+        return ISO_CONTROL[protocol]
+
+    def _flags(self, **kwargs):
+        """ ISO15693 request flags matching configured data rate and
+            sub-carrier """
+        return flagsbyte(high_data_rate=self.rf_config.high_data_rate,
+                         double_sub_carrier=self.rf_config.double_sub_carrier,
+                         **kwargs)
+
+    def read_register(self, address):
+        response = self.issue_evm_command(cmd=DLP_CMD["READSINGLE"]["code"],
+                                          prms='%02X' % address)
+        if len(response) == 0 or response[0] == '':
+            raise StandardError(f"Can't read register 0x{address:02X}")
+        return int(response[0][-2:], 16)
+
+    def configure_rf(self, config=None, **kwargs):
+        """ Apply RfConfig, or change some of its settings given as
+            keyword arguments (half_power, high_data_rate, ...) """
+        if config is None:
+            config = self.rf_config.copy(**kwargs)
+        self.rf_config = config
+        if self.protocol is None:
+            return
+        self.write_registers([(0x00, config.chip_status()),
+                              (0x01, self._iso_control(self.protocol))])
+        if config.modulation_depth is not None:
+            modulator = self.shadow.get(("reg", 0x09))
+            if modulator is None:
+                modulator = self.read_register(0x09)
+            modulator = (modulator & ~0x07) | MODULATION_DEPTH[config.modulation_depth]
+            self.write_registers([(0x09, modulator)])
+
+    def autotune_rf(self, candidates=None, duration=1.0):
+        """ Apply and return the RfConfig giving the most successful
+            inventory slots per second of current protocol in current field """
+        return RfTuner(self, candidates).tune(duration=duration)
 
     def set_protocol(self, protocol=ISO15693):
 
@@ -233,42 +413,42 @@ class PyDlpRfid2(object):
 
         # 1. Initialize reader: 0xFF
         # 0108000304 FF 0000
-        initcmd = DLP_CMD["INITIALIZE"]["code"]
-        self.issue_evm_command(cmd=initcmd)  # Should return "TRF7970A EVM"
+        # Reader state is reset by initialization
+        self.init_kit()
 
         # self.issue_evm_command(cmd='10', prms='0121')
         # self.issue_evm_command(cmd='10', prms='0021')
 
-        # Select protocol: 15693 with full power
-        self.issue_evm_command(cmd=DLP_CMD["WRITESINGLE"]["code"],
-                               prms='00210100')
-
         # Setting up registers:
         #   0x00 Chip Status Control: Set to 0x21 for full power, 0x31 for half power
-        #   0x01 ISO Control: Set to 0x00 for ISO15693, 0x09 for ISO14443A, 0x0C for ISO14443B
-        protocol_values = {
-            ISO15693: '00',   # 01 for 1-out-of-256 modulation
-            ISO14443A: '09',
-            ISO14443B: '0C',
-        }
-        self.issue_evm_command(cmd=DLP_CMD["WRITESINGLE"]["code"],
-                               prms='0021' + '01' + protocol_values[protocol])
+        #   0x01 ISO Control: see ISO_CONTROL, ISO15693 value depends on RfConfig
+        self.configure_rf(self.rf_config)
 
         # 3. AGC selection (0xF0) : AGC enable (0x00)
         # 0109000304 F0 00 0000
-        self.issue_evm_command(cmd=DLP_CMD["AGCSEL"]["code"], prms='00')
+        self.set_agc(True)
 
         # 4. AM/PM input selection (0xF1) : AM input (0xFF)
         # 0109000304 F1 FF 0000
-        self.issue_evm_command(cmd=DLP_CMD['AMPMSEL']["code"], prms='FF')
+        self.set_ampm_input(am=True)
+
+    def switch_protocol(self, protocol):
+        """ Change protocol of an already configured reader by writing
+            ISO control register only, other settings are kept """
+        if self.protocol is None:
+            return self.set_protocol(protocol)
+        if protocol == self.protocol:
+            return
+        self.write_registers([(0x01, self._iso_control(protocol))])
+        self.protocol = protocol
 
     def enable_led(self, led_no):
         cmd_codes = {2: 'FB', 3: 'F9', 4: 'F7', 5: 'F5', 6: 'F3'}
-        self.issue_iso15693_command(cmd=cmd_codes[led_no])
+        self._set_state(("led", led_no), True, cmd=cmd_codes[led_no])
 
     def disable_led(self, led_no):
         cmd_codes = {2: 'FC', 3: 'FA', 4: 'F8', 5: 'F6', 6: 'F4'}
-        self.issue_iso15693_command(cmd=cmd_codes[led_no])
+        self._set_state(("led", led_no), False, cmd=cmd_codes[led_no])
 
     def inventory(self, **kwargs):
         if self.protocol == ISO15693:
@@ -276,8 +456,18 @@ class PyDlpRfid2(object):
         elif self.protocol == ISO14443A:
             return self.inventory_iso14443A(**kwargs)
 
+    def inventory_entries(self, **kwargs):
+        """ Typed inventory: list of InventoryEntry for current protocol """
+        if self.protocol == ISO15693:
+            return self.inventory_iso15693_entries(**kwargs)
+        elif self.protocol == ISO14443A:
+            return self.inventory_iso14443A_entries(**kwargs)
+        raise StandardError(f"No typed inventory for protocol {self.protocol}")
 
-    def inventory_iso14443A(self):
+    # ISO14443-3 cascade tag, first byte of an incomplete cascade level
+    CASCADE_TAG = 0x88
+
+    def inventory_iso14443A_entries(self, wakeup=True, max_rounds=8):
         """
         By sending a 0xA0 command to the EVM module, the module will carry out
         the whole ISO14443 anti-collision procedure and return the tags found.
@@ -286,225 +476,810 @@ class PyDlpRfid2(object):
             <<< ATQA (0x04 0x00)
             >>> Select all (0x93, 0x20)
             <<< UID + BCC
+            >>> Select cascade level 2/3 (0x95/0x97, 0x20) for longer UIDs
+            <<< UID + BCC
 
+        Each answer is one cascade level (4 bytes + BCC), levels beginning
+        with cascade tag 0x88 are completed by next one, giving 4, 7 or 10
+        bytes UIDs. HLTA only halts a selected card: each card found is
+        selected (SELECT of each cascade level) then halted, and the
+        request is issued again until no new card answers, so that all
+        cards are returned. A card that can't be selected keeps answering
+        and ends the inventory. Halted cards only answer to WUPA (0xA1), so
+        first round uses it unless wakeup is False: cards halted by
+        previous inventory are found again.
         """
-        response = self.issue_evm_command(cmd=DLP_CMD["REQA14443A"]["code"])
-
+        entries = []
+        found = set()
+        cmd = DLP_CMD["WUPA14443A"]["code"] if wakeup else DLP_CMD["REQA14443A"]["code"]
+        for _ in range(max_rounds):
+            response = self.issue_evm_command(cmd=cmd)
+            cmd = DLP_CMD["REQA14443A"]["code"]
+            new = [uid for uid in self._iso14443A_uids(response) if uid not in found]
+            if len(new) == 0:
+                break
+            for uid in new:
+                self.logger.debug('Found tag: %s', uid.hex().upper())
+                found.add(uid)
+                entries.append(InventoryEntry(uid))
+                if self._select_iso14443A(uid):
+                    self._halt_iso14443A()
+                else:
+                    self.logger.warning('Card %s not selected, not halted', uid.hex().upper())
+        self.iso14443A_uid = entries[-1].uid.hex().upper() if entries else None
+        if self.sinks:
+            self._notify("on_inventory", ISO14443A, entries)
+        return entries
+
+    def _iso14443A_uids(self, response):
+        """ Assemble complete UIDs from cascade level answers """
+        uids = []
+        partial = b''
         for itm in response:
-            iba = bytearray.fromhex(itm)
-            # Assume 4-byte UID + 1 byte Block Check Character (BCC)
+            try:
+                iba = bytes.fromhex(itm)
+            except ValueError:
+                continue
+            if len(iba) in (4, 7, 10) and partial == b'':
+                # Firmware gave the complete UID without BCC
+                uids.append(iba)
+                continue
             if len(iba) != 5:
-                self.logger.warn('Encountered tag with UID of unknown length')
+                self.logger.warning('Encountered tag answer of unknown length (%s)', itm)
+                partial = b''
                 continue
             if iba[0] ^ iba[1] ^ iba[2] ^ iba[3] ^ iba[4] != 0:
-                self.logger.warn('BCC check failed for tag')
+                self.logger.warning('BCC check failed for tag')
+                partial = b''
                 continue
-            uid = itm[:8]  # hex string, so each byte is two chars
+            if iba[0] == self.CASCADE_TAG and len(partial) < 6:
+                partial += iba[1:4]
+            else:
+                uids.append(partial + iba[0:4])
+                partial = b''
+        return uids
+
+    # SEL codes of cascade levels 1 to 3
+    SELECT_CODES = (0x93, 0x95, 0x97)
+
+    @classmethod
+    def _cascade_levels(cls, uid):
+        """ 4 bytes UID CLn of each cascade level, incomplete levels begin
+            with cascade tag """
+        levels = []
+        while len(uid) > 4:
+            levels.append(bytes([cls.CASCADE_TAG]) + uid[:3])
+            uid = uid[3:]
+        return levels + [uid]
+
+    def _select_iso14443A(self, uid):
+        """ SELECT (SEL, NVB 0x70, CLn, BCC) each cascade level of uid,
+            return True once card answered SAK of last level """
+        for sel, level in zip(self.SELECT_CODES, self._cascade_levels(uid)):
+            bcc = level[0] ^ level[1] ^ level[2] ^ level[3]
+            response = self.issue_evm_command(cmd=DLP_CMD["REQUESTCMD"]["code"],
+                                              prms='%02X70%s%02X' % (sel, level.hex().upper(), bcc))
+            if len(response) == 0 or response[0] == '':
+                return False
+        return True
 
-            self.logger.debug('Found tag: %s (%s) ', uid, itm[8:])
-            return uid
+    def _halt_iso14443A(self):
+        # HLTA (0x50 0x00) sent over the air, card does not answer
+        self.issue_evm_command(cmd=DLP_CMD["REQUESTCMD"]["code"], prms='5000')
 
-            # See https://github.com/nfc-tools/libnfc/blob/master/examples/nfc-anticol.c
+    def inventory_iso14443A(self, wakeup=True):
+        """ List of UID hex strings of all cards in field """
+        entries = self.inventory_iso14443A_entries(wakeup=wakeup)
+        return [entry.uid_hex for entry in entries]
 
-    def inventory_iso15693(self, single_slot=False):
+    def inventory_iso15693_entries(self, single_slot=False, afi=None):
         # Command code 0x01: ISO 15693 Inventory request
         # Example: 010B000304 14 24 0100 0000
+        # With afi given, only tags of this application family answer:
+        # AFI byte is inserted before mask length
+        data = '00'
+        if afi is not None:
+            data = '%02X' % afi + data
         response = self.issue_iso15693_command(cmd=DLP_CMD["ANTICOL15693"]["code"],
-                                               flags=flagsbyte(inventory=True,
-                                                               single_slot=single_slot),
+                                               flags=self._flags(inventory=True,
+                                                               single_slot=single_slot,
+                                                               afi=afi is not None),
                                                command_code='%02X'%M24LR64ER_CMD["INVENTORY"]["code"],
-                                               data='00')
+                                               data=data)
+        entries = []
         for itm in response:
             itm = itm.split(',')
             if itm[0] == 'z':
                 self.logger.debug('Tag conflict!')
-            else:
-                if len(itm[0]) == 16:
-                    uid = itm[0]
-                    rssi = itm[1]
-                    self.logger.debug('Found tag: %s (%s) ', uid, rssi)
-                    return reverse_uid(uid), rssi
+            elif len(itm[0]) == 16:
+                try:
+                    entry = InventoryEntry.from_response(itm[0], itm[1] if len(itm) > 1 else None)
+                except ValueError:
+                    self.logger.debug('Garbled tag answer %s', ','.join(itm))
+                    continue
+                self.logger.debug('Found tag: %s (%s) ', entry.uid_hex, entry.rssi)
+                entries.append(entry)
+        if self.sinks:
+            self._notify("on_inventory", ISO15693, entries)
+        return entries
+
+    def inventory_iso15693(self, single_slot=False, afi=None):
+        entries = self.inventory_iso15693_entries(single_slot=single_slot, afi=afi)
+        if len(entries) > 0:
+            return entries[0].as_tuple()
 
     def get_dlp_rfid2_firmware_version(self):
         response = self.issue_evm_command(DLP_CMD["VERSION"]["code"], get_full_response=True)
         return response
 
 
-    def eeprom_get_system_info(self, uid=None):
+    def _addressing(self, uid):
+        """ flagsbyte() keyword arguments and UID data to address uid.
+            Selected tag is addressed by select flag without UID. """
         if uid is None:
-            response = self.issue_iso15693_command(cmd=DLP_CMD["REQUESTCMD"]["code"],
-                                flags=flagsbyte(),
-                                command_code='%02X'%M24LR64ER_CMD["GET_SYS_INFO"]["code"])
-        else:
-            response = self.issue_iso15693_command(cmd=DLP_CMD["REQUESTCMD"]["code"],
-                                flags=flagsbyte(address=True),
-                                command_code='%02X'%M24LR64ER_CMD["GET_SYS_INFO"]["code"],
-                                data=reverse_uid(uid))
+            return {}, ''
+        if self.selected_uid is not None and uid.upper() == self.selected_uid:
+            return {"select": True}, ''
+        return {"address": True}, reverse_uid(uid)
+
+    def select(self, uid):
+        """ Put tag in selected state, next commands to uid are sent with
+            select flag instead of the 8 bytes UID """
+        response = self.issue_iso15693_command(cmd=DLP_CMD["REQUESTCMD"]["code"],
+                    flags=self._flags(address=True),
+                    command_code='%02X'%M24LR64ER_CMD["SELECT"]["code"],
+                    data=reverse_uid(uid))
+        if len(response) != 1 or response[0][0:2] != '00':
+            raise StandardError(f"Can't select tag {uid} ({response})")
+        self.selected_uid = uid.upper()
+
+    def reset_to_ready(self):
+        """ Get selected tag back to ready state """
+        if self.selected_uid is None:
+            return
+        try:
+            self.issue_iso15693_command(cmd=DLP_CMD["REQUESTCMD"]["code"],
+                    flags=self._flags(select=True),
+                    command_code='%02X'%M24LR64ER_CMD["RESET_TO_READY"]["code"])
+        finally:
+            self.selected_uid = None
+
+    @contextlib.contextmanager
+    def selected(self, uid):
+        """ with reader.selected(uid): commands to uid in the block use
+            select mode addressing """
+        self.select(uid)
+        try:
+            yield self
+        finally:
+            self.reset_to_ready()
+
+    def eeprom_get_system_info(self, uid=None, protocol_extension=False):
+        addressing, uiddata = self._addressing(uid)
+        response = self.issue_iso15693_command(cmd=DLP_CMD["REQUESTCMD"]["code"],
+                            flags=self._flags(protocol_extension=protocol_extension, **addressing),
+                            command_code='%02X'%M24LR64ER_CMD["GET_SYS_INFO"]["code"],
+                            data=uiddata)
         if len(response) == 1 and response[0] != '':
             return response[0]
         else:
             return None
 
-
-    def eeprom_read_single_block(self, uid, blockoffset):
-        address = False
-        data='%02X%02X' % (blockoffset&0xFF, (blockoffset>>8)&0xFF)
-        if uid is not None:
-            data = reverse_uid(uid) + data
-            address = True
+    def eeprom_get_tag_info(self, uid=None, protocol_extension=True):
+        """ Typed system info, protocol extension gives the full M24LR64 size """
+        resp = self.eeprom_get_system_info(uid, protocol_extension=protocol_extension)
+        if resp is None:
+            return None
+        if resp[0:2] != '00':
+            raise StandardError("Wrong code return {} ({})".format(resp[0:2], resp))
+        try:
+            info = TagInfo.from_response(resp, extended=protocol_extension)
+        except ValueError as e:
+            raise StandardError(str(e))
+        if self.sinks:
+            self._notify("on_system_info", info)
+        return info
+
+    def eeprom_read_single_block_data(self, uid, blockoffset):
+        addressing, uiddata = self._addressing(uid)
+        data = uiddata + '%02X%02X' % (blockoffset&0xFF, (blockoffset>>8)&0xFF)
         response = self.issue_iso15693_command(cmd=DLP_CMD["REQUESTCMD"]["code"],
-                           flags=flagsbyte(address=address, protocol_extension=True),
+                           flags=self._flags(protocol_extension=True, **addressing),
                            command_code='%02X'%M24LR64ER_CMD["READ_SINGLE_BLOCK"]["code"],
                            data=data)
         if len(response) == 1 and response[0] != '':
             resp = response[0]
             if resp[0:2] == '00':
-                return resp[2:10]
+                block = BlockData.from_hex(resp[2:], blockoffset)
+                if self.sinks and uid is not None:
+                    self._notify("on_tag_data", uid, block)
+                return block
             else:
                 raise StandardError("Wrong code return {} ({})".format(resp[0:2], resp))
         else:
             return None
 
-    def eeprom_read_multiple_block(self, uid, blocknum, blockoffset):
-        address = False
+    def _read_multiple_block_command(self, uid, blocknum, blockoffset):
+        """ (cmd, prms) of a Read Multiple Block request """
+        addressing, uiddata = self._addressing(uid)
+        data = uiddata + '%02X%02X%02X' % (blockoffset&0xff, (blockoffset>>8)&0xff, blocknum-1)
+        return (DLP_CMD["REQUESTCMD"]["code"],
+                self._flags(protocol_extension=True, **addressing) +
+                '%02X'%M24LR64ER_CMD["READ_MULTIPLE_BLOCK"]["code"] + data)
+
+    def eeprom_read_multiple_block_data(self, uid, blocknum, blockoffset):
         if blocknum < 1:
             raise Exception("Blocknum can't be 0 or less")
-        data='%02X%02X%02X' % (blockoffset&0xff, (blockoffset>>8)&0xff, blocknum-1)
-        if uid is not None:
-            address = True
-            data = reverse_uid(uid) + data
-        response = self.issue_iso15693_command(cmd=DLP_CMD["REQUESTCMD"]["code"],
-                    flags=flagsbyte(address=address, protocol_extension=True),
-                    command_code='%02X'%M24LR64ER_CMD["READ_MULTIPLE_BLOCK"]["code"],
-                    data=data)
+        cmd, prms = self._read_multiple_block_command(uid, blocknum, blockoffset)
+        response = self.issue_evm_command(cmd, prms)
         if len(response) == 1 and response[0] != '':
             resp = response[0]
             if resp[0:2] == '00':
-                return resp[2:]
+                blocks = BlockData.from_hex(resp[2:], blockoffset)
+                if self.sinks and uid is not None:
+                    self._notify("on_tag_data", uid, blocks)
+                return blocks
             else:
                 raise StandardError("Wrong code return {} ({})".format(resp[0:2], resp))
         else:
             return None
 
+    def eeprom_read_single_block(self, uid, blockoffset):
+        block = self.eeprom_read_single_block_data(uid, blockoffset)
+        return None if block is None else block.hex()
+
+    def eeprom_read_multiple_block(self, uid, blocknum, blockoffset):
+        blocks = self.eeprom_read_multiple_block_data(uid, blocknum, blockoffset)
+        return None if blocks is None else blocks.hex()
+
+    def eeprom_read_range(self, uid, blockoffset, blocknum, chunk=None, block_size=None):
+        """ Read blocknum blocks with as few Read Multiple Block as possible.
+            Geometry and chunk size come from registry if any, else blocks
+            are block_size (default 4) bytes long. """
+        block_size = block_size or 4
+        if self.registry is not None and uid is not None:
+            block_count, size = self.registry.geometry(uid)
+            block_size = size or block_size
+            if block_count is not None and blockoffset + blocknum > block_count:
+                raise StandardError("Blocks {} to {} out of tag memory ({} blocks)"
+                        .format(blockoffset, blockoffset + blocknum - 1, block_count))
+            if chunk is None:
+                chunk = self.registry.read_chunk(uid)
+        if chunk is None:
+            chunk = self.DEFAULT_READ_CHUNK
+        buf = bytearray()
+        offset = blockoffset
+        end = blockoffset + blocknum
+        while offset < end:
+            count = min(chunk, end - offset)
+            blocks = self.eeprom_read_multiple_block_data(uid, count, offset)
+            if blocks is None:
+                return None
+            buf += bytes(blocks)
+            offset += count
+        return BlockData(buf, blockoffset, block_size)
+
+    def read_range_many(self, uids, blockoffset, blocknum, chunk=None,
+                        callback=None, as_buffer=False):
+        """ Read the same blocks from all tags of uids. Read Multiple Block
+            requests of PIPELINE_DEPTH tags are sent at once and chunks are
+            interleaved across tags. Tags that stop answering are dropped.
+            Geometry and chunk size (the smallest of all tags) come from
+            registry if any, all tags must have the same block size.
+            callback(uid, BlockData) is called as soon as a tag is read.
+            Return {uid: BlockData or None if tag left}, or with as_buffer
+            (view, missing): view is a 2-D memoryview (tag, byte) with rows
+            in uids order (numpy.asarray(view) gives a matrix), rows of
+            missing tags are zeroed. BlockData objects are views on one
+            buffer shared by all tags, nothing is copied. """
+        uids = [uid.upper() for uid in uids]
+        block_size = 4
+        if self.registry is not None and uids:
+            sizes = {self.registry.geometry(uid)[1] or block_size for uid in uids}
+            if len(sizes) > 1:
+                raise StandardError("Tags have different block sizes ({})"
+                        .format(', '.join(str(size) for size in sorted(sizes))))
+            block_size = sizes.pop()
+            if chunk is None:
+                chunk = min(self.registry.read_chunk(uid) for uid in uids)
+        if chunk is None:
+            chunk = self.DEFAULT_READ_CHUNK
+        size = blocknum * block_size
+        if as_buffer and not uids:
+            # a view can't be cast to a shape with zeros
+            return memoryview(bytearray(size)).cast('B', (1, size))[:0], set()
+        buf = bytearray(len(uids) * size)
+        view = memoryview(buf)
+        rows = {uid: row for row, uid in enumerate(uids)}
+        missing = set()
+        end = blockoffset + blocknum
+        for offset in range(blockoffset, end, chunk):
+            count = min(chunk, end - offset)
+            active = [uid for uid in uids if uid not in missing]
+            for first in range(0, len(active), self.PIPELINE_DEPTH):
+                window = active[first:first + self.PIPELINE_DEPTH]
+                answers = self.issue_evm_commands(
+                        [self._read_multiple_block_command(uid, count, offset)
+                         for uid in window])
+                for uid, response in zip(window, answers):
+                    data = None
+                    if len(response) == 1 and response[0][0:2] == '00':
+                        data = bytes.fromhex(response[0][2:2 + 2 * block_size * count])
+                    if data is None or len(data) != block_size * count:
+                        self.logger.debug("Tag %s left while reading (%s)", uid, response)
+                        missing.add(uid)
+                        continue
+                    start = rows[uid] * size + (offset - blockoffset) * block_size
+                    buf[start:start + len(data)] = data
+                    if offset + count == end:
+                        row = rows[uid] * size
+                        blocks = BlockData(view[row:row + size], blockoffset, block_size)
+                        if self.sinks:
+                            self._notify("on_tag_data", uid, blocks)
+                        if callback is not None:
+                            callback(uid, blocks)
+        for uid in missing:
+            buf[rows[uid] * size:(rows[uid] + 1) * size] = bytes(size)
+        if as_buffer:
+            return view.cast('B', (len(uids), size)), missing
+        return {uid: None if uid in missing else
+                BlockData(view[rows[uid] * size:(rows[uid] + 1) * size],
+                          blockoffset, block_size)
+                for uid in uids}
+
+    def get_block_security(self, uid, start, count, refresh=False):
+        """ Security status of blocks [start, start+count[ as BlockSecurity,
+            read SECURITY_CHUNK blocks per command and cached per UID """
+        if count < 1:
+            raise Exception("Count can't be 0 or less")
+        uid = None if uid is None else uid.upper()
+        cached = self.security_cache.get(uid)
+        if not refresh and cached is not None and cached.covers(start, count):
+            return cached.slice(start, count)
+        status = bytearray()
+        offset = start
+        while offset < start + count:
+            num = min(self.SECURITY_CHUNK, start + count - offset)
+            # with protocol extension first block and number of blocks
+            # are both coded on two bytes
+            addressing, uiddata = self._addressing(uid)
+            data = uiddata + '%02X%02X%02X%02X' % (offset&0xff, (offset>>8)&0xff,
+                                                   (num-1)&0xff, ((num-1)>>8)&0xff)
+            response = self.issue_iso15693_command(cmd=DLP_CMD["REQUESTCMD"]["code"],
+                        flags=self._flags(protocol_extension=True, **addressing),
+                        command_code='%02X'%M24LR64ER_CMD["GET_MULT_BLOC_SEC_INFO"]["code"],
+                        data=data)
+            if len(response) != 1 or response[0] == '':
+                return None
+            resp = response[0]
+            if resp[0:2] != '00':
+                raise StandardError("Wrong code return {} ({})".format(resp[0:2], resp))
+            if len(resp) != 2 + 2*num:
+                self.logger.debug("Truncated block security answer of %s (%s)", uid, resp)
+                return None
+            status += bytes.fromhex(resp[2:])
+            offset += num
+        security = BlockSecurity(status, start)
+        if uid is not None:
+            if cached is not None and not refresh:
+                merged = cached.merge(security)
+                if merged is not None:
+                    security = merged
+            self.security_cache[uid] = security
+        return security.slice(start, count)
+
+    def invalidate_block_security(self, uid=None):
+        if uid is None:
+            self.security_cache.clear()
+        else:
+            self.security_cache.pop(uid.upper(), None)
+
+    def present_sector_password(self, uid, password_no, password):
+        """ Present password (32 bits int) number password_no to tag,
+            access rights of a previously presented password are lost """
+        self.presented_passwords.pop(uid, None)
+        resp = self._sector_password_command("PRESENT_SECT_PSWD", uid,
+                '%02X' % password_no + password.to_bytes(4, 'little').hex().upper())
+        if resp is not None:
+            self.presented_passwords[uid] = password_no
+        return resp
+
+    def write_sector_password(self, uid, password_no, password):
+        """ Change password password_no, it must have been presented before """
+        return self._sector_password_command("WRITE_SECT_PSWD", uid,
+                '%02X' % password_no + password.to_bytes(4, 'little').hex().upper())
+
+    def lock_sector(self, uid, sector, sector_status):
+        """ Write sector security status (see BlockSecurity) of a sector """
+        resp = self._sector_password_command("LOCK_SECT_PSWD", uid,
+                '%02X%02X%02X' % (sector&0xff, (sector>>8)&0xff, sector_status))
+        self.invalidate_block_security(uid)
+        return resp
+
+    def _sector_password_command(self, command, uid, params):
+        # ST custom commands: IC manufacturer code comes before the UID,
+        # it is taken from UID so tag must be addressed (or selected)
+        if uid is None:
+            raise StandardError(f"{command} needs the UID of the tag")
+        addressing, uiddata = self._addressing(uid)
+        response = self.issue_iso15693_command(cmd=DLP_CMD["REQUESTCMD"]["code"],
+                    flags=self._flags(protocol_extension=True, **addressing),
+                    command_code='%02X'%M24LR64ER_CMD[command]["code"],
+                    data=uid[2:4] + uiddata + params)
+        if len(response) == 1 and response[0] != '':
+            resp = response[0]
+            if resp[0:2] == '00':
+                return resp
+            raise StandardError("Wrong code return {} ({})".format(resp[0:2], resp))
+        return None
+
     def eeprom_write_single_block(self, uid, block_offset, datastr, readback=True):
-        address = False
-        if len(datastr) > 8:
+        """ Write one block, datastr is 4 bytes or, for tags with larger
+            blocks, exactly one block (at most 32 bytes) """
+        width = max(8, len(datastr))
+        if width > 64 or width % 2:
             raise StandardError("Data too long")
         try:
-            datavalue = "{:08X}".format(int(datastr, 16))
+            datavalue = "{:0{}X}".format(int(datastr, 16), width)
         except ValueError:
             raise StandardError("Data is not correct hexadecimal value")
 
-        data = "%02X%02X" % (block_offset&0xff, (block_offset>>8)&0xff) + datavalue
-        if uid is not None:
-            address = True
-            data = reverse_uid(uid) + data
+        addressing, uiddata = self._addressing(uid)
+        data = uiddata + "%02X%02X" % (block_offset&0xff, (block_offset>>8)&0xff) + datavalue
 
         response = self.issue_iso15693_command(cmd=DLP_CMD["REQUESTCMD"]["code"],
-                 flags=flagsbyte(address=address, protocol_extension=True),
+                 flags=self._flags(protocol_extension=True, **addressing),
                  command_code='%02X'%M24LR64ER_CMD["WRITE_SINGLE_BLOCK"]["code"],
                  data=data)
+        if len(response) == 1 and response[0][0:2] == '01':
+            code = int(response[0][2:4], 16) if len(response[0]) >= 4 else None
+            raise TagError("Write error on block {}: code {} ({})"
+                    .format(block_offset, response[0][2:4], response[0]), code)
         if readback:
             block_value = self.eeprom_read_single_block(uid, block_offset)
-            if block_value != datastr:
-                raise Exception("Write error on block {}: read {} instead of {}"
-                        .format(block_offset, block_value, datastr))
+            if block_value != datavalue:
+                raise TagError("Write error on block {}: read {} instead of {}"
+                        .format(block_offset, block_value, datavalue), TagError.VERIFY)
         if len(response) == 1 and response[0] != '':
             return response[0]
         else:
             return None
 
-    def eeprom_write_multiple_block(self, uid, block_offset, datalist):
-        offset = block_offset
-        resplist = []
-        for data in datalist:
-            resp = self.eeprom_write_single_block(uid, offset, "{:08X}".format(data))
-            offset = offset + 1
-            if resp is None:
-                raise StandardError("Writing error on data {:08X}".format(data))
-            resplist.append(resp)
-        return resplist
+    def eeprom_write_single_block_retry(self, uid, block_offset, datastr, readback=True):
+        """ Write one block, retried according to retry_policy """
+        return self.retry_policy.run(uid, self.eeprom_write_single_block,
+                                     uid, block_offset, datastr, readback=readback)
+
+    def eeprom_write_multiple_block(self, uid, block_offset, datalist, skip_protected=False):
+        """ Write datalist blocks, each block is retried according to
+            retry_policy. When it gives up WriteInterrupted tells where to
+            resume. Write protected blocks known from block security cache
+            make the write fail before any block is written. With
+            skip_protected, security is read for the range and protected
+            blocks are skipped (None in returned list). """
+        protected = set()
+        if uid is not None and len(datalist) > 0:
+            cached = self.security_cache.get(uid.upper())
+            if skip_protected:
+                security = self.get_block_security(uid, block_offset, len(datalist))
+            elif cached is not None and cached.covers(block_offset, len(datalist)):
+                security = cached
+            else:
+                security = None
+            if security is not None:
+                protected = set(security.protected_blocks(
+                        block_offset, len(datalist), self.presented_passwords.get(uid)))
+            if protected and not skip_protected:
+                raise StandardError("Blocks {} are write protected"
+                        .format(', '.join(str(b) for b in sorted(protected))))
+        with self.retry_policy.operation(uid):
+            resplist = []
+            for index, data in enumerate(datalist):
+                offset = block_offset + index
+                if offset in protected:
+                    self.logger.warning("Skip write protected block %d", offset)
+                    resplist.append(None)
+                    continue
+                try:
+                    resp = self.eeprom_write_single_block_retry(uid, offset, "{:08X}".format(data))
+                except TagError as e:
+                    raise WriteInterrupted("Writing error on data {:08X} at block {}: {}"
+                                           .format(data, offset, e),
+                                           uid, offset, index, datalist[index:])
+                resplist.append(resp)
+            return resplist
 
     def write_blocks_to_card(self, uid, data_bytes, offset=0, nblocks=8):
-        for x in range(offset, nblocks):
-            success = False
-            attempts = 0
-            max_attempts = 10
-            while not success:
-                attempts += 1
-                success = self.write_block(uid, x, data_bytes[x*4:x*4+4])
-                if not success:
-                    self.logger.warn('Write failed, retrying')
-                    if attempts > max_attempts:
-                        self.logger.warn('Giving up!')
-                        return False
-                    # time.sleep(1.0)
+        datalist = [int(''.join(data_bytes[x*4:x*4+4]), 16) for x in range(offset, nblocks)]
+        try:
+            self.eeprom_write_multiple_block(uid, offset, datalist)
+        except StandardError as e:
+            self.logger.warning('Giving up! %s', e)
+            return False
         return True
 
     def erase_card(self, uid):
-        data_bytes = ['00' for x in range(32)]
-        return self.write_blocks_to_card(uid, data_bytes)
+        try:
+            self.erase(uid, 0, 8)
+        except StandardError as e:
+            self.logger.warning('Erase failed: %s', e)
+            return False
+        return True
+
+    def block_spans(self, blocknos):
+        """ Group sorted block numbers in [first, last] spans read at once,
+            blocks closer than DEFAULT_READ_CHUNK are read together """
+        spans = []
+        for blockno in blocknos:
+            if spans and blockno - spans[-1][1] <= self.DEFAULT_READ_CHUNK:
+                spans[-1][1] = blockno
+            else:
+                spans.append([blockno, blockno])
+        return spans
+
+    def write_buffer(self, uid):
+        """ WriteBuffer staging byte level updates of uid """
+        return WriteBuffer(self, uid)
+
+    def erase(self, uid, start=0, end=None, fill=0x00):
+        """ Fill blocks [start, end[ with fill byte, end defaults to tag
+            size. Range is read in bulk and only blocks not already blank
+            are written, then verified in bulk. Return written blocks count. """
+        if self.registry is not None:
+            block_count, block_size = self.registry.geometry(uid)
+        else:
+            info = self.eeprom_get_tag_info(uid)
+            if info is None:
+                raise StandardError(f"Can't get memory size of {uid}")
+            block_count, block_size = info.block_count, info.block_size
+        end = block_count if end is None else end
+        if end is None:
+            raise StandardError(f"Can't get memory size of {uid}")
+        block_size = block_size or 4
+        if end <= start:
+            return 0
+        blank = bytes([fill]) * block_size
+        current = self.eeprom_read_range(uid, start, end - start, block_size=block_size)
+        if current is None:
+            raise StandardError(f"Can't read blocks {start} to {end - 1} of {uid}")
+        dirty = [blockno for blockno, value in current.blocks() if value != blank]
+        self.logger.debug("Erase %s: %d of %d blocks to write", uid, len(dirty), end - start)
+        if len(dirty) == 0:
+            return 0
+        with self.retry_policy.operation(uid):
+            for blockno in dirty:
+                self.eeprom_write_single_block_retry(uid, blockno, blank.hex().upper(),
+                                                     readback=False)
+        failed = []
+        for first, last in self.block_spans(dirty):
+            check = self.eeprom_read_range(uid, first, last - first + 1, block_size=block_size)
+            if check is None:
+                raise StandardError(f"Can't verify erase of {uid}")
+            failed += [blockno for blockno, value in check.blocks() if value != blank]
+        if failed:
+            raise StandardError("Erase verify failed on blocks {}"
+                                .format(', '.join(str(b) for b in failed)))
+        return len(dirty)
 
     def write_block(self, uid, block_number, data):
         if type(data) != list or len(data) != 4:
             raise StandardError('write_block got data of unknown type/length')
-
-        response = self.issue_iso15693_command(cmd=DLP_CMD["REQUESTCMD"]["code"],
-                                               flags=flagsbyte(address=True),  # 32 (dec) <-> 20 (hex)
-                                               command_code='%02X'%M24LR64ER_CMD["WRITE_SINGLE_BLOCK"]["code"],
-                                               data='%s%02X%s' % (uid, block_number, ''.join(data)))
-        if response[0] == '00':
-            self.logger.debug('Wrote block %d successfully', block_number)
-            return True
-        else:
+        try:
+            self.eeprom_write_single_block_retry(uid, block_number, ''.join(data), readback=False)
+        except TagError as e:
+            self.logger.debug('Write of block %d failed: %s', block_number, e)
             return False
+        self.logger.debug('Wrote block %d successfully', block_number)
+        return True
 
     def unlock_afi(self, uid):
-        self.issue_iso15693_command(cmd=DLP_CMD["REQUESTCMD"]["code"],
-                                    flags=flagsbyte(address=False,
-                                                    high_data_rate=True,
-                                                    option=False),  # 32 (dec) <-> 20 (hex)
-                                    command_code='%02X'%M24LR64ER_CMD["WRITE_AFI"]["code"],
-                                    data='C2')
+        return self.write_afi(uid, self.AFI_CHECKED_OUT)
 
     def lock_afi(self, uid):
-        self.issue_iso15693_command(cmd=DLP_CMD["REQUESTCMD"]["code"],
-                                    flags=flagsbyte(address=False,
-                                                    high_data_rate=False,
-                                                    option=False),  # 32 (dec) <-> 20 (hex)
-                                    command_code='%02X'%M24LR64ER_CMD["WRITE_AFI"]["code"],
-                                    data='07')
+        return self.write_afi(uid, self.AFI_ON_SHELF)
+
+    def write_afi(self, uid, afi):
+        return self._afi_dsfid_command("WRITE_AFI", uid, '%02X' % afi)
+
+    def write_dsfid(self, uid, dsfid):
+        return self._afi_dsfid_command("WRITE_DSFID", uid, '%02X' % dsfid)
+
+    def lock_afi_permanently(self, uid):
+        """ Lock AFI value, it can't be changed anymore """
+        return self._afi_dsfid_command("LOCK_AFI", uid)
+
+    def lock_dsfid_permanently(self, uid):
+        """ Lock DSFID value, it can't be changed anymore """
+        return self._afi_dsfid_command("LOCK_DSFID", uid)
+
+    def _afi_dsfid_command(self, command, uid, data=''):
+        addressing, uiddata = self._addressing(uid)
+        response = self.issue_iso15693_command(cmd=DLP_CMD["REQUESTCMD"]["code"],
+                                    flags=self._flags(**addressing),
+                                    command_code='%02X'%M24LR64ER_CMD[command]["code"],
+                                    data=uiddata + data)
+        if len(response) == 1 and response[0] != '':
+            resp = response[0]
+            if resp[0:2] == '00':
+                return resp
+            raise TagError("Wrong code return {} ({})".format(resp[0:2], resp),
+                           int(resp[2:4], 16) if len(resp) >= 4 else None)
+        return None
+
+    def bulk_write_afi(self, uids, afi, verify=True):
+        """ Write AFI of each tag, return {uid: success} """
+        return self._bulk_apply(uids, lambda uid: self.write_afi(uid, afi),
+                                (lambda info: info.afi == afi) if verify else None)
+
+    def bulk_write_dsfid(self, uids, dsfid, verify=True):
+        """ Write DSFID of each tag, return {uid: success} """
+        return self._bulk_apply(uids, lambda uid: self.write_dsfid(uid, dsfid),
+                                (lambda info: info.dsfid == dsfid) if verify else None)
+
+    def bulk_lock_afi(self, uids):
+        return self._bulk_apply(uids, self.lock_afi_permanently)
+
+    def bulk_lock_dsfid(self, uids):
+        return self._bulk_apply(uids, self.lock_dsfid_permanently)
+
+    def _bulk_apply(self, uids, action, check=None):
+        results = {}
+        for uid in uids:
+            try:
+                success = self.retry_policy.run(uid, action, uid) is not None
+                if success and check is not None:
+                    info = self.eeprom_get_tag_info(uid, protocol_extension=False)
+                    success = info is not None and check(info)
+            except StandardError as e:
+                self.logger.warning("%s: %s", uid, e)
+                success = False
+            results[uid] = success
+        return results
+
+    # NFC Forum Type 2 tag commands (NTAG/Ultralight), sent with NFCT2CMD.
+    # READ gives 16 bytes (4 pages of 4 bytes) from a page number.
+    NFCT2_READ = 0x30
+    NFCT2_WRITE = 0xA2
+    NFCT2_ACK = 0x0A
+    NFCT2_PAGE_SIZE = 4
+
+    def nfct2_read(self, page):
+        """ Read 4 pages from page, as BlockData of 4 bytes blocks """
+        response = self.issue_evm_command(cmd=DLP_CMD["NFCT2CMD"]["code"],
+                                          prms='%02X%02X' % (self.NFCT2_READ, page))
+        return self._nfct2_read_answer(response, page)
+
+    def _nfct2_read_answer(self, response, page):
+        if len(response) == 1 and len(response[0]) == 32:
+            return BlockData.from_hex(response[0], page, self.NFCT2_PAGE_SIZE)
+        return None
+
+    def nfct2_write(self, page, data):
+        """ Write one 4 bytes page """
+        data = bytes(data)
+        if len(data) != self.NFCT2_PAGE_SIZE:
+            raise StandardError("NFC Type 2 write needs 4 bytes")
+        response = self.issue_evm_command(cmd=DLP_CMD["NFCT2CMD"]["code"],
+                prms='%02X%02X' % (self.NFCT2_WRITE, page) + data.hex().upper())
+        return (len(response) == 1 and response[0] != '' and
+                int(response[0][-2:], 16) & 0x0F == self.NFCT2_ACK)
+
+    def nfct2_read_range(self, page, pagenum, depth=4):
+        """ Read pagenum pages, READ commands are pipelined by depth """
+        firsts = list(range(page, page + pagenum, 4))
+        buf = bytearray()
+        for index in range(0, len(firsts), depth):
+            batch = firsts[index:index + depth]
+            answers = self.issue_evm_commands(
+                    [(DLP_CMD["NFCT2CMD"]["code"], '%02X%02X' % (self.NFCT2_READ, first))
+                     for first in batch])
+            for first, response in zip(batch, answers):
+                blocks = self._nfct2_read_answer(response, first)
+                if blocks is None:
+                    return None
+                buf += bytes(blocks)
+        return BlockData(buf[:pagenum * self.NFCT2_PAGE_SIZE], page, self.NFCT2_PAGE_SIZE)
+
+    def nfct2_dump(self, pagenum=None, depth=4):
+        """ Full memory image, size is given by capability container
+            (page 3) if pagenum is not given """
+        if pagenum is None:
+            header = self.nfct2_read(0)
+            if header is None:
+                return None
+            # CC byte 2: data area size / 8, data area begins at page 4
+            pagenum = 4 + bytes(header.block(3))[2] * 8 // self.NFCT2_PAGE_SIZE
+        return self.nfct2_read_range(0, pagenum, depth=depth)
+
+    def nfct2_write_pages(self, page, data, verify=True, uid=None):
+        """ Write data (multiple of 4 bytes) from page, verified with
+            pipelined reads. uid keys retry budget, defaults to the card
+            found by last ISO14443A inventory. """
+        data = bytes(data)
+        if uid is None:
+            uid = self.iso14443A_uid or "NFCT2"
+        if len(data) % self.NFCT2_PAGE_SIZE != 0:
+            raise StandardError("Data length must be a multiple of 4 bytes")
+        pagenum = len(data) // self.NFCT2_PAGE_SIZE
+        with self.retry_policy.operation(uid):
+            for index in range(pagenum):
+                chunk = data[index * self.NFCT2_PAGE_SIZE:(index + 1) * self.NFCT2_PAGE_SIZE]
+                try:
+                    self.retry_policy.run(uid, self.nfct2_write, page + index, chunk)
+                except TagError as e:
+                    raise WriteInterrupted(f"NFC Type 2 write error on page {page + index}: {e}",
+                                           uid, page + index, index,
+                                           data[index * self.NFCT2_PAGE_SIZE:])
+        if verify:
+            blocks = self.nfct2_read_range(page, pagenum)
+            if blocks is None or bytes(blocks) != data:
+                raise StandardError(f"NFC Type 2 verify error on pages {page} to {page + pagenum - 1}")
+        return pagenum
 
     def issue_evm_command(self, cmd, prms='', get_full_response=False):
-        # The EVM protocol has a general form as shown below:
-        #  1. SOF (Start of File): 0x01
-        #  2. LENGTH : Two bytes define the number of bytes in the frame including SOF. Least Significant Byte first!
-        #  3. READER_TYPE : 0x03
-        #  4. ENTITY : 0x04
-        #  5. CMD : The command
-        #  6. PRMS : Parameters
-        #  7. EOF : 0x0000
-
-        # Two-digit hex strings (without 0x prefix)
-        sof = '01'
-        reader_type = '03'
-        entity = '04'
-        eof = '0000'
-
-        result = reader_type + entity + cmd + prms + eof
-
-        length = int(len(result)/2) + 3  # Number of *bytes*, + 3 to include SOF and LENGTH
-        length = '%04X' % length  # Convert int to hex
-        length = binascii.unhexlify(length)[::-1]  # Reverse hex string to get LSB first
-        length = binascii.hexlify(length).decode('ascii')
-
-        result = sof + length + result
-        self.write(result.upper())
-        response = self.read()
-        if get_full_response:
-            return response
-        else:
-            return self.get_response(response)
+        span = no_span if self.tracer is None else self.tracer.span
+        key = self.timeouts.key(cmd, prms)
+        timeout = self.timeouts.timeout(key)
+        with span("issue_evm_command", command=key):
+            with span("write"):
+                # Late bytes of a previous answer must not be taken for this one
+                self.sp.reset_input_buffer()
+                self.write(evm_frame(cmd, prms))
+            start = time.monotonic()
+            with span("wait", timeout=timeout):
+                if timeout is None:
+                    # Still learning: wait for the line to be silent
+                    response, last = self.read_answer(start, 0, self.timeouts.default)
+                else:
+                    response, last = self.read_answer(start, timeout, self.timeouts.idle)
+            if len(response) == 0:
+                if timeout is not None and key not in self.timeouts.overrides:
+                    self.timeouts.missed(key)
+            elif self.incomplete(response):
+                # Cut answer: timeout too short, latency is unknown
+                self.logger.debug("Incomplete answer to %s", key)
+                if key not in self.timeouts.overrides:
+                    self.timeouts.missed(key)
+            else:
+                self.timeouts.record(key, last - start)
+            if get_full_response:
+                return response
+            with span("parse"):
+                return self.get_response(response)
+
+    def issue_evm_commands(self, commands, repeatable=True):
+        """ Pipeline [(cmd, prms), ...]: all frames are sent before reading
+            answers, that are waited for once, as long as the sum of the
+            commands timeouts. Commands must give one answer each, if
+            answers can't be matched with commands (a silent tag gives no
+            answer) they are issued again one by one. Commands that must
+            not be sent twice (writes) are given with repeatable False:
+            they get empty answer lists instead. Return list of answer
+            lists. """
+        span = no_span if self.tracer is None else self.tracer.span
+        timeouts = [self.timeouts.timeout(self.timeouts.key(cmd, prms))
+                    for cmd, prms in commands]
+        with span("write", commands=len(commands)):
+            # Late bytes of a previous answer must not be taken for these
+            self.sp.reset_input_buffer()
+            for cmd, prms in commands:
+                self.write(evm_frame(cmd, prms))
+        start = time.monotonic()
+        with span("wait"):
+            if None in timeouts:
+                # Still learning: wait for the line to be silent
+                raw, _ = self.read_answer(start, 0, self.timeouts.default)
+            else:
+                raw, _ = self.read_answer(start, sum(timeouts), self.timeouts.idle)
+        with span("parse"):
+            response = self.get_response(raw)
+        if len(response) == len(commands):
+            return [[resp] for resp in response]
+        self.logger.debug("Pipeline got %d answers for %d commands",
+                          len(response), len(commands))
+        if not repeatable:
+            return [[] for _ in commands]
+        return [self.issue_evm_command(cmd, prms) for cmd, prms in commands]
 
     def issue_iso15693_command(self, cmd, flags='', command_code='', data=''):
         return self.issue_evm_command(cmd, flags + command_code + data)
@@ -527,8 +1302,39 @@ class PyDlpRfid2(object):
         self.logger.debug('RETR%3d: ' % (len(msg)/2) + colored(pprint.saferepr(msg).strip("'"), 'cyan'))
         return msg
 
+    @staticmethod
+    def incomplete(msg):
+        """ True if msg ends inside a bracketed answer """
+        return msg.rfind(b'[') > msg.rfind(b']')
+
+    def read_answer(self, start, timeout, idle):
+        """ Read until timeout after start and line silent for idle seconds,
+            return (answer, time of last byte). A started bracketed answer
+            is waited for up to max_timeout of timeout profile. """
+        deadline = start + timeout
+        limit = start + max(timeout, self.timeouts.max_timeout)
+        msg = bytearray()
+        last = start
+        while True:
+            waiting = self.sp.in_waiting
+            now = time.monotonic()
+            if waiting:
+                msg += self.sp.read(waiting)
+                last = now
+            elif (now >= deadline and now - last >= idle
+                    and (now >= limit or not self.incomplete(msg))):
+                break
+            else:
+                time.sleep(self.POLL_INTERVAL)
+        msg = bytes(msg)
+        self.logger.debug('RETR%3d: ' % (len(msg)/2) + colored(pprint.saferepr(msg).strip("'"), 'cyan'))
+        return msg, last
+
     def get_response(self, response):
         return re.findall(r'\[(.*?)\]', response.decode('ascii'))
 
     def close(self):
+        self.timeouts.save()
+        if self.registry is not None:
+            self.registry.close()
         self.sp.close()
@@ -0,0 +1,200 @@
+# -*- coding: utf-8; tab-width: 4; indent-tabs-mode: nil; c-basic-offset: 4 -*-
+# vim:fenc=utf-8:et:sw=4:ts=4:sts=4:tw=0
+#
+# Tag capabilities registry
+#
+# Remember tag geometry (number and size of blocks), supported fast commands
+# and best Read Multiple Block chunk, so that tools don't have to hard-code
+# M24LR64 values or query Get System Info before each access.
+#
+# ISO15693 UIDs are E0 <manufacturer code> <IC code> ... For ST the IC code
+# byte is the IC reference, then all tags with same prefix share the same
+# capabilities and only the first one of a batch is queried. Such tags are
+# not stored by UID, only tags whose IC can't be told from UID are.
+#
+# Changes are saved by batches of SAVE_BATCH, and by close().
+
+import os
+import json
+import logging
+
+from .pydlprfid2 import M24LR64ER_CMD, DLP_CMD, StandardError
+
+
+class TagCapabilities(object):
+    __slots__ = ('ic_reference', 'block_count', 'block_size',
+                 'fast_commands', 'read_chunk')
+
+    def __init__(self, ic_reference=None, block_count=None, block_size=None,
+                 fast_commands=None, read_chunk=None):
+        self.ic_reference = ic_reference
+        self.block_count = block_count
+        self.block_size = block_size
+        self.fast_commands = fast_commands  # None: not probed yet
+        self.read_chunk = read_chunk        # None: not probed yet
+
+    @property
+    def memory_size(self):
+        if self.block_count is None or self.block_size is None:
+            return None
+        return self.block_count * self.block_size
+
+    def to_dict(self):
+        return {name: getattr(self, name) for name in self.__slots__}
+
+    @classmethod
+    def from_dict(cls, values):
+        return cls(**{name: values.get(name) for name in cls.__slots__})
+
+    def __repr__(self):
+        return ("TagCapabilities(ic_ref={}, blocks={}x{}, fast={}, chunk={})"
+                .format(self.ic_reference, self.block_count, self.block_size,
+                        self.fast_commands, self.read_chunk))
+
+
+class TagRegistry(object):
+    """ Cache of tag capabilities keyed by UID and IC reference,
+        optionally persisted in a json file """
+
+    # Read Multiple Block sizes tried, biggest first
+    PROBE_CHUNKS = (32, 16, 8, 4, 2, 1)
+    FAST_COMMANDS = ("FAST_READ_SINGLE_BLOCK", "FAST_READ_MULT_BLOCK")
+    # Changes kept in memory before file is rewritten
+    SAVE_BATCH = 16
+
+    def __init__(self, reader, path=None):
+        self.reader = reader
+        self.path = path
+        self.logger = logging.getLogger(__name__)
+        self.by_uid = {}
+        self.by_ic = {}
+        self.dirty = 0
+        if path is not None and os.path.exists(path):
+            self.load()
+
+    @staticmethod
+    def ic_key(uid):
+        """ Manufacturer code + IC code bytes of UID """
+        return uid[2:6].upper()
+
+    def load(self):
+        with open(self.path, 'r') as fd:
+            store = json.load(fd)
+        self.by_uid = {uid: TagCapabilities.from_dict(caps)
+                       for uid, caps in store.get("uids", {}).items()}
+        self.by_ic = {key: TagCapabilities.from_dict(caps)
+                      for key, caps in store.get("ic", {}).items()}
+
+    def save(self):
+        self.dirty = 0
+        if self.path is None:
+            return
+        store = {"uids": {uid: caps.to_dict() for uid, caps in self.by_uid.items()},
+                 "ic": {key: caps.to_dict() for key, caps in self.by_ic.items()}}
+        tmppath = self.path + ".tmp"
+        with open(tmppath, 'w') as fd:
+            json.dump(store, fd, indent=1, sort_keys=True)
+        os.replace(tmppath, self.path)
+
+    def _changed(self):
+        self.dirty += 1
+        if self.dirty >= self.SAVE_BATCH:
+            self.save()
+
+    def close(self):
+        """ Save pending changes """
+        if self.dirty:
+            self.save()
+
+    def forget(self, uid):
+        if self.by_uid.pop(uid.upper(), None) is not None:
+            self._changed()
+
+    def get(self, uid):
+        """ Return capabilities of tag, Get System Info is only issued for
+            unknown UID of unknown IC reference """
+        uid = uid.upper()
+        caps = self.by_uid.get(uid)
+        if caps is not None:
+            return caps
+        caps = self.by_ic.get(self.ic_key(uid))
+        if caps is not None:
+            return caps
+        try:
+            info = self.reader.eeprom_get_tag_info(uid)
+        except StandardError as e:
+            # not all tags accept protocol extension flag
+            self.logger.debug("Extended system info refused by %s (%s)", uid, e)
+            info = self.reader.eeprom_get_tag_info(uid, protocol_extension=False)
+        if info is None:
+            raise StandardError(f"No system info answer from {uid}")
+        caps = TagCapabilities(info.ic_reference, info.block_count, info.block_size)
+        if (info.ic_reference is not None and
+                '%02X' % info.ic_reference == self.ic_key(uid)[2:]):
+            self.by_ic[self.ic_key(uid)] = caps
+        else:
+            self.by_uid[uid] = caps
+        self._changed()
+        return caps
+
+    def geometry(self, uid):
+        """ (block_count, block_size) of tag """
+        caps = self.get(uid)
+        return caps.block_count, caps.block_size
+
+    def read_chunk(self, uid):
+        """ Best number of blocks per Read Multiple Block """
+        caps = self.get(uid)
+        if caps.read_chunk is None:
+            self.probe_read_chunk(uid)
+        return caps.read_chunk
+
+    def record_read_chunk(self, uid, chunk):
+        uid = uid.upper()
+        caps = self.get(uid)
+        if caps.read_chunk != chunk:
+            caps.read_chunk = chunk
+            iccaps = self.by_ic.get(self.ic_key(uid))
+            if iccaps is not None:
+                iccaps.read_chunk = chunk
+            self._changed()
+
+    def probe_read_chunk(self, uid):
+        caps = self.get(uid)
+        for chunk in self.PROBE_CHUNKS:
+            if caps.block_count is not None and chunk > caps.block_count:
+                continue
+            try:
+                blocks = self.reader.eeprom_read_multiple_block_data(uid, chunk, 0)
+            except StandardError:
+                blocks = None
+            if blocks is not None and len(blocks) == chunk * (caps.block_size or 4):
+                self.logger.debug("Read chunk for %s: %d blocks", uid, chunk)
+                self.record_read_chunk(uid, chunk)
+                return chunk
+        raise StandardError(f"No Read Multiple Block size works with {uid}")
+
+    def supports(self, uid, command):
+        caps = self.get(uid)
+        if caps.fast_commands is None:
+            self.probe_fast_commands(uid)
+        return command in caps.fast_commands
+
+    def probe_fast_commands(self, uid):
+        """ Try ST custom fast read commands on block 0 """
+        caps = self.get(uid)
+        params = {"FAST_READ_SINGLE_BLOCK": '0000',
+                  "FAST_READ_MULT_BLOCK": '000000'}
+        supported = []
+        addressing, uiddata = self.reader._addressing(uid)
+        for command in self.FAST_COMMANDS:
+            response = self.reader.issue_iso15693_command(
+                    cmd=DLP_CMD["REQUESTCMD"]["code"],
+                    flags=self.reader._flags(protocol_extension=True, **addressing),
+                    command_code='%02X' % M24LR64ER_CMD[command]["code"],
+                    data=uid[2:4] + uiddata + params[command])
+            if len(response) == 1 and response[0][0:2] == '00':
+                supported.append(command)
+        caps.fast_commands = supported
+        self._changed()
+        return supported
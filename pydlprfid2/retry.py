@@ -0,0 +1,149 @@
+# -*- coding: utf-8; tab-width: 4; indent-tabs-mode: nil; c-basic-offset: 4 -*-
+# vim:fenc=utf-8:et:sw=4:ts=4:sts=4:tw=0
+#
+# Retry policy for tag writes
+#
+# Each failure is classified by its ISO15693 error code (None when the tag
+# did not answer, TagError.VERIFY when read back differs) and either
+# retried after an exponential backoff with jitter, or failed at once.
+# A per-tag budget bounds the total number of retries spent on one tag by
+# one operation (multiple block write, erase, flush...), it is given back
+# when next operation on the tag starts. A write done out of any operation
+# is an operation of its own.
+#
+#   with policy.operation(uid):
+#       for blockno, data in blocks:
+#           policy.run(uid, write, uid, blockno, data)
+
+import time
+import random
+import logging
+import contextlib
+import collections
+
+from .errors import TagError
+
+RETRY = "retry"
+FAIL = "fail"
+
+# ISO15693-3 error codes, §7.4.2
+ISO15693_ERRORS = {
+    0x01: "Command not supported",
+    0x02: "Command not recognized",
+    0x03: "Option not supported",
+    0x0F: "Unknown error",
+    0x10: "Block not available",
+    0x11: "Block already locked",
+    0x12: "Block locked, content can't be changed",
+    0x13: "Block not successfully programmed",
+    0x14: "Block not successfully locked",
+}
+
+
+class RetryPolicy(object):
+
+    DEFAULT_DECISIONS = {
+        None: RETRY,          # no answer: coupling
+        TagError.VERIFY: RETRY,
+        0x0F: RETRY,
+        0x13: RETRY,
+        0x14: RETRY,
+        0x01: FAIL,
+        0x02: FAIL,
+        0x03: FAIL,
+        0x10: FAIL,
+        0x11: FAIL,
+        0x12: FAIL,
+    }
+
+    def __init__(self, max_attempts=10, base_delay=0.005, max_delay=0.2,
+                 jitter=0.5, tag_budget=50, decisions=None, max_tags=1024):
+        """ max_attempts: tries per write, tag_budget: retries allowed per
+            tag by one operation (or until reset() out of operations),
+            decisions: {error code: RETRY|FAIL} overriding defaults,
+            unknown codes are retried, max_tags: tags whose retries are
+            remembered, least recently retried are forgotten """
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.jitter = jitter
+        self.tag_budget = tag_budget
+        self.decisions = dict(self.DEFAULT_DECISIONS)
+        if decisions is not None:
+            self.decisions.update(decisions)
+        self.max_tags = max_tags
+        self.retries = collections.OrderedDict()
+        self.active = {}        # uid -> depth of nested operations
+        self.logger = logging.getLogger(__name__)
+
+    def decide(self, code):
+        return self.decisions.get(code, RETRY)
+
+    def delay(self, attempt):
+        """ Backoff before try attempt + 1 """
+        delay = min(self.max_delay, self.base_delay * (2 ** (attempt - 1)))
+        return delay * (1 - self.jitter * random.random())
+
+    def budget(self, uid):
+        """ Retries left for uid """
+        if self.tag_budget is None:
+            return None
+        return self.tag_budget - self.retries.get(uid, 0)
+
+    def reset(self, uid=None):
+        if uid is None:
+            self.retries.clear()
+        else:
+            self.retries.pop(uid, None)
+
+    @contextlib.contextmanager
+    def operation(self, uid):
+        """ Give uid its whole budget for the operation run in this
+            context, nested operations share outermost one's budget """
+        depth = self.active.get(uid, 0)
+        if depth == 0:
+            self.reset(uid)
+        self.active[uid] = depth + 1
+        try:
+            yield self
+        finally:
+            if depth == 0:
+                del self.active[uid]
+                self.reset(uid)
+            else:
+                self.active[uid] = depth
+
+    def _spend(self, uid):
+        self.retries[uid] = self.retries.pop(uid, 0) + 1
+        while len(self.retries) > self.max_tags:
+            self.retries.popitem(last=False)
+
+    def run(self, uid, function, *args, **kwargs):
+        """ Call function until it returns a result that is neither None
+            nor False, raise last TagError when giving up """
+        with self.operation(uid):
+            return self._run(uid, function, *args, **kwargs)
+
+    def _run(self, uid, function, *args, **kwargs):
+        attempt = 0
+        while True:
+            attempt += 1
+            try:
+                result = function(*args, **kwargs)
+                if result is not None and result is not False:
+                    return result
+                error = TagError("No answer from {}".format(uid))
+            except TagError as e:
+                error = e
+            if self.decide(error.code) == FAIL:
+                raise error
+            if attempt >= self.max_attempts:
+                self.logger.warning("Giving up after %d attempts on %s: %s", attempt, uid, error)
+                raise error
+            budget = self.budget(uid)
+            if budget is not None and budget <= 0:
+                self.logger.warning("Retry budget of %s exhausted: %s", uid, error)
+                raise error
+            self._spend(uid)
+            self.logger.debug("Attempt %d on %s failed (%s), retrying", attempt, uid, error)
+            time.sleep(self.delay(attempt))
@@ -0,0 +1,69 @@
+# -*- coding: utf-8; tab-width: 4; indent-tabs-mode: nil; c-basic-offset: 4 -*-
+# vim:fenc=utf-8:et:sw=4:ts=4:sts=4:tw=0
+#
+# Multi-protocol inventory scan loop
+#
+# Reader is fully configured once, then protocols are switched by writing
+# the ISO control register only (PyDlpRfid2.switch_protocol()). Each round
+# begins with the protocol of the end of previous round, so one switch is
+# saved per round.
+
+import time
+import logging
+
+from .pydlprfid2 import ISO15693, ISO14443A, StandardError
+
+
+class MultiProtocolScanner(object):
+    """ Scan tags of several protocols, dwell gives the number of
+        inventories done in a row for each protocol """
+
+    # Protocols with an inventory implementation
+    SCAN_PROTOCOLS = (ISO15693, ISO14443A)
+    # ISO14443A cards are halted by inventory, wake them up on next one
+    INVENTORY_KWARGS = {ISO14443A: {"wakeup": True}}
+
+    def __init__(self, reader, protocols=(ISO15693, ISO14443A), dwell=None):
+        for protocol in protocols:
+            if protocol not in self.SCAN_PROTOCOLS:
+                raise StandardError(f"No inventory for protocol {protocol}")
+        self.reader = reader
+        self.protocols = list(protocols)
+        self.dwell = {protocol: 1 for protocol in self.protocols}
+        if dwell is not None:
+            self.dwell.update(dwell)
+        self.logger = logging.getLogger(__name__)
+        self.switches = 0
+
+    def _round_order(self):
+        """ Protocols order for next round, current protocol first """
+        if self.reader.protocol in self.protocols:
+            index = self.protocols.index(self.reader.protocol)
+            return self.protocols[index:] + self.protocols[:index]
+        return list(self.protocols)
+
+    def scan_once(self):
+        """ One round: {protocol: [InventoryEntry]} without duplicates """
+        found = {}
+        for protocol in self._round_order():
+            if self.reader.protocol != protocol:
+                self.reader.switch_protocol(protocol)
+                self.switches += 1
+            entries = {}
+            for _ in range(self.dwell[protocol]):
+                kwargs = self.INVENTORY_KWARGS.get(protocol, {})
+                for entry in self.reader.inventory_entries(**kwargs):
+                    entries[entry.uid] = entry
+            found[protocol] = list(entries.values())
+        return found
+
+    def run(self, callback, rounds=None, pause=0):
+        """ Call callback(found) after each round, forever if rounds is None
+            or until callback returns False """
+        count = 0
+        while rounds is None or count < rounds:
+            if callback(self.scan_once()) is False:
+                break
+            count += 1
+            if pause > 0:
+                time.sleep(pause)
@@ -0,0 +1,271 @@
+# -*- coding: utf-8; tab-width: 4; indent-tabs-mode: nil; c-basic-offset: 4 -*-
+# vim:fenc=utf-8:et:sw=4:ts=4:sts=4:tw=0
+#
+# Tag state table in shared memory
+#
+# Fixed size array of records keyed by UID (open addressing, linear probing)
+# in a multiprocessing.shared_memory block. Reader processes write it, as a
+# reader sink, other processes (web/API workers) attach it by name and read
+# it directly, without IPC.
+#
+# Each record is protected by a sequence counter: writer makes it odd while
+# updating the record, readers retry if it is odd or changed during copy.
+# Readers never lock. Several writer processes must share a lock
+# (multiprocessing.Lock) for inserts not to race.
+#
+#   # reader process
+#   table = TagStateTable("tags", create=True, reader_index=0, lock=lock)
+#   reader.add_sink(table)
+#   # web process
+#   table = TagStateTable("tags")
+#   table.get("E0025E167B532A87")
+#
+# Records are never removed: tags leaving are only marked absent. A tag is
+# marked absent when an inventory round of the protocol that saw it does
+# not see it anymore. When a round is made of several inventories (several
+# antennas, AFI filters), give auto_round=False and call end_round() once
+# the whole round is done.
+
+import sys
+import time
+import struct
+import contextlib
+
+from .errors import StandardError
+
+MAGIC = b"DLPT"
+# magic, capacity, header size, record size
+TABLE_HEADER = struct.Struct("<4sIII")
+# sequence, uid, flags, header length, rssi, reader index, last seen
+RECORD = struct.Struct("<I8sBBhHd")
+USED = 0x01
+PRESENT = 0x02
+NO_RSSI = -1
+
+# Blocks created by this process, registered to its resource tracker
+_created = set()
+
+
+class TagState(object):
+    """ Snapshot of one record """
+    __slots__ = ('uid', 'present', 'rssi', 'reader', 'last_seen', 'header')
+
+    def __init__(self, uid, present, rssi, reader, last_seen, header):
+        self.uid = uid
+        self.present = present
+        self.rssi = rssi
+        self.reader = reader
+        self.last_seen = last_seen
+        self.header = header
+
+    @property
+    def uid_hex(self):
+        return self.uid.hex().upper()
+
+    def __repr__(self):
+        return ("TagState({}, present={}, rssi={}, reader={}, last_seen={})"
+                .format(self.uid_hex, self.present, self.rssi, self.reader,
+                        self.last_seen))
+
+
+class TagStateTable(object):
+    """ name: shared memory block name, None to create an anonymous one
+        create: create block (writer side), else attach existing one
+        reader_index: reader id written by this process
+        header_size: bytes of block 0 onward cached per tag
+        auto_round: each inventory is a complete round, see end_round() """
+
+    # Reads of a record being updated are retried READ_ATTEMPTS times,
+    # READ_DELAY seconds apart
+    READ_ATTEMPTS = 1000
+    READ_DELAY = 0.0001
+
+    def __init__(self, name=None, create=False, capacity=4096, header_size=32,
+                 reader_index=0, lock=None, auto_round=True):
+        self.reader_index = reader_index
+        self.lock = lock
+        self.auto_round = auto_round
+        self.present = {}       # protocol -> UIDs marked present by this process
+        self.round_seen = {}    # protocol -> UIDs seen during current round
+        if create or name is None:
+            self.header_size = header_size
+            self.record_size = (RECORD.size + header_size + 7) & ~7
+            self.capacity = capacity
+            # imported here: needs python 3.8
+            from multiprocessing import shared_memory
+            self.shm = shared_memory.SharedMemory(
+                    name=name, create=True,
+                    size=TABLE_HEADER.size + capacity * self.record_size)
+            self.shm.buf[:TABLE_HEADER.size] = TABLE_HEADER.pack(
+                    MAGIC, capacity, header_size, self.record_size)
+            _created.add(self.shm._name)
+        else:
+            self.shm = self._attach(name)
+            (magic, self.capacity, self.header_size,
+             self.record_size) = TABLE_HEADER.unpack_from(self.shm.buf, 0)
+            if magic != MAGIC:
+                self.shm.close()
+                raise StandardError(f"{name} is not a tag state table")
+        self.buf = self.shm.buf
+
+    @staticmethod
+    def _attach(name):
+        """ Attach existing block without letting this process's resource
+            tracker unlink it when the process exits """
+        from multiprocessing import shared_memory, resource_tracker
+        if sys.version_info >= (3, 13):
+            return shared_memory.SharedMemory(name=name, track=False)
+        shm = shared_memory.SharedMemory(name=name)
+        if shm._name not in _created:
+            resource_tracker.unregister(shm._name, "shared_memory")
+        return shm
+
+    @property
+    def name(self):
+        return self.shm.name
+
+    def close(self):
+        self.buf = None
+        self.shm.close()
+
+    def unlink(self):
+        """ Destroy shared memory block, once all processes are done """
+        self.shm.unlink()
+        _created.discard(self.shm._name)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    @staticmethod
+    def _uid(uid):
+        """ UID as 8 bytes, shorter ISO14443A UIDs are padded with zeros """
+        uid = bytes.fromhex(uid) if isinstance(uid, str) else bytes(uid)
+        return uid.ljust(8, b'\0')
+
+    def _offset(self, index):
+        return TABLE_HEADER.size + index * self.record_size
+
+    def _read(self, index):
+        """ Consistent copy of record (header, payload), retried while a
+            writer updates it. A record that stays busy was left by a
+            writer dying while updating it. """
+        offset = self._offset(index)
+        for attempt in range(self.READ_ATTEMPTS):
+            seq = struct.unpack_from("<I", self.buf, offset)[0]
+            if not seq & 1:
+                raw = bytes(self.buf[offset:offset + self.record_size])
+                if struct.unpack_from("<I", self.buf, offset)[0] == seq:
+                    return RECORD.unpack_from(raw), raw[RECORD.size:]
+            time.sleep(self.READ_DELAY)
+        raise StandardError(f"Record {index} of tag state table stays busy")
+
+    def _find(self, uid, insert=False):
+        """ Index of uid record, or of free slot for it with insert """
+        start = int.from_bytes(uid, 'big') % self.capacity
+        for probe in range(self.capacity):
+            index = (start + probe) % self.capacity
+            (_, record_uid, flags, _, _, _, _), _ = self._read(index)
+            if not flags & USED:
+                return index if insert else None
+            if record_uid == uid:
+                return index
+        if insert:
+            raise StandardError(f"Tag state table full ({self.capacity} tags)")
+        return None
+
+    def _locked(self):
+        return self.lock if self.lock is not None else contextlib.nullcontext()
+
+    # Writer side
+
+    def update(self, uid, rssi=None, seen=None, present=True, header=None):
+        """ Write uid record, header None keeps cached one, present None
+            keeps presence """
+        uid = self._uid(uid)
+        with self._locked():
+            index = self._find(uid, insert=True)
+            offset = self._offset(index)
+            seq = struct.unpack_from("<I", self.buf, offset)[0]
+            struct.pack_into("<I", self.buf, offset, seq + 1)
+            (_, _, flags, header_len, old_rssi, reader,
+             last_seen) = RECORD.unpack_from(self.buf, offset)
+            if rssi is not None:
+                old_rssi = rssi
+            elif not flags & USED:
+                old_rssi = NO_RSSI
+            if present is None:
+                flags = USED | (flags & PRESENT)
+            else:
+                flags = USED | (PRESENT if present else 0)
+            if seen is not None:
+                last_seen = seen
+                reader = self.reader_index
+            if header is not None:
+                header = bytes(header[:self.header_size])
+                header_len = len(header)
+                self.buf[offset + RECORD.size:offset + RECORD.size + header_len] = header
+            RECORD.pack_into(self.buf, offset, seq + 1, uid, flags, header_len,
+                             old_rssi, reader, last_seen)
+            struct.pack_into("<I", self.buf, offset, seq + 2)
+
+    def mark_absent(self, uid):
+        uid = self._uid(uid)
+        if self._find(uid) is not None:
+            self.update(uid, present=False)
+
+    # Reader sink interface
+
+    def on_inventory(self, reader_id, protocol, entries):
+        now = time.time()
+        seen = self.round_seen.setdefault(protocol, set())
+        present = self.present.setdefault(protocol, set())
+        for entry in entries:
+            uid = self._uid(entry.uid)
+            seen.add(uid)
+            present.add(uid)
+            self.update(uid, entry.rssi, now)
+        if self.auto_round:
+            self.end_round(protocol)
+
+    def end_round(self, protocol=None):
+        """ Mark absent tags of protocol (all protocols by default) not seen
+            since previous end of round """
+        protocols = list(self.present) if protocol is None else [protocol]
+        for name in protocols:
+            present = self.present.get(name, set())
+            gone = present - self.round_seen.get(name, set())
+            for uid in gone:
+                self.update(uid, present=False)
+            present -= gone
+            self.round_seen[name] = set()
+
+    def on_tag_data(self, reader_id, uid, blocks):
+        if blocks.offset == 0:
+            self.update(uid, header=bytes(blocks), present=None)
+
+    # Reader side, lock free
+
+    def get(self, uid):
+        """ TagState of uid, None if never seen """
+        uid = self._uid(uid)
+        index = self._find(uid)
+        if index is None:
+            return None
+        return self._state(index)
+
+    def _state(self, index):
+        (_, uid, flags, header_len, rssi, reader, last_seen), payload = self._read(index)
+        return TagState(uid, bool(flags & PRESENT), None if rssi == NO_RSSI else rssi,
+                        reader, last_seen, payload[:header_len])
+
+    def __iter__(self):
+        """ States of all tags ever seen """
+        for index in range(self.capacity):
+            if self.buf[self._offset(index) + 12] & USED:
+                yield self._state(index)
+
+    def present_tags(self):
+        return [state for state in self if state.present]
@@ -0,0 +1,301 @@
+# -*- coding: utf-8; tab-width: 4; indent-tabs-mode: nil; c-basic-offset: 4 -*-
+# vim:fenc=utf-8:et:sw=4:ts=4:sts=4:tw=0
+#
+# Compact result objects returned by the typed reader API.
+#
+# All classes use __slots__ and keep binary values as bytes/int instead of
+# hex strings, so that keeping state for thousands of tags stays cheap. The
+# hex string API of PyDlpRfid2 is built on top of them.
+
+
+class InventoryEntry(object):
+    """ One tag seen by an inventory: UID (MSB first) and RSSI """
+    __slots__ = ('uid', 'rssi')
+
+    def __init__(self, uid, rssi=None):
+        self.uid = bytes(uid)
+        self.rssi = rssi
+
+    @classmethod
+    def from_response(cls, uidstr, rssistr=None):
+        """ Build entry from reader answer, UID is given LSB first """
+        rssi = int(rssistr, 16) if rssistr else None
+        return cls(bytes.fromhex(uidstr)[::-1], rssi)
+
+    @property
+    def uid_hex(self):
+        return self.uid.hex().upper()
+
+    @staticmethod
+    def rssi_level(rssi):
+        """ Signal level 0-7 of a TRF7970A RSSI register byte: strongest of
+            MAIN (b2-b0) and AUX (b5-b3) channels, oscillator flag (b6)
+            left out. None without RSSI """
+        if rssi is None:
+            return None
+        return max(rssi & 0x07, (rssi >> 3) & 0x07)
+
+    @property
+    def level(self):
+        return self.rssi_level(self.rssi)
+
+    def as_tuple(self):
+        """ Compatibility (uid, rssi) hex strings tuple """
+        rssi = None if self.rssi is None else '%02X' % self.rssi
+        return self.uid_hex, rssi
+
+    def __eq__(self, other):
+        if not isinstance(other, InventoryEntry):
+            return NotImplemented
+        return self.uid == other.uid and self.rssi == other.rssi
+
+    def __hash__(self):
+        return hash(self.uid)
+
+    def __repr__(self):
+        return f"InventoryEntry({self.uid_hex}, rssi={self.rssi})"
+
+
+class TagInfo(object):
+    """ Parsed ISO15693 Get System Info answer """
+    __slots__ = ('uid', 'dsfid', 'afi', 'block_count', 'block_size', 'ic_reference')
+
+    # Information flags byte (ISO15693-3 §10.4.12)
+    DSFID_FLAG = 0x01
+    AFI_FLAG = 0x02
+    MEMSIZE_FLAG = 0x04
+    ICREF_FLAG = 0x08
+
+    def __init__(self, uid, dsfid=None, afi=None, block_count=None,
+                 block_size=None, ic_reference=None):
+        self.uid = bytes(uid)
+        self.dsfid = dsfid
+        self.afi = afi
+        self.block_count = block_count
+        self.block_size = block_size
+        self.ic_reference = ic_reference
+
+    @classmethod
+    def from_response(cls, resp, extended=False):
+        """ Parse Get System Info answer (hex string, flags byte included).
+            With protocol extension (M24LR) the number of blocks may be
+            coded on two bytes instead of one, width is told by the
+            remaining answer length: tags ignoring the extension flag give
+            the standard one byte count. """
+        raw = bytes.fromhex(resp)
+        if len(raw) < 10:
+            raise ValueError(f"System info answer too short ({resp})")
+        infoflags = raw[1]
+        info = cls(raw[2:10][::-1])
+        pos = 10
+        try:
+            if infoflags & cls.DSFID_FLAG:
+                info.dsfid = raw[pos]
+                pos += 1
+            if infoflags & cls.AFI_FLAG:
+                info.afi = raw[pos]
+                pos += 1
+            if infoflags & cls.MEMSIZE_FLAG:
+                remaining = len(raw) - pos - (1 if infoflags & cls.ICREF_FLAG else 0)
+                if extended and remaining >= 3:
+                    info.block_count = (raw[pos] | (raw[pos + 1] << 8)) + 1
+                    pos += 2
+                else:
+                    info.block_count = raw[pos] + 1
+                    pos += 1
+                info.block_size = (raw[pos] & 0x1F) + 1
+                pos += 1
+            if infoflags & cls.ICREF_FLAG:
+                info.ic_reference = raw[pos]
+        except IndexError:
+            raise ValueError(f"Truncated system info answer ({resp})")
+        return info
+
+    @property
+    def uid_hex(self):
+        return self.uid.hex().upper()
+
+    @property
+    def memory_size(self):
+        """ Memory size in bytes, None if tag does not give it """
+        if self.block_count is None or self.block_size is None:
+            return None
+        return self.block_count * self.block_size
+
+    def __repr__(self):
+        return ("TagInfo({}, dsfid={}, afi={}, blocks={}x{}, ic_ref={})"
+                .format(self.uid_hex, self.dsfid, self.afi,
+                        self.block_count, self.block_size, self.ic_reference))
+
+
+class BlockData(object):
+    """ Contiguous blocks read from a tag, starting at block number offset.
+        A memoryview given as data is kept as is, other data is copied. """
+    __slots__ = ('offset', 'block_size', '_buf')
+
+    def __init__(self, data, offset=0, block_size=4):
+        self.offset = offset
+        self.block_size = block_size
+        self._buf = data if isinstance(data, memoryview) else bytes(data)
+
+    @classmethod
+    def from_hex(cls, hexstr, offset=0, block_size=4):
+        return cls(bytes.fromhex(hexstr), offset, block_size)
+
+    @property
+    def view(self):
+        """ Zero copy view on the whole buffer """
+        return memoryview(self._buf)
+
+    @property
+    def block_count(self):
+        return len(self._buf) // self.block_size
+
+    def block(self, blockno):
+        """ View on block given by its absolute block number """
+        index = blockno - self.offset
+        if index < 0 or index >= self.block_count:
+            raise IndexError(f"Block {blockno} out of range")
+        start = index * self.block_size
+        return self.view[start:start + self.block_size]
+
+    def blocks(self):
+        """ Iterate over (absolute block number, view) """
+        for index in range(self.block_count):
+            start = index * self.block_size
+            yield self.offset + index, self.view[start:start + self.block_size]
+
+    def hex(self):
+        """ Uppercase hex string, as returned by the string API """
+        return self._buf.hex().upper()
+
+    def __bytes__(self):
+        return bytes(self._buf)
+
+    def __len__(self):
+        return len(self._buf)
+
+    def __getitem__(self, index):
+        return self._buf[index]
+
+    def __eq__(self, other):
+        if isinstance(other, BlockData):
+            return self.offset == other.offset and self._buf == other._buf
+        if isinstance(other, (bytes, bytearray, memoryview)):
+            return self._buf == bytes(other)
+        return NotImplemented
+
+    __hash__ = None
+
+    def __repr__(self):
+        return f"BlockData(offset={self.offset}, {self.hex()})"
+
+
+class BlockSecurity(object):
+    """ Block security status bytes of blocks [offset, offset + len(status)[
+
+        M24LR64E-R sector security status byte:
+          b0    : sector locked
+          b2-b1 : read/write protection, relevant only if sector is locked
+                  00 read free, write with password
+                  01 read and write with password
+                  10 read free, write forbidden
+                  11 read with password, write forbidden
+          b4-b3 : password number controlling the sector (0 for none)
+
+        Protection of a locked sector is lifted once its password is
+        presented, except writes of 10 and 11 sectors. presented gives
+        the password number currently presented to the tag, if any.
+    """
+    __slots__ = ('offset', 'status')
+
+    def __init__(self, status, offset=0):
+        self.offset = offset
+        self.status = bytearray(status)
+
+    def __len__(self):
+        return len(self.status)
+
+    def covers(self, offset, count):
+        return (offset >= self.offset and
+                offset + count <= self.offset + len(self.status))
+
+    def merge(self, other):
+        """ Return security covering both if they overlap or touch, else None """
+        if (other.offset > self.offset + len(self.status) or
+                self.offset > other.offset + len(other.status)):
+            return None
+        start = min(self.offset, other.offset)
+        end = max(self.offset + len(self.status), other.offset + len(other.status))
+        status = bytearray(end - start)
+        status[self.offset - start:self.offset - start + len(self.status)] = self.status
+        status[other.offset - start:other.offset - start + len(other.status)] = other.status
+        return BlockSecurity(status, start)
+
+    def slice(self, offset, count):
+        if not self.covers(offset, count):
+            raise IndexError(f"Blocks {offset} to {offset + count - 1} not covered")
+        start = offset - self.offset
+        return BlockSecurity(self.status[start:start + count], offset)
+
+    def get(self, blockno):
+        index = blockno - self.offset
+        if index < 0 or index >= len(self.status):
+            raise IndexError(f"Block {blockno} out of range")
+        return self.status[index]
+
+    def is_locked(self, blockno):
+        return bool(self.get(blockno) & 0x01)
+
+    def password(self, blockno):
+        """ Number of the password protecting the block, 0 if none """
+        return (self.get(blockno) >> 3) & 0x03
+
+    def access_bits(self, blockno):
+        """ b2-b1 read/write protection bits """
+        return (self.get(blockno) >> 1) & 0x03
+
+    def is_unlocked_by(self, blockno, presented):
+        """ True if presented password gives access to locked block """
+        password_no = self.password(blockno)
+        return password_no != 0 and password_no == presented
+
+    def is_write_forbidden(self, blockno):
+        """ True if no password lifts write protection of block (b2 set) """
+        return self.is_locked(blockno) and bool(self.access_bits(blockno) & 0x02)
+
+    def is_write_protected(self, blockno, presented=None):
+        if not self.is_locked(blockno):
+            return False
+        if self.is_write_forbidden(blockno):
+            return True
+        return not self.is_unlocked_by(blockno, presented)
+
+    def is_read_protected(self, blockno, presented=None):
+        if not self.is_locked(blockno) or self.is_unlocked_by(blockno, presented):
+            return False
+        return bool(self.access_bits(blockno) & 0x01)
+
+    def protected_blocks(self, offset=None, count=None, presented=None):
+        """ List of write protected block numbers """
+        offset = self.offset if offset is None else offset
+        count = len(self.status) - (offset - self.offset) if count is None else count
+        return [blockno for blockno in range(offset, offset + count)
+                if self.is_write_protected(blockno, presented)]
+
+    def runs(self, offset=None, count=None, presented=None):
+        """ Group blocks into (first block, count, write protected) runs """
+        offset = self.offset if offset is None else offset
+        count = len(self.status) - (offset - self.offset) if count is None else count
+        runs = []
+        for blockno in range(offset, offset + count):
+            protected = self.is_write_protected(blockno, presented)
+            if runs and runs[-1][2] == protected:
+                first, num, _ = runs[-1]
+                runs[-1] = (first, num + 1, protected)
+            else:
+                runs.append((blockno, 1, protected))
+        return runs
+
+    def __repr__(self):
+        return f"BlockSecurity(offset={self.offset}, {self.status.hex().upper()})"
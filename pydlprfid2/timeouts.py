@@ -0,0 +1,106 @@
+# -*- coding: utf-8; tab-width: 4; indent-tabs-mode: nil; c-basic-offset: 4 -*-
+# vim:fenc=utf-8:et:sw=4:ts=4:sts=4:tw=0
+#
+# Per command answer timeouts
+#
+# The reader does not tell when an answer is complete, so the serial port
+# used to be read until 0.1 s without data after every command. Instead the
+# time to last byte of answers is recorded per command code, and once enough
+# answers are known the reader waits p99 x margin then stops as soon as the
+# line is idle. LED and register writes then cost a few milliseconds, slow
+# EEPROM accesses get the time they need.
+#
+# Profile can be saved per reader:
+#   reader.timeouts = TimeoutProfile("ttyACM0-timeouts.json")
+#   ... reader.close() saves it
+
+import os
+import json
+import collections
+
+
+class TimeoutProfile(object):
+    """ Learned answer latency per command key
+
+        default: timeout used while learning, same as before (idle time)
+        margin: factor applied to p99 of answers latency
+        idle: once timeout expired, wait until line is silent this long
+        overrides: {key: timeout} fixed timeouts """
+
+    def __init__(self, path=None, default=0.1, margin=1.5, min_timeout=0.005,
+                 max_timeout=1.0, idle=0.005, min_samples=20, history=256,
+                 overrides=None):
+        self.path = path
+        self.default = default
+        self.margin = margin
+        self.min_timeout = min_timeout
+        self.max_timeout = max_timeout
+        self.idle = idle
+        self.min_samples = min_samples
+        self.history = history
+        self.overrides = dict(overrides or {})
+        self.samples = {}
+        self.timeouts = {}
+        if path is not None and os.path.exists(path):
+            self.load()
+
+    @staticmethod
+    def key(cmd, prms=''):
+        """ EVM command code, with ISO15693 command code for raw requests """
+        if cmd == '18' and len(prms) >= 4:
+            return cmd + ':' + prms[2:4].upper()
+        return cmd
+
+    def timeout(self, key):
+        """ Learned timeout for key, None while learning """
+        if key in self.overrides:
+            return self.overrides[key]
+        return self.timeouts.get(key)
+
+    def record(self, key, latency):
+        """ Record time to last byte of an answer """
+        samples = self.samples.get(key)
+        if samples is None:
+            samples = self.samples[key] = collections.deque(maxlen=self.history)
+        samples.append(latency)
+        if len(samples) >= self.min_samples:
+            self.timeouts[key] = self._compute(samples)
+
+    def missed(self, key):
+        """ No answer while learned timeout was used: may have been too
+            short, lengthen it until answers are seen again """
+        timeout = self.timeouts.get(key)
+        if timeout is not None:
+            self.timeouts[key] = min(timeout * 2, self.max_timeout)
+
+    def _compute(self, samples):
+        ordered = sorted(samples)
+        p99 = ordered[int(0.99 * (len(ordered) - 1))]
+        return min(max(p99 * self.margin, self.min_timeout), self.max_timeout)
+
+    def forget(self, key=None):
+        if key is None:
+            self.samples.clear()
+            self.timeouts.clear()
+        else:
+            self.samples.pop(key, None)
+            self.timeouts.pop(key, None)
+
+    def load(self):
+        with open(self.path, 'r') as fd:
+            store = json.load(fd)
+        self.overrides.update(store.get("overrides", {}))
+        for key, samples in store.get("samples", {}).items():
+            self.samples[key] = collections.deque(samples, maxlen=self.history)
+            if len(samples) >= self.min_samples:
+                self.timeouts[key] = self._compute(self.samples[key])
+
+    def save(self):
+        if self.path is None:
+            return
+        store = {"overrides": self.overrides,
+                 "samples": {key: list(samples) for key, samples in self.samples.items()}}
+        tmppath = self.path + ".tmp"
+        with open(tmppath, 'w') as fd:
+            json.dump(store, fd, indent=1, sort_keys=True)
+        os.replace(tmppath, self.path)
@@ -0,0 +1,113 @@
+# -*- coding: utf-8; tab-width: 4; indent-tabs-mode: nil; c-basic-offset: 4 -*-
+# vim:fenc=utf-8:et:sw=4:ts=4:sts=4:tw=0
+#
+# Opt-in timeline tracer
+#
+# Record spans of high level reader operations and of each EVM command with
+# its write/wait/parse phases, and export them in Chrome trace event format
+# (JSON), that opens in Perfetto (ui.perfetto.dev) or chrome://tracing.
+#
+#   tracer = Tracer()
+#   tracer.instrument(reader)
+#   ... provisioning session ...
+#   tracer.export("session.json")
+
+import os
+import json
+import time
+import threading
+import functools
+import contextlib
+
+# Reader methods traced by instrument()
+TRACED_METHODS = (
+    "set_protocol", "init_kit", "configure_rf", "inventory",
+    "inventory_entries", "inventory_iso15693", "inventory_iso14443A",
+    "eeprom_get_system_info", "eeprom_read_single_block",
+    "eeprom_read_multiple_block", "eeprom_read_range", "read_range_many",
+    "eeprom_write_single_block", "eeprom_write_multiple_block",
+    "get_block_security", "erase", "select", "issue_evm_commands",
+)
+
+NULL_SPAN = contextlib.nullcontext()
+
+
+def no_span(name, **args):
+    """ Span of disabled tracer """
+    return NULL_SPAN
+
+
+class Tracer(object):
+    """ Collect complete ("X") trace events, timestamps in microseconds """
+
+    def __init__(self, process_name="pydlprfid2"):
+        self.process_name = process_name
+        self.pid = os.getpid()
+        self.origin = time.perf_counter()
+        self.events = []
+        self.enabled = True
+        self.instrumented = {}
+
+    def now(self):
+        return (time.perf_counter() - self.origin) * 1e6
+
+    @contextlib.contextmanager
+    def span(self, name, **args):
+        if not self.enabled:
+            yield
+            return
+        start = self.now()
+        try:
+            yield
+        finally:
+            event = {"name": name, "ph": "X", "ts": start,
+                     "dur": self.now() - start, "pid": self.pid,
+                     "tid": threading.get_ident()}
+            if args:
+                event["args"] = args
+            self.events.append(event)
+
+    def instant(self, name, **args):
+        event = {"name": name, "ph": "i", "s": "t", "ts": self.now(),
+                 "pid": self.pid, "tid": threading.get_ident()}
+        if args:
+            event["args"] = args
+        self.events.append(event)
+
+    def instrument(self, reader, methods=TRACED_METHODS):
+        """ Trace methods of reader object and its EVM commands """
+        reader.tracer = self
+        for name in methods:
+            method = getattr(reader, name, None)
+            if method is None:
+                continue
+            wrapper = self._wrap(name, method, reader.reader_id)
+            setattr(reader, name, wrapper)
+            self.instrumented.setdefault(id(reader), (reader, []))[1].append(name)
+
+    def _wrap(self, name, method, reader_id):
+        @functools.wraps(method)
+        def traced(*args, **kwargs):
+            with self.span(name, reader=reader_id):
+                return method(*args, **kwargs)
+        return traced
+
+    def uninstrument(self, reader):
+        reader.tracer = None
+        _, names = self.instrumented.pop(id(reader), (None, []))
+        for name in names:
+            delattr(reader, name)
+
+    def clear(self):
+        self.events = []
+        self.origin = time.perf_counter()
+
+    def to_dict(self):
+        metadata = [{"name": "process_name", "ph": "M", "pid": self.pid,
+                     "args": {"name": self.process_name}}]
+        return {"traceEvents": metadata + sorted(self.events, key=lambda e: e["ts"]),
+                "displayTimeUnit": "ms"}
+
+    def export(self, path):
+        with open(path, 'w') as fd:
+            json.dump(self.to_dict(), fd)
@@ -0,0 +1,127 @@
+# -*- coding: utf-8; tab-width: 4; indent-tabs-mode: nil; c-basic-offset: 4 -*-
+# vim:fenc=utf-8:et:sw=4:ts=4:sts=4:tw=0
+#
+# Write-behind buffer
+#
+# Byte level updates of a tag are staged and merged into whole blocks. On
+# flush() blocks only partly updated are read in bulk (read-modify-write),
+# blocks whose content does not change are not written, others are written
+# in address order without readback, then everything is verified with bulk
+# reads.
+#
+#   with reader.write_buffer(uid) as buf:
+#       buf.write(0x10, b"\x01\x02")
+#       buf.write(0x12, b"\x03")
+#       buf.write_block(8, b"ABCD")
+
+from .errors import StandardError
+
+
+class WriteBuffer(object):
+
+    BLOCK_SIZE = 4
+
+    def __init__(self, reader, uid):
+        self.reader = reader
+        self.uid = uid
+        self.block_size = self.BLOCK_SIZE
+        if reader.registry is not None:
+            self.block_size = reader.registry.geometry(uid)[1] or self.BLOCK_SIZE
+        self.staged = {}     # block number -> {index in block: byte}
+        self.written = 0     # blocks written by last flush
+
+    def write(self, address, data):
+        """ Stage data at byte address, later writes win """
+        for index, value in enumerate(bytes(data)):
+            blockno, pos = divmod(address + index, self.block_size)
+            self.staged.setdefault(blockno, {})[pos] = value
+
+    def write_block(self, blockno, data):
+        data = bytes(data)
+        if len(data) != self.block_size:
+            raise StandardError(f"Block data must be {self.block_size} bytes")
+        self.write(blockno * self.block_size, data)
+
+    def pending(self):
+        """ Staged block numbers, in address order """
+        return sorted(self.staged)
+
+    def discard(self):
+        self.staged = {}
+
+    def _read(self, blocknos):
+        """ {block number: bytes} of blocks, read by spans """
+        values = {}
+        for first, last in self.reader.block_spans(blocknos):
+            blocks = self.reader.eeprom_read_range(self.uid, first, last - first + 1,
+                                                   block_size=self.block_size)
+            if blocks is None:
+                raise StandardError(f"Can't read blocks {first} to {last} of {self.uid}")
+            for blockno, value in blocks.blocks():
+                values[blockno] = bytes(value)
+        return values
+
+    def _restage(self, blockno, value):
+        self.staged[blockno] = dict(enumerate(value))
+
+    def flush(self):
+        """ Write staged updates, return number of blocks written. Blocks
+            leave staging once written, blocks that could not be written
+            or verified stay staged, and flush() can be called again to
+            resume. All writes of a flush share the tag retry budget. """
+        with self.reader.retry_policy.operation(self.uid):
+            return self._flush()
+
+    def _flush(self):
+        staged = self.staged
+        blocknos = sorted(staged)
+        partial = [blockno for blockno in blocknos
+                   if len(staged[blockno]) < self.block_size]
+        current = self._read(partial) if partial else {}
+        targets = {}
+        for blockno in blocknos:
+            value = bytearray(current.get(blockno, bytes(self.block_size)))
+            for pos, byte in staged[blockno].items():
+                value[pos] = byte
+            if bytes(value) != current.get(blockno):
+                targets[blockno] = bytes(value)
+            else:
+                del staged[blockno]
+        dirty = sorted(targets)
+        self.reader.logger.debug("Flush %s: %d blocks staged, %d to write",
+                                 self.uid, len(blocknos), len(dirty))
+        self.written = 0
+        for blockno in dirty:
+            self.reader.eeprom_write_single_block_retry(
+                    self.uid, blockno, targets[blockno].hex().upper(), readback=False)
+            del staged[blockno]
+            self.written += 1
+        if not dirty:
+            return self.written
+        # one bulk verify, failed blocks are written again with readback
+        try:
+            check = self._read(dirty)
+        except StandardError:
+            for blockno in dirty:
+                self._restage(blockno, targets[blockno])
+            raise
+        failed = [blockno for blockno in dirty if check.get(blockno) != targets[blockno]]
+        for index, blockno in enumerate(failed):
+            self.reader.logger.warning("Verify failed on block %d of %s, rewrite",
+                                       blockno, self.uid)
+            try:
+                self.reader.eeprom_write_single_block_retry(
+                        self.uid, blockno, targets[blockno].hex().upper())
+            except StandardError:
+                for pending in failed[index:]:
+                    self._restage(pending, targets[pending])
+                raise
+        return self.written
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        # on error staged updates are kept, flush() resumes them
+        if exc_type is None:
+            self.flush()
@@ -0,0 +1,263 @@
+# -*- coding: utf-8; tab-width: 4; indent-tabs-mode: nil; c-basic-offset: 4 -*-
+# vim:fenc=utf-8:et:sw=4:ts=4:sts=4:tw=0
+#
+# asyncio websocket bridge
+#
+# Run inventories on a PyDlpRfid2 reader and stream tag events to websocket
+# clients. Bridge can serve local clients (kiosk frontends) and/or connect to
+# a remote websocket server, reconnecting with bounded backoff.
+#
+# Reader accesses are blocking, they are all run by one worker thread: a
+# write request from a client is simply queued between two inventory rounds,
+# no pause handshake is needed.
+#
+# Each client has its own bounded event queue. Events are coalesced into
+# one {"msg": "tag-events", "events": [...]} message per burst. When a client
+# is too slow, oldest events of its queue are dropped, other clients and the
+# reader are never blocked.
+#
+# Requires websockets package.
+#
+# Messages sent:
+#   {"msg": "hello", "role": "backend"}
+#   {"msg": "tag-events", "events": [{"event": "tag-seen"|"tag-lost",
+#                                     "uid": ..., "rssi": ..., "time": ...}],
+#    "dropped": n}
+#   {"msg": "blocks-read", "uid": ..., "offset": ..., "data": hex}
+#   {"msg": "blocks-written", "uid": ..., "offset": ...}
+#   {"msg": "error", "request": ..., "text": ...}
+#
+# Messages received:
+#   {"msg": "read-blocks", "uid": ..., "offset": n, "count": n}
+#   {"msg": "write-blocks", "uid": ..., "offset": n, "data": ["hex", ...]}
+#   {"msg": "pause"} / {"msg": "resume"}
+
+import json
+import time
+import random
+import asyncio
+import logging
+import concurrent.futures
+
+import websockets
+
+from .pydlprfid2 import ISO15693
+from .errors import StandardError
+
+
+class WsClient(object):
+    """ One websocket peer with its bounded event queue """
+
+    def __init__(self, websocket, max_pending=1000, max_batch=200, coalesce=0.05):
+        self.websocket = websocket
+        self.max_pending = max_pending
+        self.max_batch = max_batch
+        self.coalesce = coalesce
+        self.events = []
+        self.dropped = 0
+        self.ready = asyncio.Event()
+
+    def push(self, events):
+        """ Queue events, dropping oldest ones if client lags """
+        if not events:
+            return
+        self.events.extend(events)
+        overflow = len(self.events) - self.max_pending
+        if overflow > 0:
+            del self.events[:overflow]
+            self.dropped += overflow
+        self.ready.set()
+
+    async def send(self, message):
+        await self.websocket.send(json.dumps(message))
+
+    async def sender(self):
+        while True:
+            await self.ready.wait()
+            # Let burst come in before sending
+            await asyncio.sleep(self.coalesce)
+            batch = self.events[:self.max_batch]
+            del self.events[:self.max_batch]
+            if not self.events:
+                self.ready.clear()
+            message = {"msg": "tag-events", "events": batch}
+            if self.dropped:
+                message["dropped"] = self.dropped
+                self.dropped = 0
+            # Waits while peer does not read, events keep queuing meanwhile
+            await self.send(message)
+
+
+class WsBridge(object):
+    """ reader: PyDlpRfid2, protocol is set if needed
+        interval: pause between inventory rounds (s)
+        lost_rounds: number of rounds a tag must be missing to be lost """
+
+    def __init__(self, reader, protocol=ISO15693, interval=0.2, lost_rounds=2,
+                 max_pending=1000, max_batch=200, coalesce=0.05,
+                 min_backoff=0.5, max_backoff=30.0):
+        self.reader = reader
+        self.protocol = protocol
+        self.interval = interval
+        self.lost_rounds = lost_rounds
+        self.max_pending = max_pending
+        self.max_batch = max_batch
+        self.coalesce = coalesce
+        self.min_backoff = min_backoff
+        self.max_backoff = max_backoff
+        self.logger = logging.getLogger(__name__)
+        self.clients = set()
+        self.present = {}   # uid -> rounds since last seen
+        self.paused = False
+        self.executor = concurrent.futures.ThreadPoolExecutor(max_workers=1)
+
+    async def call(self, function, *args):
+        """ Run reader function in reader thread """
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.executor, function, *args)
+
+    def publish(self, events):
+        for client in self.clients:
+            client.push(events)
+
+    # Inventory loop
+
+    def diff(self, entries):
+        """ Update present tags and return tag-seen/tag-lost events """
+        now = time.time()
+        events = []
+        seen = set()
+        for entry in entries:
+            uid = entry.uid_hex
+            seen.add(uid)
+            if uid not in self.present:
+                events.append({"event": "tag-seen", "uid": uid,
+                               "rssi": entry.rssi, "time": now})
+            self.present[uid] = 0
+        for uid in list(self.present):
+            if uid in seen:
+                continue
+            self.present[uid] += 1
+            if self.present[uid] >= self.lost_rounds:
+                del self.present[uid]
+                events.append({"event": "tag-lost", "uid": uid, "time": now})
+        return events
+
+    async def scan(self):
+        if self.reader.protocol != self.protocol:
+            await self.call(self.reader.set_protocol, self.protocol)
+        while True:
+            if not self.paused:
+                try:
+                    entries = await self.call(self.reader.inventory_entries)
+                except StandardError as e:
+                    self.logger.error("Inventory failed: %s", e)
+                    entries = []
+                events = self.diff(entries)
+                if events:
+                    self.publish(events)
+            await asyncio.sleep(self.interval)
+
+    # Clients
+
+    async def handle(self, websocket):
+        """ Serve one websocket peer until it disconnects """
+        client = WsClient(websocket, self.max_pending, self.max_batch, self.coalesce)
+        await client.send({"msg": "hello", "role": "backend"})
+        # New client gets tags already present
+        now = time.time()
+        client.push([{"event": "tag-seen", "uid": uid, "rssi": None, "time": now}
+                     for uid in self.present])
+        self.clients.add(client)
+        sender = asyncio.ensure_future(client.sender())
+        try:
+            async for message in websocket:
+                await self.request(client, message)
+        except websockets.ConnectionClosed:
+            pass
+        finally:
+            self.clients.discard(client)
+            sender.cancel()
+
+    @staticmethod
+    def _tag_address(message):
+        """ (uid, offset) of a tag request, checked before reaching reader """
+        uid = message["uid"]
+        if (not isinstance(uid, str) or len(uid) != 16 or
+                any(char not in "0123456789abcdefABCDEF" for char in uid)):
+            raise ValueError(f"Bad UID {uid!r}")
+        offset = int(message["offset"])
+        if offset < 0:
+            raise ValueError(f"Bad offset {offset}")
+        return uid, offset
+
+    async def request(self, client, message):
+        try:
+            message = json.loads(message)
+            if not isinstance(message, dict):
+                raise ValueError("Request must be a JSON object")
+            kind = message.get("msg")
+            if kind == "pause":
+                self.paused = True
+            elif kind == "resume":
+                self.paused = False
+            elif kind == "read-blocks":
+                uid, offset = self._tag_address(message)
+                count = int(message["count"])
+                if count < 1:
+                    raise ValueError(f"Bad count {count}")
+                blocks = await self.call(self.reader.eeprom_read_range, uid, offset, count)
+                if blocks is None:
+                    raise StandardError("{} did not answer to read".format(uid))
+                await client.send({"msg": "blocks-read", "uid": uid,
+                                   "offset": blocks.offset, "data": blocks.hex()})
+            elif kind == "write-blocks":
+                uid, offset = self._tag_address(message)
+                datalist = [int(value, 16) for value in message["data"]]
+                if len(datalist) == 0:
+                    raise ValueError("No data to write")
+                await self.call(self.reader.eeprom_write_multiple_block,
+                                uid, offset, datalist)
+                await client.send({"msg": "blocks-written", "uid": uid, "offset": offset})
+            else:
+                raise ValueError(f"Unknown request {kind}")
+        except (StandardError, ValueError, KeyError, TypeError) as e:
+            self.logger.warning("Request %s failed: %s", message, e)
+            await client.send({"msg": "error", "request": message, "text": str(e)})
+
+    async def serve(self, host="localhost", port=8765):
+        """ Accept local clients forever """
+        async with websockets.serve(self.handle, host, port):
+            self.logger.info("Serving tag events on ws://%s:%d", host, port)
+            await asyncio.Future()
+
+    async def connect(self, url):
+        """ Stay connected to remote server, backoff doubles on each failed
+            attempt up to max_backoff and is reset once connected """
+        backoff = self.min_backoff
+        while True:
+            try:
+                self.logger.info("Connecting to %s", url)
+                async with websockets.connect(url) as websocket:
+                    self.logger.info("Connected to %s", url)
+                    backoff = self.min_backoff
+                    await self.handle(websocket)
+                self.logger.info("Connection to %s closed", url)
+            except (OSError, websockets.WebSocketException) as e:
+                self.logger.warning("Connection to %s failed: %s", url, e)
+            delay = backoff * (1 + random.random() * 0.5)
+            self.logger.info("Reconnecting in %.1f s", delay)
+            await asyncio.sleep(delay)
+            backoff = min(backoff * 2, self.max_backoff)
+
+    async def run(self, host=None, port=8765, url=None):
+        """ Scan and serve local clients and/or remote server """
+        tasks = [self.scan()]
+        if host is not None:
+            tasks.append(self.serve(host, port))
+        if url is not None:
+            tasks.append(self.connect(url))
+        try:
+            await asyncio.gather(*tasks)
+        finally:
+            self.executor.shutdown(wait=False)
@@ -0,0 +1,145 @@
+# -*- coding: utf-8; tab-width: 4; indent-tabs-mode: nil; c-basic-offset: 4 -*-
+# vim:fenc=utf-8:et:sw=4:ts=4:sts=4:tw=0
+#
+# Fake DLP-RFID2 serial port: each frame written is answered at once by a
+# responder function, fed with the frame as text.
+
+import logging
+
+import pytest
+
+import pydlprfid2.pydlprfid2 as module
+
+
+class FakeSerial(object):
+
+    def __init__(self, port=None, responder=None, **kwargs):
+        self.portstr = port
+        self.responder = responder
+        self.buf = b''
+        self.sent = []
+
+    def write(self, data):
+        frame = data.decode('ascii')
+        self.sent.append(frame)
+        self.buf += self.responder(frame) or b''
+
+    @property
+    def in_waiting(self):
+        return len(self.buf)
+
+    def read(self, size=1):
+        data, self.buf = self.buf[:size], self.buf[size:]
+        return data
+
+    def readall(self):
+        data, self.buf = self.buf, b''
+        return data
+
+    def reset_input_buffer(self):
+        self.buf = b''
+
+    def close(self):
+        pass
+
+
+def iso_command(frame):
+    """ ISO15693 command code of a raw request frame, None for others """
+    body = frame[10:-4]
+    if frame[10:12] != '18' or len(body) < 6:
+        return None
+    return int(body[4:6], 16)
+
+
+def iso_block(frame):
+    """ First block number of an addressed M24LR (2 bytes offset) request """
+    body = frame[10:-4]
+    return int(body[24:26] + body[22:24], 16)
+
+
+@pytest.fixture
+def make_reader(monkeypatch):
+    """ make_reader(responder) gives a PyDlpRfid2 on a FakeSerial """
+    def make(responder, port="fake"):
+        monkeypatch.setattr(module.serial, "Serial",
+                            lambda port=None, **kwargs: FakeSerial(port, responder))
+        reader = module.PyDlpRfid2(port, loglevel=logging.WARNING)
+        reader.sp.sent.clear()
+        # fake answers are there at once
+        reader.timeouts.default = reader.timeouts.idle = 0.001
+        return reader
+    return make
+
+
+class TagMemory(object):
+    """ Responder of one M24LR tag: read single (0x20), write single (0x21),
+        read multiple (0x23) blocks of block_size bytes, system info (0x2B),
+        block security (0x2C) and present password (0xB3). fail_writes:
+        block numbers whose writes are acknowledged but not done. sectors:
+        security status byte of each 32 blocks sector, passwords: {number:
+        32 bits password}. """
+
+    SECTOR_BLOCKS = 32
+
+    def __init__(self, blocks=64, fill=None, block_size=4, uid="E0022C0000000001"):
+        self.block_size = block_size
+        self.uid = uid
+        self.blocks = [bytes(fill or bytes(block_size))] * blocks
+        self.fail_writes = set()
+        self.writes = []
+        self.commands = []
+        self.sectors = [0] * (-(-blocks // self.SECTOR_BLOCKS))
+        self.passwords = {}
+        self.presented = None
+
+    def status(self, blockno):
+        return self.sectors[blockno // self.SECTOR_BLOCKS]
+
+    def writable(self, blockno):
+        status = self.status(blockno)
+        if not status & 0x01:
+            return True
+        password_no = (status >> 3) & 0x03
+        # b2 set: write forbidden whatever the password
+        return (password_no != 0 and password_no == self.presented and
+                not status & 0x04)
+
+    def __call__(self, frame):
+        code = iso_command(frame)
+        if code is None:
+            return b""
+        self.commands.append(code)
+        body = frame[10:-4]
+        if code == 0x2B:
+            count = len(self.blocks) - 1
+            info = (b"\x00\x0F" + bytes.fromhex(self.uid)[::-1] + b"\x00\x00" +
+                    bytes([count & 0xFF, count >> 8, self.block_size - 1, 0x2C]))
+            return b"[" + info.hex().upper().encode() + b"]"
+        offset = iso_block(frame)
+        if code == 0x20:
+            return b"[00" + self.blocks[offset].hex().upper().encode() + b"]"
+        if code == 0x21:
+            self.writes.append(offset)
+            if not self.writable(offset):
+                return b"[0112]"
+            if offset not in self.fail_writes:
+                self.blocks[offset] = bytes.fromhex(body[26:26 + 2 * self.block_size])
+            return b"[00]"
+        if code == 0x23:
+            count = int(body[26:28], 16) + 1
+            data = b"".join(self.blocks[offset:offset + count])
+            return b"[00" + data.hex().upper().encode() + b"]"
+        if code == 0x2C:
+            count = int(body[28:30] + body[26:28], 16) + 1
+            status = bytes(self.status(blockno) for blockno in range(offset, offset + count))
+            return b"[00" + status.hex().upper().encode() + b"]"
+        if code == 0xB3:
+            # manufacturer code comes before UID
+            password_no = int(body[24:26], 16)
+            password = int.from_bytes(bytes.fromhex(body[26:34]), 'little')
+            if self.passwords.get(password_no) != password:
+                self.presented = None
+                return b"[010F]"
+            self.presented = password_no
+            return b"[00]"
+        return b""
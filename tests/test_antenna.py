@@ -0,0 +1,43 @@
+# -*- coding: utf-8; tab-width: 4; indent-tabs-mode: nil; c-basic-offset: 4 -*-
+# vim:fenc=utf-8:et:sw=4:ts=4:sts=4:tw=0
+
+from pydlprfid2 import InventoryEntry
+from pydlprfid2.antenna import AntennaScheduler, EXTERNAL, INTERNAL
+
+UID = "E0025E167B532A87"
+
+
+class FakeReader(object):
+    """ Reader whose inventory gives one RSSI byte per antenna """
+
+    def __init__(self, rssi):
+        self.rssi = rssi
+        self.shadow = {}
+
+    def enable_internal_antenna(self):
+        self.shadow["antenna"] = INTERNAL
+
+    def enable_external_antenna(self):
+        self.shadow["antenna"] = EXTERNAL
+
+    def inventory_entries(self):
+        return [InventoryEntry(bytes.fromhex(UID), self.rssi[self.shadow["antenna"]])]
+
+
+def test_best_antenna_by_decoded_level():
+    # external: oscillator flag and MAIN 1, internal: MAIN 6
+    scheduler = AntennaScheduler(FakeReader({EXTERNAL: 0x41, INTERNAL: 0x06}))
+    assert scheduler.inventory() == {UID: {EXTERNAL: 0x41, INTERNAL: 0x06}}
+    assert scheduler.best_antenna(UID) == INTERNAL
+    assert scheduler.route(UID.lower()) == INTERNAL
+
+
+def test_same_level_keeps_current_antenna():
+    # AUX 3 and MAIN 3 are the same level
+    reader = FakeReader({EXTERNAL: 0x18, INTERNAL: 0x03})
+    scheduler = AntennaScheduler(reader)
+    scheduler.inventory()
+    assert reader.shadow["antenna"] == INTERNAL
+    switches = scheduler.switches
+    assert scheduler.route(UID) == INTERNAL
+    assert scheduler.switches == switches
@@ -0,0 +1,117 @@
+# -*- coding: utf-8; tab-width: 4; indent-tabs-mode: nil; c-basic-offset: 4 -*-
+# vim:fenc=utf-8:et:sw=4:ts=4:sts=4:tw=0
+
+import pytest
+
+import pydlprfid2.bp2bridge as module
+from pydlprfid2 import StandardError
+from pydlprfid2.bp2bridge import Bp2Bridge
+
+# UART mode menu: question asked after each answer
+MENU = [b"Set serial port speed: (bps)\r\n 9. 115200\r\n(1)>",
+        b"Data bits and parity:\r\n 1. 8, NONE *default\r\n(1)>",
+        b"Stop bits:\r\n 1. 1 *default\r\n(1)>",
+        b"Receive polarity:\r\n 1. Idle 1 *default\r\n(1)>",
+        b"Select output type:\r\n 2. Normal (H=3.3V, L=GND)\r\n(1)>",
+        b"Ready\r\nUART>"]
+
+
+class BusPirate(object):
+    """ Scripted bus pirate terminal, bridged to a DLP-RFID2 once the
+        bridge macro is agreed """
+
+    def __init__(self, mode=b"HiZ", bridged=False):
+        self.mode = mode
+        self.bridged = bridged
+        self.menu = None
+        self.line = b""
+        self.lines = []
+        self.buf = b""
+
+    def answer(self, line):
+        self.lines.append(line)
+        if self.menu is not None:
+            self.buf += MENU[self.menu]
+            self.menu += 1
+            if self.menu == len(MENU):
+                self.menu = None
+                self.mode = b"UART"
+            return
+        if line == b"m3":
+            self.buf += MENU[0]
+            self.menu = 1
+        elif line == b"":
+            self.buf += self.mode + b">"
+        elif line == b"W" and self.mode == b"UART":
+            self.buf += b"Power supplies ON\r\nUART>"
+        elif line == b"(1)" and self.mode == b"UART":
+            self.buf += b"UART bridge\r\nReset to exit\r\nAre you sure? "
+            self.mode = b"confirm"
+        else:
+            self.buf += b"Syntax error at char 1\r\n" + self.mode + b">"
+
+    def write(self, data):
+        if self.bridged:
+            if data.startswith(b"01") and data[10:12] == b"FF":
+                self.buf += b"TRF7970A EVM\r\n"
+            return
+        if self.mode == b"confirm" and data == b"y":
+            self.bridged = True
+            return
+        for byte in data:
+            if byte == ord("\n"):
+                line, self.line = self.line, b""
+                self.answer(line)
+            else:
+                self.line += bytes([byte])
+
+    @property
+    def in_waiting(self):
+        return len(self.buf)
+
+    def read(self, size=1):
+        data, self.buf = self.buf[:size], self.buf[size:]
+        return data
+
+    def reset_input_buffer(self):
+        self.buf = b""
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        pass
+
+
+@pytest.fixture
+def bridge(monkeypatch):
+    def make(pirate):
+        monkeypatch.setattr(module.serial, "Serial", lambda *args, **kwargs: pirate)
+        bridge = Bp2Bridge("fake")
+        bridge.PING_TIMEOUT = 0.05
+        bridge.TIMEOUT = 0.5
+        return bridge
+    return make
+
+
+@pytest.mark.parametrize("mode", [b"HiZ", b"UART"])
+def test_setup_from_terminal(bridge, mode):
+    pirate = BusPirate(mode)
+    assert bridge(pirate).to_bridge()
+    assert pirate.bridged
+    # no EVM frame reached the terminal as a command
+    assert not any(line.startswith(b"01") for line in pirate.lines)
+    expected = [b"", b"m3", b"9", b"1", b"1", b"1", b"2"] if mode == b"HiZ" else [b""]
+    assert pirate.lines == expected + [b"W", b"(1)"]
+
+
+def test_already_bridged(bridge):
+    pirate = BusPirate(bridged=True)
+    assert not bridge(pirate).to_bridge()
+
+
+def test_no_reader(bridge):
+    pirate = BusPirate(bridged=True)
+    pirate.write = lambda data: None
+    with pytest.raises(StandardError):
+        bridge(pirate).to_bridge()
@@ -0,0 +1,41 @@
+# -*- coding: utf-8; tab-width: 4; indent-tabs-mode: nil; c-basic-offset: 4 -*-
+# vim:fenc=utf-8:et:sw=4:ts=4:sts=4:tw=0
+
+from pydlprfid2 import TagCatalog, InventoryEntry, TagInfo, BlockData, ISO15693
+
+UID = "E0025E167B532A87"
+
+
+def test_sightings(tmp_path):
+    catalog = TagCatalog(str(tmp_path / "tags.db"), flush_interval=60)
+    entry = InventoryEntry(bytes.fromhex(UID), 12)
+    catalog.on_inventory("ttyACM0", ISO15693, [entry])
+    catalog.on_inventory("ttyACM0", ISO15693, [entry])
+    catalog.on_inventory("ttyACM1", ISO15693, [InventoryEntry(entry.uid, 30)])
+    seen = catalog.last_seen(UID)
+    assert seen["readers"]["ttyACM0"][0] == 12
+    assert seen["readers"]["ttyACM0"][2] == 2
+    assert seen["readers"]["ttyACM1"][0] == 30
+    assert seen["first_seen"] <= seen["last_seen"]
+    assert catalog.seen_since(0) == [UID]
+    assert catalog.last_seen("E004000000000000") is None
+    catalog.close()
+
+
+def test_seen_after_system_info(tmp_path):
+    catalog = TagCatalog(str(tmp_path / "tags.db"), flush_interval=60)
+    catalog.on_system_info("ttyACM0", TagInfo(bytes.fromhex(UID), block_count=2048,
+                                              block_size=4))
+    catalog.flush()
+    catalog.on_inventory("ttyACM0", ISO15693, [InventoryEntry(bytes.fromhex(UID))])
+    seen = catalog.last_seen(UID)
+    assert seen["first_seen"] is not None and seen["last_seen"] is not None
+    catalog.close()
+
+
+def test_tag_data(tmp_path):
+    catalog = TagCatalog(str(tmp_path / "tags.db"),
+                         decoder=lambda uid, blocks: {"first": blocks[0]})
+    catalog.on_tag_data("ttyACM0", UID.lower(), BlockData(b"\x07\x00\x00\x01", 0))
+    assert catalog.tag_data(UID) == [(0, b"\x07\x00\x00\x01", {"first": 7})]
+    catalog.close()
@@ -0,0 +1,40 @@
+# -*- coding: utf-8; tab-width: 4; indent-tabs-mode: nil; c-basic-offset: 4 -*-
+# vim:fenc=utf-8:et:sw=4:ts=4:sts=4:tw=0
+
+import pytest
+
+import pydlprfid2
+from pydlprfid2 import pydlprfid2 as module
+
+from conftest import FakeSerial
+
+
+@pytest.fixture
+def opened(monkeypatch):
+    """ ports opened by the CLI, on silent FakeSerial """
+    ports = []
+
+    def open_port(port=None, **kwargs):
+        ports.append(port)
+        return FakeSerial(port, lambda frame: b"")
+    monkeypatch.setattr(module.serial, "Serial", open_port)
+    return ports
+
+
+def test_list_unsupported_protocol(opened, capsys):
+    with pytest.raises(SystemExit) as exit:
+        pydlprfid2.main(["-d", "fake", "-p", "ISO14443B", "-l"])
+    assert exit.value.code == 1
+    assert "Tag listing failed" in capsys.readouterr().out
+
+
+@pytest.mark.parametrize("options", [["-p", "ISO14443A", "-l", "-a", "01"],
+                                     ["-p", "ISO14443B", "-g"],
+                                     ["-p", "ISO14443A", "-r", "0"],
+                                     ["-p", "ISO18092", "-l"]])
+def test_rejected_options(opened, options):
+    with pytest.raises(SystemExit) as exit:
+        pydlprfid2.main(["-d", "fake"] + options)
+    assert exit.value.code == 2
+    # rejected before the reader is opened
+    assert opened == []
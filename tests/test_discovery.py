@@ -0,0 +1,79 @@
+# -*- coding: utf-8; tab-width: 4; indent-tabs-mode: nil; c-basic-offset: 4 -*-
+# vim:fenc=utf-8:et:sw=4:ts=4:sts=4:tw=0
+
+import threading
+
+import pytest
+import serial
+
+from pydlprfid2 import discover, ReaderPool, ISO15693
+
+from conftest import FakeSerial
+
+UID = "E0022C0000000001"
+VERSION = b"DLP-RFID2 v1.2"
+
+
+def evm(frame):
+    cmd = frame[10:12]
+    if cmd == 'FF':
+        return b"TRF7970A EVM\r\n"
+    if cmd == 'FE':
+        return VERSION + b"\r\n"
+    if cmd == '14':
+        return b"[" + bytes.fromhex(UID)[::-1].hex().upper().encode() + b",4A]"
+    return b""
+
+
+class Ports(object):
+    """ serial.Serial replacement: evm* ports are readers, silent* ports
+        never answer, other ports can't be opened """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.opened = 0
+        self.peak = 0
+
+    def __call__(self, port=None, **kwargs):
+        if not port.startswith(("evm", "silent")):
+            raise serial.SerialException(f"No such port {port}")
+        with self.lock:
+            self.opened += 1
+            self.peak = max(self.peak, self.opened)
+        ser = FakeSerial(port, evm if port.startswith("evm") else lambda frame: b"")
+        close = ser.close
+
+        def closed():
+            with self.lock:
+                self.opened -= 1
+            close()
+        ser.close = closed
+        return ser
+
+
+@pytest.fixture
+def ports(monkeypatch):
+    ports = Ports()
+    monkeypatch.setattr(serial, "Serial", ports)
+    return ports
+
+
+def test_discover_in_parallel(ports):
+    names = ["silent0", "evm0", "gone", "silent1", "evm1", "silent2"]
+    assert discover(names) == [("evm0", VERSION.decode()), ("evm1", VERSION.decode())]
+    # silent ports wait for their timeout at the same time
+    assert ports.peak > 1
+    assert ports.opened == 0
+
+
+def test_discover_without_ports(ports):
+    assert discover([]) == []
+
+
+def test_pool_inventory(ports):
+    with ReaderPool.discover(["evm0", "silent0", "evm1"], protocol=ISO15693) as pool:
+        assert len(pool) == 2
+        assert pool.versions == {"evm0": VERSION.decode(), "evm1": VERSION.decode()}
+        found = pool.inventory()
+        assert {reader_id: [entry.uid_hex for entry in entries]
+                for reader_id, entries in found.items()} == {"evm0": [UID], "evm1": [UID]}
@@ -0,0 +1,78 @@
+# -*- coding: utf-8; tab-width: 4; indent-tabs-mode: nil; c-basic-offset: 4 -*-
+# vim:fenc=utf-8:et:sw=4:ts=4:sts=4:tw=0
+
+import pytest
+
+from pydlprfid2 import StandardError
+from pydlprfid2.registry import TagRegistry
+
+from conftest import TagMemory
+
+UID = "E0022C0000000001"
+
+
+def test_only_dirty_blocks_written(make_reader):
+    tag = TagMemory()
+    tag.blocks[3] = b"ABCD"
+    tag.blocks[40] = b"\0\0\0\1"
+    reader = make_reader(tag)
+    assert reader.erase(UID) == 2
+    assert tag.writes == [3, 40]
+    assert set(tag.blocks) == {bytes(4)}
+
+
+def test_range_and_fill(make_reader):
+    tag = TagMemory()
+    tag.blocks[1] = b"\xFF\xFF\xFF\xFF"
+    reader = make_reader(tag)
+    assert reader.erase(UID, 0, 4, fill=0xFF) == 3
+    assert tag.writes == [0, 2, 3]
+    assert tag.blocks[:5] == [b"\xFF" * 4] * 4 + [bytes(4)]
+
+
+def test_geometry_from_system_info(make_reader):
+    # blocks of 8 bytes, compared and written whole
+    tag = TagMemory(blocks=8, block_size=8)
+    tag.blocks[2] = b"\0\0\0\0\0\0\0\1"
+    reader = make_reader(tag)
+    assert reader.erase(UID) == 1
+    assert tag.writes == [2]
+    assert tag.blocks[2] == bytes(8)
+
+
+def test_verify_failed(make_reader):
+    tag = TagMemory(blocks=8)
+    tag.blocks[5] = tag.blocks[6] = b"ABCD"
+    tag.fail_writes.add(6)
+    reader = make_reader(tag)
+    with pytest.raises(StandardError, match="blocks 6$"):
+        reader.erase(UID)
+    assert tag.blocks[5] == bytes(4)
+
+
+def test_blank_tag_not_written(make_reader):
+    tag = TagMemory(blocks=8)
+    reader = make_reader(tag)
+    assert reader.erase(UID) == 0
+    assert tag.writes == []
+
+
+def test_geometry_with_explicit_end(make_reader):
+    # erase_card() gives the range, block size still comes from the tag
+    tag = TagMemory(blocks=8, block_size=8)
+    tag.blocks[1] = b"\0\0\0\0\0\0\0\1"
+    reader = make_reader(tag)
+    assert reader.erase(UID, 0, 2) == 1
+    assert tag.writes == [1]
+    assert tag.blocks[:4] == [bytes(8)] * 4
+
+
+def test_read_range_chunk_with_registry(make_reader):
+    tag = TagMemory(blocks=8, block_size=8)
+    tag.blocks[3] = b"ABCDEFGH"
+    reader = make_reader(tag)
+    reader.registry = TagRegistry(reader)
+    blocks = reader.eeprom_read_range(UID, 2, 2, chunk=1)
+    assert bytes(blocks.block(3)) == b"ABCDEFGH"
+    with pytest.raises(StandardError, match="out of tag memory"):
+        reader.eeprom_read_range(UID, 6, 4, chunk=1)
@@ -0,0 +1,41 @@
+# -*- coding: utf-8; tab-width: 4; indent-tabs-mode: nil; c-basic-offset: 4 -*-
+# vim:fenc=utf-8:et:sw=4:ts=4:sts=4:tw=0
+
+import gzip
+import json
+
+from pydlprfid2 import EventLog, InventoryEntry, BlockData, ISO15693
+
+UID = "E0025E167B532A87"
+
+
+def records(path):
+    opener = gzip.open if str(path).endswith(".gz") else open
+    with opener(path, 'rt') as fd:
+        return [json.loads(line) for line in fd]
+
+
+def test_events(tmp_path):
+    with EventLog(str(tmp_path), batch_size=2) as log:
+        log.on_inventory("ttyACM0", ISO15693, [InventoryEntry(bytes.fromhex(UID), 9)])
+        log.on_tag_data("ttyACM0", UID.lower(), BlockData(b"\x01\x02\x03\x04", 4))
+        log.flush()
+        assert log.written == 2
+    files = list(tmp_path.iterdir())
+    assert len(files) == 1
+    inventory, data = records(files[0])
+    assert inventory["event"] == "inventory"
+    assert inventory["tags"] == [{"uid": UID, "rssi": 9}]
+    assert data == {"event": "tag_data", "time": data["time"], "reader": "ttyACM0",
+                    "uid": UID, "offset": 4, "data": "01020304"}
+
+
+def test_rotation_compressed(tmp_path):
+    with EventLog(str(tmp_path), compress=True, batch_size=1, rotate_bytes=1) as log:
+        for rssi in range(3):
+            log.on_inventory("ttyACM0", ISO15693, [InventoryEntry(bytes.fromhex(UID), rssi)])
+            log.flush()
+    files = sorted(tmp_path.iterdir())
+    assert len(files) == 3
+    assert all(path.name.endswith(".jsonl.gz") for path in files)
+    assert sorted(records(path)[0]["tags"][0]["rssi"] for path in files) == [0, 1, 2]
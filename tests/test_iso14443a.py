@@ -0,0 +1,93 @@
+# -*- coding: utf-8; tab-width: 4; indent-tabs-mode: nil; c-basic-offset: 4 -*-
+# vim:fenc=utf-8:et:sw=4:ts=4:sts=4:tw=0
+
+import pytest
+
+from pydlprfid2 import PyDlpRfid2
+
+UID4 = bytes.fromhex("01020304")
+UID7 = bytes.fromhex("04A1B2C3D4E5F6")
+UID10 = bytes.fromhex("0A0B0C0D0E0F10111213")
+
+
+def level_answers(uid):
+    """ Cascade level answers (CLn + BCC) of uid, as given by the reader """
+    answers = []
+    for level in PyDlpRfid2._cascade_levels(uid):
+        answers.append(level + bytes([level[0] ^ level[1] ^ level[2] ^ level[3]]))
+    return answers
+
+
+def frames(answers):
+    return [answer.hex().upper() for answer in answers]
+
+
+class CardField(object):
+    """ Responder of ISO14443A cards: REQA/WUPA answer levels of the first
+        card answering, SELECT/HLTA over REQUESTCMD """
+
+    def __init__(self, uids):
+        self.uids = list(uids)
+        self.halted = set()
+        self.selected = None
+        self.levels = []
+
+    def __call__(self, frame):
+        cmd, prms = frame[10:12], frame[12:-4]
+        if cmd in ('A0', 'A1'):
+            if cmd == 'A1':
+                self.halted.clear()
+            self.selected = None
+            self.levels = []
+            active = [uid for uid in self.uids if uid not in self.halted]
+            if not active:
+                return b""
+            return b"".join(b"[" + answer.encode() + b"]"
+                            for answer in frames(level_answers(active[0])))
+        if cmd == '18' and prms[2:4] == '70':
+            self.levels.append(bytes.fromhex(prms[4:12]))
+            for uid in self.uids:
+                if PyDlpRfid2._cascade_levels(uid)[:len(self.levels)] == self.levels:
+                    if len(self.levels) == len(PyDlpRfid2._cascade_levels(uid)):
+                        self.selected = uid
+                    return b"[08]"
+            return b""
+        if cmd == '18' and prms == '5000':
+            if self.selected is not None:
+                self.halted.add(self.selected)
+            return b""
+        return b""
+
+
+@pytest.mark.parametrize("uid", [UID4, UID7, UID10])
+def test_cascade_levels_assembled(make_reader, uid):
+    reader = make_reader(lambda frame: b"")
+    assert reader._iso14443A_uids(frames(level_answers(uid))) == [uid]
+
+
+def test_bcc_failure_dropped(make_reader):
+    reader = make_reader(lambda frame: b"")
+    levels = level_answers(UID7)
+    bad = levels[1][:4] + bytes([levels[1][4] ^ 0xFF])
+    assert reader._iso14443A_uids(frames([levels[0], bad])) == []
+    assert reader._iso14443A_uids(frames([bad] + level_answers(UID4))) == [UID4]
+
+
+def test_all_cards_found(make_reader):
+    field = CardField([UID7, UID4, UID10])
+    reader = make_reader(field)
+    assert reader.inventory_iso14443A() == [uid.hex().upper() for uid in (UID7, UID4, UID10)]
+    assert field.halted == {UID7, UID4, UID10}
+    # halted cards are woken up by next inventory
+    assert len(reader.inventory_iso14443A()) == 3
+
+
+def test_card_not_selected_ends_inventory(make_reader):
+    field = CardField([UID4, UID7])
+
+    def responder(frame):
+        if frame[10:12] == '18' and frame[14:16] == '70':
+            return b""
+        return field(frame)
+    reader = make_reader(responder)
+    assert reader.inventory_iso14443A() == [UID4.hex().upper()]
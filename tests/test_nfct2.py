@@ -0,0 +1,32 @@
+# -*- coding: utf-8; tab-width: 4; indent-tabs-mode: nil; c-basic-offset: 4 -*-
+# vim:fenc=utf-8:et:sw=4:ts=4:sts=4:tw=0
+
+import pytest
+
+from pydlprfid2 import WriteInterrupted
+
+
+def flaky_card(lost):
+    """ NFC Type 2 card responder NAKing first write of each page """
+    def respond(frame):
+        if frame[10:14] != '72A2':
+            return b""
+        page = int(frame[14:16], 16)
+        if page not in lost:
+            lost.add(page)
+            return b"[00]"
+        return b"[0A]"
+    return respond
+
+
+def test_write_pages_share_card_budget(make_reader):
+    reader = make_reader(flaky_card(set()))
+    reader.retry_policy.base_delay = 0
+    reader.retry_policy.tag_budget = 3
+    reader.iso14443A_uid = "04A1B2C3D4E5F6"
+    with pytest.raises(WriteInterrupted) as error:
+        reader.nfct2_write_pages(4, bytes(20), verify=False)
+    assert error.value.uid == "04A1B2C3D4E5F6"
+    assert error.value.written == 3
+    # budget is given back to next operation
+    assert reader.nfct2_write_pages(7, bytes(8), verify=False) == 2
@@ -0,0 +1,122 @@
+# -*- coding: utf-8; tab-width: 4; indent-tabs-mode: nil; c-basic-offset: 4 -*-
+# vim:fenc=utf-8:et:sw=4:ts=4:sts=4:tw=0
+
+import time
+
+from pydlprfid2 import (ProvisioningPipeline, RetryPolicy, InventoryEntry, BlockData,
+                        ISO15693, PyDlpRfid2)
+from pydlprfid2.provisioning import DONE, SKIPPED, FAILED, TIMEOUT, STOPPED
+
+TAGS = ["E00200000000%04X" % index for index in range(4)]
+
+
+class FakeReader(object):
+    """ Tags of 16 blocks always in field """
+
+    block_spans = PyDlpRfid2.block_spans
+    DEFAULT_READ_CHUNK = PyDlpRfid2.DEFAULT_READ_CHUNK
+
+    def __init__(self, uids, block_size=4):
+        self.protocol = ISO15693
+        self.block_size = block_size
+        self.memory = {uid: bytearray(16 * block_size) for uid in uids}
+        self.retry_policy = RetryPolicy(base_delay=0, max_delay=0)
+        self.lost_writes = set()     # uids whose writes are not done
+
+    def set_protocol(self, protocol):
+        self.protocol = protocol
+
+    def inventory_iso15693_entries(self, afi=None):
+        return [InventoryEntry(bytes.fromhex(uid)) for uid in self.memory]
+
+    def eeprom_read_range(self, uid, blockoffset, blocknum):
+        size = self.block_size
+        return BlockData(self.memory[uid][blockoffset * size:(blockoffset + blocknum) * size],
+                         blockoffset, size)
+
+    def eeprom_write_single_block_retry(self, uid, blockno, datastr, readback=True):
+        data = bytes.fromhex(datastr)
+        assert len(data) == self.block_size
+        if uid not in self.lost_writes:
+            self.memory[uid][blockno * len(data):(blockno + 1) * len(data)] = data
+        return "00"
+
+
+def test_provision_all():
+    reader = FakeReader(TAGS)
+    reported = []
+    pipeline = ProvisioningPipeline(reader, lambda uid, current: uid.encode()[-6:],
+                                    blockoffset=2, blocknum=4, report=reported.append,
+                                    interval=0.01)
+    results = pipeline.run(max_tags=len(TAGS), duration=10)
+    assert sorted(result.uid for result in results) == TAGS
+    assert all(result.status == DONE for result in results)
+    assert reported == results
+    assert bytes(reader.memory[TAGS[1]][8:16]) == b"000001\0\0"
+    assert pipeline.metrics()["tags"][DONE] == len(TAGS)
+
+
+def test_skipped_and_failing_report():
+    reader = FakeReader(TAGS[:1])
+
+    def report(result):
+        raise RuntimeError("report failed")
+    pipeline = ProvisioningPipeline(reader, lambda uid, current: None,
+                                    report=report, interval=0.01)
+    results = pipeline.run(duration=0.3)
+    # a failing report callback does not send the tag through again
+    assert [result.status for result in results] == [SKIPPED]
+
+
+def test_verify_failure_retried():
+    reader = FakeReader(TAGS[:1])
+    reader.lost_writes.add(TAGS[0])
+    pipeline = ProvisioningPipeline(reader, lambda uid, current: b"DATA",
+                                    interval=0.01, max_attempts=2)
+    results = pipeline.run(duration=0.5)
+    assert [result.status for result in results] == [FAILED, FAILED]
+
+
+def test_compute_timeout():
+    reader = FakeReader(TAGS[:1])
+
+    def compute(uid, current):
+        time.sleep(0.05)
+        return b"DATA"
+    pipeline = ProvisioningPipeline(reader, compute, timeouts={"compute": 0.01},
+                                    interval=0.01, max_attempts=1)
+    results = pipeline.run(max_tags=1, duration=5)
+    assert results[0].status == TIMEOUT
+    assert reader.memory[TAGS[0]] == bytearray(64)
+    assert pipeline.metrics()["compute"]["late"] == 1
+
+
+def test_block_size_of_tag():
+    reader = FakeReader(TAGS[:1], block_size=8)
+    pipeline = ProvisioningPipeline(reader, lambda uid, current: b"0123456789",
+                                    blockoffset=1, blocknum=2, interval=0.01)
+    results = pipeline.run(max_tags=1, duration=5)
+    assert results[0].status == DONE
+    assert results[0].written == [1, 2]
+    assert bytes(reader.memory[TAGS[0]][8:24]) == b"0123456789" + bytes(6)
+
+
+def test_stopped_tags_reported_and_tried_again():
+    reader = FakeReader(TAGS)
+
+    def compute(uid, current):
+        time.sleep(0.2)
+        return b"DATA"
+    reported = []
+    pipeline = ProvisioningPipeline(reader, compute, report=reported.append,
+                                    queue_size=1, interval=0.01)
+    first = pipeline.run(duration=0.1)
+    # nothing got through compute before stop
+    assert sorted(result.uid for result in first) == TAGS
+    assert all(result.status == STOPPED for result in first)
+    assert reported == first
+    # next run starts with its own results and provisions stopped tags
+    second = pipeline.run(max_tags=len(TAGS), duration=10)
+    assert len(second) == len(TAGS)
+    assert all(result.status == DONE for result in second)
+    assert all(bytes(reader.memory[uid][:4]) == b"DATA" for uid in TAGS)
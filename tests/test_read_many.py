@@ -0,0 +1,117 @@
+# -*- coding: utf-8; tab-width: 4; indent-tabs-mode: nil; c-basic-offset: 4 -*-
+# vim:fenc=utf-8:et:sw=4:ts=4:sts=4:tw=0
+
+import pytest
+
+from pydlprfid2 import StandardError
+
+from conftest import iso_block
+
+TAGS = ["E00200000000%04X" % index for index in range(12)]
+
+
+class FakeRegistry(object):
+
+    def __init__(self, block_sizes, chunks):
+        self.block_sizes = block_sizes
+        self.chunks = chunks
+
+    def geometry(self, uid):
+        return 2048, self.block_sizes[uid]
+
+    def read_chunk(self, uid):
+        return self.chunks[uid]
+
+
+def multi_tag_responder(block_size=4, gone=(), counts=None):
+    """ Block k of tag n reads as bytes n, k, k, ... """
+    def respond(frame):
+        body = frame[10:-4]
+        uid = ''.join(reversed([body[6 + i:8 + i] for i in range(0, 16, 2)]))
+        if uid in gone:
+            return b""
+        offset = iso_block(frame)
+        count = int(body[26:28], 16) + 1
+        if counts is not None:
+            counts.append(count)
+        data = b"".join(bytes([int(uid[-2:], 16)]) + bytes([offset + k]) * (block_size - 1)
+                        for k in range(count))
+        return b"[00" + data.hex().upper().encode() + b"]"
+    return respond
+
+
+def test_read_many(make_reader):
+    reader = make_reader(multi_tag_responder(gone={TAGS[3]}))
+    done = []
+    result = reader.read_range_many(TAGS, 2, 10, callback=lambda uid, blocks: done.append(uid))
+    assert result[TAGS[3]] is None
+    assert sorted(done) == sorted(set(TAGS) - {TAGS[3]})
+    blocks = result[TAGS[7]]
+    assert blocks.offset == 2
+    assert bytes(blocks.block(11)) == b"\x07\x0B\x0B\x0B"
+    # blocks are views on one shared buffer
+    assert isinstance(blocks.view.obj, bytearray)
+    assert blocks.view.obj is result[TAGS[8]].view.obj
+
+
+def test_read_many_as_buffer(make_reader):
+    reader = make_reader(multi_tag_responder(gone={TAGS[1]}))
+    view, missing = reader.read_range_many(TAGS[:3], 0, 2, as_buffer=True)
+    assert view.shape == (3, 8)
+    assert missing == {TAGS[1]}
+    assert view.tobytes()[16:20] == b"\x02\x00\x00\x00"
+    assert view[1, 0] == 0
+    view, missing = reader.read_range_many([], 0, 2, as_buffer=True)
+    assert view.shape == (0, 8) and missing == set()
+
+
+def test_read_many_registry(make_reader):
+    counts = []
+    reader = make_reader(multi_tag_responder(block_size=8, counts=counts))
+    reader.registry = FakeRegistry({uid: 8 for uid in TAGS[:2]},
+                                   {TAGS[0]: 16, TAGS[1]: 4})
+    result = reader.read_range_many(TAGS[:2], 0, 6)
+    assert max(counts) == 4
+    assert result[TAGS[1]].block_size == 8
+    assert bytes(result[TAGS[1]].block(5)) == b"\x01" + b"\x05" * 7
+
+
+def test_read_many_mixed_block_sizes(make_reader):
+    reader = make_reader(multi_tag_responder())
+    reader.registry = FakeRegistry({TAGS[0]: 4, TAGS[1]: 8}, {TAGS[0]: 4, TAGS[1]: 4})
+    with pytest.raises(StandardError):
+        reader.read_range_many(TAGS[:2], 0, 4)
+
+
+def register_responder(lost=()):
+    """ READSINGLE answers the register address, first answer of lost
+        addresses is lost """
+    lost = set(lost)
+
+    def respond(frame):
+        address = frame[12:14]
+        if address in lost:
+            lost.discard(address)
+            return b""
+        return b"[" + address.encode() + b"]"
+    return respond
+
+
+def test_pipeline_ignores_stale_bytes(make_reader):
+    reader = make_reader(register_responder())
+    reader.sp.buf = b"[FF]"
+    assert reader.issue_evm_commands([('12', '01'), ('12', '02')]) == [['01'], ['02']]
+
+
+def test_pipeline_unmatched_answers(make_reader):
+    reader = make_reader(register_responder(lost={'02'}))
+    commands = [('12', '01'), ('12', '02'), ('12', '03')]
+    assert reader.issue_evm_commands(commands) == [['01'], ['02'], ['03']]
+    assert [frame[12:14] for frame in reader.sp.sent] == ['01', '02', '03'] * 2
+
+
+def test_pipeline_not_repeatable(make_reader):
+    reader = make_reader(register_responder(lost={'02'}))
+    commands = [('10', '01'), ('10', '02'), ('10', '03')]
+    assert reader.issue_evm_commands(commands, repeatable=False) == [[], [], []]
+    assert len(reader.sp.sent) == 3
@@ -0,0 +1,88 @@
+# -*- coding: utf-8; tab-width: 4; indent-tabs-mode: nil; c-basic-offset: 4 -*-
+# vim:fenc=utf-8:et:sw=4:ts=4:sts=4:tw=0
+
+import json
+
+from pydlprfid2.registry import TagRegistry
+
+from conftest import TagMemory, iso_command
+
+UID = "E0025E167B532A87"
+# M24LR64E-R: IC reference 0x5E, 2048 blocks of 4 bytes
+SYSTEM_INFO = b"[000F872A537B165E02E000C2FF07035E]"
+
+
+def system_info_responder(count):
+    def respond(frame):
+        if iso_command(frame) == 0x2B:
+            count.append(frame)
+            return SYSTEM_INFO
+        return b""
+    return respond
+
+
+def test_ic_reference_shared(make_reader, tmp_path):
+    queries = []
+    reader = make_reader(system_info_responder(queries))
+    registry = TagRegistry(reader, str(tmp_path / "registry.json"))
+    assert registry.geometry(UID) == (2048, 4)
+    assert registry.geometry("E0025E1600000001") == (2048, 4)
+    assert len(queries) == 1
+    # tags of a known IC are not stored by UID
+    assert registry.by_uid == {}
+    assert list(registry.by_ic) == ["025E"]
+
+
+def test_batched_save(make_reader, tmp_path):
+    path = tmp_path / "registry.json"
+    reader = make_reader(system_info_responder([]))
+    registry = TagRegistry(reader, str(path))
+    registry.get(UID)
+    assert not path.exists()
+    reader.registry = registry
+    reader.close()
+    store = json.loads(path.read_text())
+    assert store["uids"] == {}
+    assert store["ic"]["025E"]["block_count"] == 2048
+
+
+def test_old_file_loaded(make_reader, tmp_path):
+    path = tmp_path / "registry.json"
+    caps = {"ic_reference": 0x5E, "block_count": 2048, "block_size": 4,
+            "fast_commands": None, "read_chunk": 16}
+    path.write_text(json.dumps({"uids": {UID: caps}, "ic": {}}))
+    queries = []
+    registry = TagRegistry(make_reader(system_info_responder(queries)), str(path))
+    assert registry.read_chunk(UID) == 16
+    assert queries == []
+
+
+def test_read_range_without_memory_size(make_reader):
+    # system info without memory size flag
+    tag = TagMemory(uid=UID)
+    tag.blocks[2] = b"ABCD"
+
+    def responder(frame):
+        if iso_command(frame) == 0x2B:
+            return b"[0000" + bytes.fromhex(UID)[::-1].hex().upper().encode() + b"]"
+        return tag(frame)
+    reader = make_reader(responder)
+    reader.registry = TagRegistry(reader)
+    assert reader.registry.geometry(UID) == (None, None)
+    assert reader.eeprom_read_range(UID, 0, 4).hex() == "00" * 8 + "41424344" + "00" * 4
+
+
+def test_system_info_without_protocol_extension(make_reader, tmp_path):
+    # tags other than ST refuse the protocol extension flag
+    flags = []
+
+    def responder(frame):
+        if iso_command(frame) == 0x2B:
+            flags.append(int(frame[10:-4][2:4], 16) & 0x08)
+            if flags[-1]:
+                return b"[0102]"
+            return SYSTEM_INFO.replace(b"FF07", b"3F")
+        return b""
+    registry = TagRegistry(make_reader(responder), str(tmp_path / "registry.json"))
+    assert registry.geometry(UID) == (64, 4)
+    assert flags == [0x08, 0]
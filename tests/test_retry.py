@@ -0,0 +1,75 @@
+# -*- coding: utf-8; tab-width: 4; indent-tabs-mode: nil; c-basic-offset: 4 -*-
+# vim:fenc=utf-8:et:sw=4:ts=4:sts=4:tw=0
+
+import pytest
+
+from pydlprfid2 import RetryPolicy, TagError
+
+
+def policy(**kwargs):
+    return RetryPolicy(base_delay=0, max_delay=0, **kwargs)
+
+
+def flaky(failures, error=None):
+    """ Function failing failures times, then answering "00" """
+    calls = []
+
+    def function():
+        calls.append(None)
+        if len(calls) <= failures:
+            if error is not None:
+                raise error
+            return None
+        return "00"
+    function.calls = calls
+    return function
+
+
+def test_retried_until_success():
+    function = flaky(3, TagError("programming", 0x13))
+    assert policy().run("A", function) == "00"
+    assert len(function.calls) == 4
+
+
+def test_fatal_code_not_retried():
+    function = flaky(3, TagError("locked", 0x12))
+    with pytest.raises(TagError):
+        policy().run("A", function)
+    assert len(function.calls) == 1
+
+
+def test_max_attempts():
+    function = flaky(10)
+    with pytest.raises(TagError):
+        policy(max_attempts=3).run("A", function)
+    assert len(function.calls) == 3
+
+
+def test_budget_per_operation():
+    retry = policy(tag_budget=3)
+    with retry.operation("A"):
+        retry.run("A", flaky(2))
+        assert retry.budget("A") == 1
+        with pytest.raises(TagError):
+            retry.run("A", flaky(2))
+    # next operation gets whole budget again
+    with retry.operation("A"):
+        with retry.operation("A"):
+            retry.run("A", flaky(2))
+        assert retry.budget("A") == 1
+    assert retry.budget("A") == 3
+
+
+def test_budget_per_standalone_call():
+    retry = policy(tag_budget=3)
+    for _ in range(5):
+        retry.run("A", flaky(2))
+    assert retry.budget("A") == 3
+
+
+def test_retries_bounded():
+    retry = policy(max_tags=2)
+    with retry.operation("A"), retry.operation("B"), retry.operation("C"):
+        for uid in "ABC":
+            retry.run(uid, flaky(1))
+        assert list(retry.retries) == ["B", "C"]
@@ -0,0 +1,50 @@
+# -*- coding: utf-8; tab-width: 4; indent-tabs-mode: nil; c-basic-offset: 4 -*-
+# vim:fenc=utf-8:et:sw=4:ts=4:sts=4:tw=0
+
+from pydlprfid2 import ISO14443A, RfConfig
+from pydlprfid2.rf import RfTuner
+
+# Modulator control register at reset: 100% modulation (OOK)
+MODULATOR = 0x21
+CARD = "[0102030404]"
+
+
+class Field(object):
+    """ TRF7970A registers and one ISO14443A card answering only to OOK
+        modulation """
+
+    def __init__(self):
+        self.registers = {0x09: MODULATOR}
+        self.commands = []
+
+    def __call__(self, frame):
+        cmd, prms = frame[10:12], frame[12:-4]
+        self.commands.append(cmd)
+        if cmd == '10':
+            for index in range(0, len(prms), 4):
+                self.registers[int(prms[index:index + 2], 16)] = int(prms[index + 2:index + 4], 16)
+            return b"[]"
+        if cmd == '12':
+            return b"[%02X]" % self.registers.get(int(prms, 16), 0)
+        if cmd == 'A1' and self.registers[0x09] & 0x07 == 0x01:
+            return CARD.encode()
+        if cmd == '18':
+            return b"[08]"
+        return b""
+
+
+def test_tune_with_protocol_inventory(make_reader):
+    field = Field()
+    reader = make_reader(field)
+    reader.protocol = ISO14443A
+    candidates = [RfConfig(modulation_depth="ask30"), RfConfig(half_power=True)]
+    tuner = RfTuner(reader, candidates)
+    best = tuner.tune(duration=0, min_rounds=1)
+    # modulation depth of first candidate does not stay for second one
+    assert best == RfConfig(half_power=True)
+    assert [score for score, _ in tuner.scores][0] == 0
+    assert tuner.scores[1][0] > 0
+    assert field.registers[0x09] == MODULATOR
+    assert field.registers[0x00] == 0x31
+    # no ISO15693 inventory in ISO14443A mode
+    assert '14' not in field.commands
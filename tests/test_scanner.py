@@ -0,0 +1,44 @@
+# -*- coding: utf-8; tab-width: 4; indent-tabs-mode: nil; c-basic-offset: 4 -*-
+# vim:fenc=utf-8:et:sw=4:ts=4:sts=4:tw=0
+
+import pytest
+
+from pydlprfid2 import MultiProtocolScanner, StandardError, ISO15693, ISO14443A, ISO14443B
+
+UID = "E0022C0000000001"
+# 4 bytes ISO14443A UID and its BCC
+CARD = "01020304"
+
+
+def field(frame):
+    cmd = frame[10:12]
+    if cmd == '14':
+        return b"[" + bytes.fromhex(UID)[::-1].hex().upper().encode() + b",4A]"
+    if cmd in ('A0', 'A1'):
+        return b"[" + CARD.encode() + b"04]"
+    return b""
+
+
+def test_scan_switches_iso_control_only(make_reader):
+    reader = make_reader(field)
+    reader.set_protocol(ISO15693)
+    reader.sp.sent.clear()
+    scanner = MultiProtocolScanner(reader, dwell={ISO15693: 2})
+    first = scanner.scan_once()
+    assert [entry.uid_hex for entry in first[ISO15693]] == [UID]
+    assert [entry.uid_hex for entry in first[ISO14443A]] == [CARD]
+    # second round begins with ISO14443A, where first one ended
+    second = scanner.scan_once()
+    assert list(second) == [ISO14443A, ISO15693]
+    assert scanner.switches == 2
+    cmds = [frame[10:12] for frame in reader.sp.sent]
+    assert cmds.count('14') == 4
+    # no reinitialization, a single ISO control register write per switch
+    assert 'FF' not in cmds
+    writes = [frame[12:-4] for frame in reader.sp.sent if frame[10:12] == '10']
+    assert [prms[:2] for prms in writes] == ['01', '01']
+
+
+def test_scan_unknown_protocol(make_reader):
+    with pytest.raises(StandardError):
+        MultiProtocolScanner(make_reader(field), protocols=(ISO15693, ISO14443B))
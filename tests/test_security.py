@@ -0,0 +1,123 @@
+# -*- coding: utf-8; tab-width: 4; indent-tabs-mode: nil; c-basic-offset: 4 -*-
+# vim:fenc=utf-8:et:sw=4:ts=4:sts=4:tw=0
+
+import pytest
+
+from pydlprfid2 import BlockSecurity, StandardError, SectorPasswordSession
+
+from conftest import TagMemory, iso_command
+
+UID = "E0025E167B532A87"
+PASSWORD = 0x12345678
+# sector locked, write protected, controlled by password 1
+LOCKED_PW1 = 0x01 | (0x01 << 3)
+
+
+def test_write_protection_bits():
+    # access bits 00, 01, 10, 11 then locked without password
+    security = BlockSecurity([0x00, LOCKED_PW1, LOCKED_PW1 | 0x02, LOCKED_PW1 | 0x04,
+                              LOCKED_PW1 | 0x06, 0x01])
+    assert security.protected_blocks() == [1, 2, 3, 4, 5]
+    # password 1 lifts protection, except writes of 10 and 11 sectors
+    assert security.protected_blocks(presented=1) == [3, 4, 5]
+    assert security.protected_blocks(presented=2) == [1, 2, 3, 4, 5]
+    assert [blockno for blockno in range(6) if security.is_read_protected(blockno)] == [2, 4]
+    assert not security.is_read_protected(2, presented=1)
+    assert not security.is_read_protected(4, presented=1)
+    assert security.runs(presented=1) == [(0, 3, False), (3, 3, True)]
+
+
+def test_write_after_password_presented(make_reader):
+    tag = TagMemory()
+    tag.sectors[0] = LOCKED_PW1
+    tag.passwords[1] = PASSWORD
+    reader = make_reader(tag)
+    reader.get_block_security(UID, 0, 4)
+    with pytest.raises(StandardError):
+        reader.eeprom_write_multiple_block(UID, 0, [1, 2])
+    assert tag.writes == []
+    SectorPasswordSession(reader, UID, {1: PASSWORD}).write_range(0, [1, 2])
+    reader.eeprom_write_multiple_block(UID, 0, [3, 4])
+    assert tag.blocks[0:2] == [b"\0\0\0\3", b"\0\0\0\4"]
+
+
+def test_skip_protected(make_reader):
+    tag = TagMemory()
+    tag.sectors[1] = 0x01
+    reader = make_reader(tag)
+    resp = reader.eeprom_write_multiple_block(UID, 31, [5, 6], skip_protected=True)
+    assert resp[1] is None
+    assert tag.writes == [31]
+
+
+def test_session_reads_write_protected_without_password(make_reader):
+    tag = TagMemory()
+    tag.sectors[0] = LOCKED_PW1
+    reader = make_reader(tag)
+    session = SectorPasswordSession(reader, UID, {})
+    assert session.read_range(0, 4).hex() == "00" * 16
+    assert 0xB3 not in tag.commands
+
+
+@pytest.mark.parametrize("access", [0x04, 0x06])
+def test_session_refuses_write_forbidden(make_reader, access):
+    tag = TagMemory()
+    tag.sectors[1] = LOCKED_PW1 | access
+    tag.passwords[1] = PASSWORD
+    reader = make_reader(tag)
+    session = SectorPasswordSession(reader, UID, {1: PASSWORD})
+    with pytest.raises(StandardError, match="can't be written"):
+        session.write_blocks({31: 1, 32: 2})
+    assert 0xB3 not in tag.commands
+    assert tag.writes == []
+
+
+def test_truncated_security_answer(make_reader):
+    tag = TagMemory()
+
+    def responder(frame):
+        answer = tag(frame)
+        if iso_command(frame) == 0x2C:
+            answer = answer[:-3] + b"]"
+        return answer
+    reader = make_reader(responder)
+    assert reader.get_block_security(UID, 0, 4) is None
+    assert UID not in reader.security_cache
+
+
+def test_sector_password_frames(make_reader):
+    reader = make_reader(lambda frame: b"[00]")
+    reader.present_sector_password(UID, 1, PASSWORD)
+    reader.write_sector_password(UID, 2, 0xAABBCCDD)
+    reader.lock_sector(UID, 1, LOCKED_PW1)
+    # flags (addressed, protocol extension), command, IC manufacturer
+    # code, UID LSB first, then password number and password LSB first,
+    # or sector number LSB first and sector status
+    assert [frame[10:-4] for frame in reader.sp.sent] == [
+        "1828B302872A537B165E02E001" + "78563412",
+        "1828B102872A537B165E02E002" + "DDCCBBAA",
+        "1828B202872A537B165E02E0" + "0100" + "09"]
+    reader.sp.sent.clear()
+    reader.selected_uid = UID
+    reader.present_sector_password(UID, 1, PASSWORD)
+    assert reader.sp.sent[0][10:-4] == "1818B302" + "01" + "78563412"
+
+
+def test_sector_password_needs_uid(make_reader):
+    reader = make_reader(lambda frame: b"[00]")
+    with pytest.raises(StandardError, match="UID"):
+        reader.present_sector_password(None, 1, PASSWORD)
+    assert reader.sp.sent == []
+
+
+def test_security_cache_uid_case(make_reader):
+    tag = TagMemory()
+    reader = make_reader(tag)
+    reader.get_block_security(UID.lower(), 0, 4)
+    assert list(reader.security_cache) == [UID]
+    reader.get_block_security(UID, 0, 4)
+    assert tag.commands == [0x2C]
+    # a refresh under another case drops the cached status
+    tag.sectors[0] = LOCKED_PW1
+    reader.invalidate_block_security(UID.lower())
+    assert reader.get_block_security(UID, 0, 4).protected_blocks() == [0, 1, 2, 3]
@@ -0,0 +1,43 @@
+# -*- coding: utf-8; tab-width: 4; indent-tabs-mode: nil; c-basic-offset: 4 -*-
+# vim:fenc=utf-8:et:sw=4:ts=4:sts=4:tw=0
+
+
+def silent_leds(answer_registers=True):
+    """ Register writes are acknowledged, LED commands give no answer """
+    def respond(frame):
+        if frame[10:12] == '10' and answer_registers:
+            return b"[]"
+        return b""
+    return respond
+
+
+def commands(reader):
+    return [frame[10:12] for frame in reader.sp.sent]
+
+
+def test_register_writes_elided(make_reader):
+    reader = make_reader(silent_leds())
+    assert reader.write_registers([(0x00, 0x21), (0x01, 0x00)])
+    assert not reader.write_registers([(0x00, 0x21)])
+    # only changed registers are sent
+    assert reader.write_registers([(0x00, 0x31), (0x01, 0x00)])
+    assert reader.sp.sent[-1][12:-4] == '0031'
+    assert commands(reader) == ['10', '10']
+
+
+def test_silent_commands_keep_shadow(make_reader):
+    reader = make_reader(silent_leds())
+    reader.write_registers([(0x00, 0x21)])
+    reader.enable_led(2)
+    reader.enable_led(2)
+    reader.write_registers([(0x00, 0x21)])
+    assert commands(reader) == ['10', 'FB']
+
+
+def test_unanswered_register_write_forgets_state(make_reader):
+    reader = make_reader(silent_leds(answer_registers=False))
+    reader.enable_led(3)
+    reader.write_registers([(0x00, 0x21)])
+    reader.write_registers([(0x00, 0x21)])
+    reader.enable_led(3)
+    assert commands(reader) == ['F9', '10', '10', 'F9']
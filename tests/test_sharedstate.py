@@ -0,0 +1,89 @@
+# -*- coding: utf-8; tab-width: 4; indent-tabs-mode: nil; c-basic-offset: 4 -*-
+# vim:fenc=utf-8:et:sw=4:ts=4:sts=4:tw=0
+
+import sys
+import struct
+import subprocess
+
+import pytest
+
+from pydlprfid2 import StandardError, TagStateTable, InventoryEntry, BlockData, ISO15693, ISO14443A
+
+UID = "E0025E167B532A87"
+
+
+@pytest.fixture
+def table():
+    table = TagStateTable(create=True, capacity=16)
+    yield table
+    table.close()
+    table.unlink()
+
+
+def test_update_and_get(table):
+    assert table.get(UID) is None
+    table.update(UID, 40, 1.5, header=b"HEAD")
+    state = table.get(UID)
+    assert (state.uid_hex, state.present, state.rssi, state.last_seen) == (UID, True, 40, 1.5)
+    assert state.header == b"HEAD"
+    table.update(UID, present=None)
+    assert table.get(UID).header == b"HEAD"
+
+
+def test_presence_per_protocol(table):
+    nfc = bytes.fromhex("04A1B2C3D4E5F6")
+    table.on_inventory("r", ISO15693, [InventoryEntry(bytes.fromhex(UID))])
+    table.on_inventory("r", ISO14443A, [InventoryEntry(nfc)])
+    assert table.get(UID).present
+    # an inventory of another protocol does not make tags absent
+    table.on_inventory("r", ISO14443A, [InventoryEntry(nfc)])
+    assert table.get(UID).present
+    table.on_inventory("r", ISO15693, [])
+    assert not table.get(UID).present
+    assert [state.uid for state in table.present_tags()] == [nfc + b"\0"]
+
+
+def test_manual_rounds():
+    table = TagStateTable(create=True, capacity=16, auto_round=False)
+    try:
+        table.on_inventory("r", ISO15693, [InventoryEntry(bytes.fromhex(UID))])
+        table.on_inventory("r", ISO15693, [])     # other antenna
+        assert table.get(UID).present
+        table.end_round()
+        table.end_round()
+        assert not table.get(UID).present
+    finally:
+        table.close()
+        table.unlink()
+
+
+def test_tag_data_header(table):
+    table.on_tag_data("r", UID, BlockData(b"ABCDEFGH", 0))
+    table.on_tag_data("r", UID, BlockData(b"IJKL", 4))
+    assert table.get(UID).header == b"ABCDEFGH"
+
+
+def test_attach_from_other_process(table):
+    table.update(UID, 7, 2.0)
+    code = ("from pydlprfid2 import TagStateTable\n"
+            "table = TagStateTable(%r)\n"
+            "print(table.get(%r).rssi)\n"
+            "table.close()\n" % (table.name, UID))
+    out = subprocess.run([sys.executable, "-c", code], capture_output=True,
+                         text=True, timeout=30)
+    assert out.stdout.strip() == "7"
+    # attaching process exit must not destroy the table
+    attached = TagStateTable(table.name)
+    assert attached.get(UID).rssi == 7
+    attached.close()
+
+
+def test_writer_died_while_updating(table):
+    table.update(UID, 7, 2.0)
+    index = table._find(table._uid(UID))
+    offset = table._offset(index)
+    seq = struct.unpack_from("<I", table.buf, offset)[0]
+    struct.pack_into("<I", table.buf, offset, seq + 1)
+    table.READ_ATTEMPTS = 3
+    with pytest.raises(StandardError, match="busy"):
+        table.get(UID)
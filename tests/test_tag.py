@@ -0,0 +1,68 @@
+# -*- coding: utf-8; tab-width: 4; indent-tabs-mode: nil; c-basic-offset: 4 -*-
+# vim:fenc=utf-8:et:sw=4:ts=4:sts=4:tw=0
+
+import pytest
+
+from pydlprfid2 import InventoryEntry, TagInfo, BlockData
+
+UID = "0102030405060708"    # LSB first, as answered by the tag
+
+
+def test_inventory_entry():
+    entry = InventoryEntry.from_response(UID, "4A")
+    assert entry.uid_hex == "0807060504030201"
+    assert entry.as_tuple() == ("0807060504030201", "4A")
+    # oscillator flag, AUX 1, MAIN 2
+    assert entry.level == 2
+    assert InventoryEntry.rssi_level(0x7C) == 7
+    assert InventoryEntry(b"\1" * 8).level is None
+
+
+def test_system_info_standard():
+    info = TagInfo.from_response("000F" + UID + "0000" + "1B03" + "01")
+    assert info.uid_hex == "0807060504030201"
+    assert (info.dsfid, info.afi, info.ic_reference) == (0, 0, 1)
+    assert (info.block_count, info.block_size) == (28, 4)
+
+
+def test_system_info_extended():
+    # M24LR64E-R: 2048 blocks on two bytes
+    info = TagInfo.from_response("000F" + UID + "0000" + "FF07" + "03" + "2C", extended=True)
+    assert (info.block_count, info.block_size, info.ic_reference) == (2048, 4, 0x2C)
+    info = TagInfo.from_response("0004" + UID + "FF07" + "03", extended=True)
+    assert info.block_count == 2048
+
+
+def test_system_info_extended_ignored():
+    # ICODE SLIX ignores protocol extension flag and answers one byte count
+    info = TagInfo.from_response("000F" + UID + "0000" + "1B03" + "01", extended=True)
+    assert (info.block_count, info.block_size, info.ic_reference) == (28, 4, 1)
+    info = TagInfo.from_response("0004" + UID + "1B03", extended=True)
+    assert info.block_count == 28
+
+
+def test_system_info_truncated():
+    with pytest.raises(ValueError):
+        TagInfo.from_response("000F" + UID + "00")
+    with pytest.raises(ValueError):
+        TagInfo.from_response("000F" + UID[:8])
+
+
+def test_block_data():
+    blocks = BlockData.from_hex("0011223344556677", offset=10)
+    assert blocks.block_count == 2
+    assert bytes(blocks.block(11)) == bytes.fromhex("44556677")
+    assert [blockno for blockno, _ in blocks.blocks()] == [10, 11]
+    assert blocks.hex() == "0011223344556677"
+    with pytest.raises(IndexError):
+        blocks.block(12)
+
+
+def test_inventory_skips_garbled_answers(make_reader):
+    def respond(frame):
+        # inventory (anticollision) request
+        if frame[10:12] == '14':
+            return b"[" + UID.encode() + b",4A][01020304050607GG,4A][z][" + UID[::-1].encode() + b",XY]"
+        return b""
+    reader = make_reader(respond)
+    assert [entry.uid_hex for entry in reader.inventory_iso15693_entries()] == ["0807060504030201"]
@@ -0,0 +1,43 @@
+# -*- coding: utf-8; tab-width: 4; indent-tabs-mode: nil; c-basic-offset: 4 -*-
+# vim:fenc=utf-8:et:sw=4:ts=4:sts=4:tw=0
+
+from pydlprfid2 import TimeoutProfile
+
+
+def test_key():
+    assert TimeoutProfile.key('FF') == 'FF'
+    assert TimeoutProfile.key('18', '0223') == '18:23'
+
+
+def test_learning(tmp_path):
+    path = str(tmp_path / "timeouts.json")
+    profile = TimeoutProfile(path, margin=2, min_samples=3)
+    profile.record('18:23', 0.010)
+    profile.record('18:23', 0.020)
+    assert profile.timeout('18:23') is None
+    profile.record('18:23', 0.015)
+    assert abs(profile.timeout('18:23') - 0.030) < 1e-9
+    profile.missed('18:23')
+    assert abs(profile.timeout('18:23') - 0.060) < 1e-9
+    profile.save()
+    assert abs(TimeoutProfile(path, margin=2, min_samples=3).timeout('18:23') - 0.030) < 1e-9
+
+
+def test_bounds_and_overrides():
+    profile = TimeoutProfile(min_samples=1, max_timeout=0.5, overrides={'FE': 0.2})
+    profile.record('18:21', 10)
+    assert profile.timeout('18:21') == 0.5
+    profile.missed('18:21')
+    assert profile.timeout('18:21') == 0.5
+    assert profile.timeout('FE') == 0.2
+
+
+def test_incomplete_answer_missed(make_reader):
+    def respond(frame):
+        return b"[0011" if frame[10:12] == '18' else b""
+    reader = make_reader(respond)
+    reader.timeouts.max_timeout = 0.02
+    reader.timeouts.timeouts['18:20'] = 0.005
+    assert reader.issue_evm_command('18', '0220') == []
+    assert '18:20' not in reader.timeouts.samples
+    assert reader.timeouts.timeout('18:20') == 0.01
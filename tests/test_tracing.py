@@ -0,0 +1,62 @@
+# -*- coding: utf-8; tab-width: 4; indent-tabs-mode: nil; c-basic-offset: 4 -*-
+# vim:fenc=utf-8:et:sw=4:ts=4:sts=4:tw=0
+
+import json
+
+from pydlprfid2 import Tracer
+
+from conftest import TagMemory
+
+UID = "E0022C0000000001"
+
+
+def inside(inner, outer):
+    return (outer["ts"] <= inner["ts"] and
+            inner["ts"] + inner["dur"] <= outer["ts"] + outer["dur"])
+
+
+def test_trace_structure(make_reader, tmp_path):
+    reader = make_reader(TagMemory())
+    tracer = Tracer(process_name="test")
+    tracer.instrument(reader)
+    reader.eeprom_read_single_block(UID, 2)
+    path = tmp_path / "trace.json"
+    tracer.export(str(path))
+    trace = json.loads(path.read_text())
+    assert trace["displayTimeUnit"] == "ms"
+    metadata, *events = trace["traceEvents"]
+    assert metadata == {"name": "process_name", "ph": "M", "pid": tracer.pid,
+                        "args": {"name": "test"}}
+    assert [event["ts"] for event in events] == sorted(event["ts"] for event in events)
+    for event in events:
+        assert event["ph"] == "X"
+        assert event["dur"] >= 0
+        assert event["pid"] == tracer.pid
+    spans = {event["name"]: event for event in events}
+    assert sorted(spans) == ["eeprom_read_single_block", "issue_evm_command",
+                             "parse", "wait", "write"]
+    assert spans["eeprom_read_single_block"]["args"] == {"reader": reader.reader_id}
+    # operation > EVM command > write, wait, parse phases in this order
+    assert inside(spans["issue_evm_command"], spans["eeprom_read_single_block"])
+    for phase in ("write", "wait", "parse"):
+        assert inside(spans[phase], spans["issue_evm_command"])
+    assert spans["write"]["ts"] <= spans["wait"]["ts"] <= spans["parse"]["ts"]
+
+
+def test_uninstrument(make_reader):
+    reader = make_reader(TagMemory())
+    tracer = Tracer()
+    tracer.instrument(reader)
+    tracer.uninstrument(reader)
+    reader.eeprom_read_single_block(UID, 2)
+    assert tracer.events == []
+    assert "eeprom_read_single_block" not in vars(reader)
+
+
+def test_disabled_tracer(make_reader):
+    reader = make_reader(TagMemory())
+    tracer = Tracer()
+    tracer.instrument(reader)
+    tracer.enabled = False
+    reader.eeprom_read_single_block(UID, 2)
+    assert tracer.to_dict()["traceEvents"][1:] == []
@@ -0,0 +1,92 @@
+# -*- coding: utf-8; tab-width: 4; indent-tabs-mode: nil; c-basic-offset: 4 -*-
+# vim:fenc=utf-8:et:sw=4:ts=4:sts=4:tw=0
+
+import pytest
+
+from pydlprfid2 import StandardError
+from pydlprfid2.registry import TagRegistry
+
+from conftest import TagMemory, iso_block, iso_command
+
+UID = "E0025E167B532A87"
+
+
+@pytest.fixture
+def tag():
+    return TagMemory(fill=b"\x11\x22\x33\x44")
+
+
+def test_merge_and_skip_unchanged(make_reader, tag):
+    reader = make_reader(tag)
+    with reader.write_buffer(UID) as buf:
+        buf.write(4 * 3 + 1, b"\xAA")
+        buf.write(4 * 3 + 1, b"\xBB")       # later write wins
+        buf.write(4 * 5, b"\x01\x02\x03\x04\x05\x06")
+        buf.write(4 * 7, b"\x11\x22")       # already there
+    assert tag.blocks[3] == b"\x11\xBB\x33\x44"
+    assert tag.blocks[5] == b"\x01\x02\x03\x04"
+    assert tag.blocks[6] == b"\x05\x06\x33\x44"
+    assert sorted(tag.writes) == [3, 5, 6]
+    assert buf.written == 3
+    assert buf.pending() == []
+
+
+def test_failed_flush_resumes(make_reader, tag):
+    reader = make_reader(tag)
+    reader.retry_policy.max_attempts = 2
+    reader.retry_policy.base_delay = 0
+    tag.fail_writes.add(6)
+    buf = reader.write_buffer(UID)
+    with pytest.raises(StandardError):
+        with buf:
+            buf.write_block(5, b"ABCD")
+            buf.write_block(6, b"EFGH")
+    # block 5 is done, block 6 verify rewrite failed and stays staged
+    assert tag.blocks[5] == b"ABCD"
+    assert buf.pending() == [6]
+    tag.fail_writes.clear()
+    assert buf.flush() == 1
+    assert tag.blocks[6] == b"EFGH"
+    assert buf.pending() == []
+
+
+def test_error_in_context_keeps_staged(make_reader, tag):
+    reader = make_reader(tag)
+    buf = reader.write_buffer(UID)
+    with pytest.raises(RuntimeError):
+        with buf:
+            buf.write_block(2, b"WXYZ")
+            raise RuntimeError("interrupted")
+    assert tag.writes == []
+    assert buf.pending() == [2]
+
+
+def test_block_size_from_registry(make_reader):
+    tag = TagMemory(blocks=8, block_size=8, uid=UID)
+    reader = make_reader(tag)
+    reader.registry = TagRegistry(reader)
+    with reader.write_buffer(UID) as buf:
+        buf.write(8, b"\x01")
+    assert tag.writes == [1]
+    assert tag.blocks[1] == b"\x01" + bytes(7)
+    assert tag.blocks[2] == bytes(8)
+
+
+def test_flush_shares_retry_budget(make_reader, tag):
+    # each block write is lost once before getting through
+    lost = set()
+
+    def responder(frame):
+        if iso_command(frame) == 0x21 and iso_block(frame) not in lost:
+            lost.add(iso_block(frame))
+            return b""
+        return tag(frame)
+    reader = make_reader(responder)
+    reader.retry_policy.base_delay = 0
+    reader.retry_policy.tag_budget = 3
+    buf = reader.write_buffer(UID)
+    for blockno in range(5):
+        buf.write_block(blockno, b"ABCD")
+    with pytest.raises(StandardError):
+        buf.flush()
+    assert buf.pending() == [3, 4]
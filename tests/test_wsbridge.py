@@ -0,0 +1,152 @@
+# -*- coding: utf-8; tab-width: 4; indent-tabs-mode: nil; c-basic-offset: 4 -*-
+# vim:fenc=utf-8:et:sw=4:ts=4:sts=4:tw=0
+
+import json
+import asyncio
+
+import pytest
+
+websockets = pytest.importorskip("websockets")
+
+from pydlprfid2 import ISO15693, BlockData  # noqa: E402
+from pydlprfid2.wsbridge import WsBridge, WsClient  # noqa: E402
+
+UID = "E0025E167B532A87"
+
+
+class FakeReader(object):
+    """ Reader with one tag, blocks read from blocks dict """
+
+    def __init__(self, blocks=None):
+        self.protocol = ISO15693
+        self.blocks = blocks
+
+    def inventory_entries(self):
+        return []
+
+    def eeprom_read_range(self, uid, offset, count):
+        if self.blocks is None:
+            return None
+        return BlockData(self.blocks[offset * 4:(offset + count) * 4], offset)
+
+
+async def exchange(reader, request):
+    """ Send request to a bridge served on localhost, return its answer """
+    bridge = WsBridge(reader)
+    async with websockets.serve(bridge.handle, "localhost", 0) as server:
+        port = server.sockets[0].getsockname()[1]
+        async with websockets.connect(f"ws://localhost:{port}") as websocket:
+            hello = json.loads(await websocket.recv())
+            assert hello == {"msg": "hello", "role": "backend"}
+            await websocket.send(json.dumps(request))
+            return json.loads(await asyncio.wait_for(websocket.recv(), 5))
+
+
+def test_read_blocks():
+    reader = FakeReader(bytes(range(16)))
+    answer = asyncio.run(exchange(reader, {"msg": "read-blocks", "uid": UID,
+                                           "offset": 1, "count": 2}))
+    assert answer == {"msg": "blocks-read", "uid": UID, "offset": 1,
+                      "data": "0405060708090A0B"}
+
+
+def test_read_blocks_no_answer():
+    answer = asyncio.run(exchange(FakeReader(), {"msg": "read-blocks", "uid": UID,
+                                                 "offset": 0, "count": 2}))
+    assert answer["msg"] == "error"
+    assert UID in answer["text"]
+
+
+@pytest.mark.parametrize("uid, count", [("E004", 2), (UID, 0)])
+def test_read_blocks_bad_request(uid, count):
+    answer = asyncio.run(exchange(FakeReader(bytes(16)), {"msg": "read-blocks", "uid": uid,
+                                                          "offset": 0, "count": count}))
+    assert answer["msg"] == "error"
+
+
+def test_request_not_object():
+    answer = asyncio.run(exchange(FakeReader(), ["read-blocks"]))
+    assert answer["msg"] == "error"
+    assert "object" in answer["text"]
+
+
+class SlowSocket(object):
+    """ Websocket whose peer does not read until released """
+
+    def __init__(self):
+        self.sent = []
+        self.release = asyncio.Event()
+
+    async def send(self, data):
+        await self.release.wait()
+        self.sent.append(json.loads(data))
+
+
+def test_coalesce_burst():
+    async def run():
+        socket = SlowSocket()
+        socket.release.set()
+        client = WsClient(socket, coalesce=0.05)
+        sender = asyncio.ensure_future(client.sender())
+        for index in range(3):
+            client.push([{"event": "tag-seen", "uid": str(index)}])
+            await asyncio.sleep(0.005)
+        await asyncio.sleep(0.2)
+        sender.cancel()
+        return socket.sent
+    sent = asyncio.run(run())
+    assert len(sent) == 1
+    assert [event["uid"] for event in sent[0]["events"]] == ["0", "1", "2"]
+    assert "dropped" not in sent[0]
+
+
+def test_slow_client_drops_oldest():
+    async def run():
+        bridge = WsBridge(FakeReader(), max_pending=3, coalesce=0)
+        slow, fast = SlowSocket(), SlowSocket()
+        fast.release.set()
+        clients = [WsClient(socket, bridge.max_pending, bridge.max_batch, 0)
+                   for socket in (slow, fast)]
+        bridge.clients.update(clients)
+        senders = [asyncio.ensure_future(client.sender()) for client in clients]
+        for index in range(5):
+            bridge.publish([{"event": "tag-seen", "uid": str(index)}])
+            await asyncio.sleep(0.01)
+        # fast client got everything although slow one is stuck
+        uids = [event["uid"] for message in fast.sent for event in message["events"]]
+        assert uids == ["0", "1", "2", "3", "4"]
+        assert slow.sent == []
+        slow.release.set()
+        await asyncio.sleep(0.05)
+        for sender in senders:
+            sender.cancel()
+        return slow.sent
+    sent = asyncio.run(run())
+    # first event was being sent, 3 of the 4 next ones kept
+    uids = [event["uid"] for message in sent for event in message["events"]]
+    assert uids == ["0", "2", "3", "4"]
+    assert sent[1]["dropped"] == 1
+
+
+def test_reconnect():
+    async def run():
+        connections = []
+
+        async def server_handler(websocket):
+            connections.append(json.loads(await websocket.recv()))
+            # server goes away right after hello
+            await websocket.close()
+
+        bridge = WsBridge(FakeReader(), min_backoff=0.01, max_backoff=0.02)
+        async with websockets.serve(server_handler, "localhost", 0) as server:
+            port = server.sockets[0].getsockname()[1]
+            task = asyncio.ensure_future(bridge.connect(f"ws://localhost:{port}"))
+            for _ in range(200):
+                if len(connections) >= 3:
+                    break
+                await asyncio.sleep(0.01)
+            task.cancel()
+        return connections
+    connections = asyncio.run(run())
+    assert len(connections) >= 3
+    assert all(hello == {"msg": "hello", "role": "backend"} for hello in connections)